@@ -0,0 +1,114 @@
+"""
+Micro-batching scheduler for AI Tutor system
+Collects concurrent requests for a short window and runs them as one batch
+"""
+
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, List, Tuple
+import logging
+
+from inference_executor import InferenceExecutor
+
+logger = logging.getLogger(__name__)
+
+
+class MicroBatcher:
+    def __init__(
+        self,
+        batch_fn: Callable[[List[Any]], List[Any]],
+        executor: InferenceExecutor,
+        max_batch_size: int = 8,
+        window_ms: float = 10.0
+    ):
+        self.batch_fn = batch_fn
+        self.executor = executor
+        self.max_batch_size = max(1, max_batch_size)
+        self.window = max(0.0, window_ms) / 1000.0
+        self._pending: List[Tuple[Any, Future]] = []
+        self._condition = threading.Condition()
+        self._thread = None
+        self._closed = False
+        self._batches = 0
+        self._batched_items = 0
+
+    def submit(self, item: Any) -> Future:
+        """Queue an item for the next batch and return a future for its result"""
+        # Reserve the slot up front so a full queue fails fast instead of waiting
+        self.executor.acquire()
+        future = Future()
+        with self._condition:
+            if self._closed:
+                self.executor.release()
+                raise RuntimeError("Batch scheduler is closed")
+            self._pending.append((item, future))
+            self._ensure_thread()
+            self._condition.notify()
+        return future
+
+    def _ensure_thread(self):
+        """Start the dispatcher thread on first use"""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._dispatch_loop, name="micro-batcher", daemon=True)
+            self._thread.start()
+
+    def _dispatch_loop(self):
+        """Collect items for up to one window, then hand the batch to the executor"""
+        while True:
+            with self._condition:
+                while not self._pending and not self._closed:
+                    self._condition.wait()
+                if self._closed and not self._pending:
+                    return
+                deadline = time.monotonic() + self.window
+                while len(self._pending) < self.max_batch_size and not self._closed:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._condition.wait(remaining)
+                batch = self._pending[:self.max_batch_size]
+                del self._pending[:self.max_batch_size]
+
+            try:
+                self.executor.submit_acquired(len(batch), self._run_batch, batch)
+            except Exception as e:
+                logger.error(f"Error dispatching batch: {e}")
+                for _, future in batch:
+                    if future.set_running_or_notify_cancel():
+                        future.set_exception(e)
+
+    def _run_batch(self, batch: List[Tuple[Any, Future]]):
+        """Run one batch and deliver each result to its waiting request"""
+        # Requests that timed out while queued are dropped from the batch
+        live = [(item, future) for item, future in batch if future.set_running_or_notify_cancel()]
+        if not live:
+            return
+        self._batches += 1
+        self._batched_items += len(live)
+        try:
+            results = self.batch_fn([item for item, _ in live])
+            for (_, future), result in zip(live, results):
+                future.set_result(result)
+            for _, future in live[len(results):]:
+                future.set_exception(RuntimeError("Batch returned fewer results than requests"))
+        except Exception as e:
+            logger.error(f"Error running batch of {len(live)} items: {e}")
+            for _, future in live:
+                if not future.done():
+                    future.set_exception(e)
+
+    def stats(self):
+        """Return batching statistics for monitoring"""
+        return {
+            "batches": self._batches,
+            "average_batch_size": round(self._batched_items / self._batches, 2) if self._batches else 0.0,
+            "max_batch_size": self.max_batch_size,
+            "window_ms": self.window * 1000.0
+        }
+
+    def close(self):
+        """Flush pending items and stop the dispatcher thread"""
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+Benchmark for the vector index backends
+Reports build time, recall@5 and p50/p99 single-query latency at several corpus sizes
+
+Usage:
+    python benchmarks/ann_benchmark.py --sizes 10000 100000 1000000
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from vector_index import ExactVectorIndex, HnswVectorIndex, exact_search
+
+
+def make_corpus(size: int, dim: int, clusters: int, seed: int) -> np.ndarray:
+    """Clustered unit vectors, closer to real sentence embeddings than uniform noise"""
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((clusters, dim)).astype(np.float32)
+    corpus = np.empty((size, dim), dtype=np.float32)
+    for start in range(0, size, 100_000):
+        end = min(start + 100_000, size)
+        assignment = rng.integers(0, clusters, end - start)
+        corpus[start:end] = centers[assignment] + 0.6 * rng.standard_normal((end - start, dim)).astype(np.float32)
+    corpus /= np.linalg.norm(corpus, axis=1, keepdims=True)
+    return corpus
+
+
+def make_queries(corpus: np.ndarray, count: int, seed: int) -> np.ndarray:
+    """Perturbed corpus rows, like paraphrased questions about indexed material"""
+    rng = np.random.default_rng(seed + 1)
+    queries = corpus[rng.integers(0, corpus.shape[0], count)] + 0.3 * rng.standard_normal((count, corpus.shape[1])).astype(np.float32) / np.sqrt(corpus.shape[1])
+    return (queries / np.linalg.norm(queries, axis=1, keepdims=True)).astype(np.float32)
+
+
+def measure(index, corpus: np.ndarray, queries: np.ndarray, k: int):
+    """Run queries one at a time, as the API does, and return (rows, latencies in ms)"""
+    rows = []
+    latencies = []
+    for query in queries:
+        start = time.perf_counter()
+        result, _ = index.search(corpus, query.reshape(1, -1), k)
+        latencies.append((time.perf_counter() - start) * 1000)
+        rows.append(result[0])
+    return np.array(rows), np.array(latencies)
+
+
+def recall_at_k(found: np.ndarray, truth: np.ndarray) -> float:
+    hits = sum(len(set(f.tolist()) & set(t.tolist())) for f, t in zip(found, truth))
+    return hits / truth.size
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark exact and HNSW vector search")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--m", type=int, default=16)
+    parser.add_argument("--ef-construction", type=int, default=200)
+    parser.add_argument("--ef-search", type=int, nargs="+", default=[32, 64, 128])
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    print(f"{'size':>9} {'backend':>12} {'build s':>8} {'recall@' + str(args.k):>9} {'p50 ms':>8} {'p99 ms':>8}")
+    for size in args.sizes:
+        corpus = make_corpus(size, args.dim, clusters=max(16, size // 1000), seed=args.seed)
+        queries = make_queries(corpus, args.queries, args.seed)
+        truth, _ = exact_search(corpus, queries, args.k)
+
+        exact = ExactVectorIndex()
+        exact.add(corpus)
+        found, latencies = measure(exact, corpus, queries, args.k)
+        print(f"{size:>9} {'exact':>12} {0.0:>8.1f} {recall_at_k(found, truth):>9.3f} "
+              f"{np.percentile(latencies, 50):>8.2f} {np.percentile(latencies, 99):>8.2f}")
+
+        try:
+            hnsw = HnswVectorIndex(args.dim, m=args.m, ef_construction=args.ef_construction, exact_threshold=0)
+        except ImportError as e:
+            print(f"{size:>9} {'hnsw':>12} skipped: {e}")
+            continue
+        start = time.perf_counter()
+        hnsw.add(corpus)
+        build_seconds = time.perf_counter() - start
+        for ef_search in args.ef_search:
+            hnsw.ef_search = ef_search
+            found, latencies = measure(hnsw, corpus, queries, args.k)
+            print(f"{size:>9} {'hnsw ef=' + str(ef_search):>12} {build_seconds:>8.1f} {recall_at_k(found, truth):>9.3f} "
+                  f"{np.percentile(latencies, 50):>8.2f} {np.percentile(latencies, 99):>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
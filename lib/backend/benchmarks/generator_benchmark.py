@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""
+Benchmark for the answer generator backends
+Loads each backend in a fresh process and reports load time, memory, time to first token and tokens/sec
+
+Usage:
+    python benchmarks/generator_benchmark.py --backends stub transformers transformers:int8 llama_cpp:models/tutor.Q4_K_M.gguf
+    python benchmarks/generator_benchmark.py --backends transformers --threads 4 --cpus 0-3 --tokens 64
+"""
+
+import argparse
+import multiprocessing
+import os
+import queue
+import resource
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+CONTEXT = (
+    "Newton's second law states that the net force on an object equals its mass times its acceleration. "
+    "A larger force produces a larger acceleration, and a heavier object accelerates less under the same force. "
+    "Force is measured in newtons, where one newton accelerates one kilogram at one metre per second squared."
+)
+QUESTIONS = [
+    "What is Newton's second law?",
+    "How does mass affect acceleration?",
+    "What unit is force measured in?",
+    "Why does a heavier object accelerate less?"
+]
+
+
+def rss_mb() -> float:
+    """Current resident set size of this process on Linux, else its peak"""
+    try:
+        with open("/proc/self/status") as handle:
+            for line in handle:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return peak / (1 << 20) if sys.platform == "darwin" else peak / 1024
+
+
+def run_backend(spec: str, args, results):
+    """Load one backend and time it; runs in its own process so memory is measured per backend"""
+    from generators import Generator, create_generator, parse_cpus
+    backend, _, option = spec.partition(":")
+    options = {"model_path": option} if backend == "llama_cpp" else {"quantize": option or None}
+    options["model_name"] = args.model
+    options["reuse_cache"] = not args.no_kv_cache
+    baseline = rss_mb()
+    start = time.perf_counter()
+    generator = create_generator(backend, max_tokens=args.tokens, cpus=parse_cpus(args.cpus), threads=args.threads, **options)
+    load_seconds = time.perf_counter() - start
+    loaded = rss_mb()
+
+    class Document:
+        content = CONTEXT
+
+    prompts = [Generator.build_prompt(question, [Document()]) for question in QUESTIONS]
+    # Warm-up, so one-off allocations are not timed
+    generator.generate(prompts[0], max_tokens=4)
+    first_token, rates = [], []
+    for _ in range(args.rounds):
+        for prompt in prompts:
+            stamps = []
+            start = time.perf_counter()
+            generator.generate(prompt, on_token=lambda _: stamps.append(time.perf_counter()))
+            if stamps:
+                first_token.append(stamps[0] - start)
+                if len(stamps) > 1:
+                    rates.append((len(stamps) - 1) / (stamps[-1] - stamps[0]))
+    stats = generator.stats()
+    results.put({
+        "backend": spec,
+        "load_s": load_seconds,
+        "rss_mb": loaded - baseline,
+        "peak_mb": rss_mb() - baseline,
+        "ttft_ms": sorted(first_token)[len(first_token) // 2] * 1000 if first_token else float("nan"),
+        "tok_s": sorted(rates)[len(rates) // 2] if rates else float("nan"),
+        "reused": stats["reused_prompt_tokens"] / max(stats["prompt_tokens"], 1)
+    })
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare generator backends on CPU")
+    parser.add_argument("--backends", nargs="+", default=["stub", "transformers", "transformers:int8"],
+                        help="stub, transformers[:int8] or llama_cpp:<model.gguf>")
+    parser.add_argument("--model", default="gpt2", help="Hugging Face model for the transformers backend")
+    parser.add_argument("--tokens", type=int, default=48, help="Tokens generated per answer")
+    parser.add_argument("--rounds", type=int, default=2)
+    parser.add_argument("--threads", type=int, default=0, help="Threads per backend (0 leaves the library default)")
+    parser.add_argument("--cpus", default=None, help="Pin the benchmark process to these CPUs, e.g. 0-3")
+    parser.add_argument("--no-kv-cache", action="store_true", help="Disable key/value cache reuse between prompts")
+    args = parser.parse_args()
+
+    context = multiprocessing.get_context("spawn")
+    print(f"{'backend':<32} {'load s':>7} {'RSS MB':>8} {'peak MB':>8} {'TTFT ms':>8} {'tok/s':>7} {'reused':>7}")
+    for spec in args.backends:
+        results = context.Queue()
+        process = context.Process(target=run_backend, args=(spec, args, results))
+        process.start()
+        process.join()
+        if process.exitcode != 0:
+            print(f"{spec:<32} failed (exit code {process.exitcode})")
+            continue
+        try:
+            row = results.get(timeout=5)
+        except queue.Empty:
+            print(f"{spec:<32} failed (exit code {process.exitcode})")
+            continue
+        print(f"{row['backend']:<32} {row['load_s']:>7.1f} {row['rss_mb']:>8.0f} {row['peak_mb']:>8.0f} "
+              f"{row['ttft_ms']:>8.1f} {row['tok_s']:>7.1f} {row['reused']:>7.0%}")
+
+
+if __name__ == "__main__":
+    main()
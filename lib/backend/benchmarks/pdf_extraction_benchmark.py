@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+Benchmark for PDF page extraction
+Builds a synthetic many-page PDF and compares single-process and pooled extraction
+
+Usage:
+    python benchmarks/pdf_extraction_benchmark.py --pages 1000 --workers 2 4 8
+"""
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pdf_extraction import iter_pdf_pages
+
+WORDS = (
+    "energy force mass velocity acceleration momentum equation derivative integral function "
+    "molecule atom reaction bond electron proton cell gene protein enzyme theorem proof"
+).split()
+
+
+def write_synthetic_pdf(path: str, pages: int, lines_per_page: int, seed: int):
+    """Write a PDF of text-only pages, one Helvetica text object per line"""
+    rng = random.Random(seed)
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        None,  # page tree, filled in once the page object numbers are known
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"
+    ]
+    page_numbers = []
+    for _ in range(pages):
+        lines = []
+        for line in range(lines_per_page):
+            text = " ".join(rng.choice(WORDS) for _ in range(12)) + "."
+            lines.append(f"BT /F1 10 Tf 50 {780 - line * 14} Td ({text}) Tj ET")
+        stream = "\n".join(lines).encode("latin-1")
+        objects.append(b"<< /Length %d >>\nstream\n%s\nendstream" % (len(stream), stream))
+        content_number = len(objects)
+        objects.append(
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+            b"/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % content_number
+        )
+        page_numbers.append(len(objects))
+    kids = b" ".join(b"%d 0 R" % number for number in page_numbers)
+    objects[1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (kids, pages)
+
+    with open(path, "wb") as handle:
+        handle.write(b"%PDF-1.4\n")
+        offsets = []
+        for number, body in enumerate(objects, start=1):
+            offsets.append(handle.tell())
+            handle.write(b"%d 0 obj\n%s\nendobj\n" % (number, body))
+        xref = handle.tell()
+        handle.write(b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1))
+        for offset in offsets:
+            handle.write(b"%010d 00000 n \n" % offset)
+        handle.write(b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref))
+
+
+def measure(path: str, workers: int) -> (float, list):
+    start = time.perf_counter()
+    pages = [text for _, text in iter_pdf_pages(path, workers=workers, min_pages=0)]
+    return time.perf_counter() - start, pages
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark single-process and parallel PDF page extraction")
+    parser.add_argument("--pages", type=int, default=1000)
+    parser.add_argument("--lines-per-page", type=int, default=50)
+    parser.add_argument("--workers", type=int, nargs="+", default=[2, 4, 8])
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "synthetic.pdf")
+        write_synthetic_pdf(path, args.pages, args.lines_per_page, args.seed)
+        print(f"{args.pages} pages, {os.path.getsize(path) / (1 << 20):.1f} MB, {os.cpu_count()} CPUs")
+
+        baseline, expected = measure(path, 1)
+        print(f"{'workers':>8} {'seconds':>8} {'pages/s':>8} {'speedup':>8}")
+        print(f"{1:>8} {baseline:>8.2f} {args.pages / baseline:>8.0f} {1.0:>8.2f}")
+        for workers in args.workers:
+            seconds, pages = measure(path, workers)
+            if pages != expected:
+                raise RuntimeError(f"Parallel extraction with {workers} workers returned different text")
+            print(f"{workers:>8} {seconds:>8.2f} {args.pages / seconds:>8.0f} {baseline / seconds:>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
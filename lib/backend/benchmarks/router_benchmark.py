@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""
+Benchmark for the keyword router
+Compares a chain of substring checks with the compiled router as the topic table grows
+
+Usage:
+    python benchmarks/router_benchmark.py --topics 10 100 1000 --questions 2000
+"""
+
+import argparse
+import os
+import random
+import string
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from keyword_router import KeywordRouter
+
+
+def synthetic_topics(count: int, rng: random.Random):
+    """Topics with three made-up keywords each, one of them a two-word phrase"""
+    def word():
+        return "".join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(4, 10)))
+    return [(f"topic{i}", [word(), word(), f"{word()} {word()}"]) for i in range(count)]
+
+
+def linear_route(topics, question: str):
+    # What an if/elif chain of `"x" in question` checks does
+    for name, keywords in topics:
+        if any(keyword in question for keyword in keywords):
+            return name
+    return None
+
+
+def measure(fn, questions) -> float:
+    start = time.perf_counter()
+    for question in questions:
+        fn(question)
+    return (time.perf_counter() - start) / len(questions) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark substring chains against the compiled keyword router")
+    parser.add_argument("--topics", type=int, nargs="+", default=[10, 100, 1000])
+    parser.add_argument("--questions", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    print(f"{'topics':>8} {'build ms':>9} {'chain us':>9} {'router us':>10} {'speedup':>8}")
+    for count in args.topics:
+        topics = synthetic_topics(count, rng)
+        keywords = [keyword for _, words in topics for keyword in words]
+        # Half the questions mention a keyword, half match nothing and so scan every topic
+        questions = [
+            f"can you explain {rng.choice(keywords) if i % 2 else 'something else'} with an example please"
+            for i in range(args.questions)
+        ]
+        start = time.perf_counter()
+        router = KeywordRouter(topics)
+        build = (time.perf_counter() - start) * 1000
+        chain = measure(lambda q: linear_route(topics, q), questions)
+        routed = measure(router.route, questions)
+        print(f"{count:>8} {build:>9.1f} {chain:>9.1f} {routed:>10.1f} {chain / routed:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+Startup-time profile for the AI Tutor API
+Breaks import cost down per module with -X importtime and, optionally, times
+how long a real server takes to answer /health and to report ready
+
+Usage:
+    python benchmarks/startup_profile.py --module main --top 25
+    python benchmarks/startup_profile.py --serve --port 8765
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+from typing import Dict, List, Tuple
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def import_times(module: str) -> Tuple[float, List[Tuple[str, int, int]]]:
+    """Import module in a fresh interpreter; return wall seconds and (module, self us, cumulative us)"""
+    start = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=BACKEND_DIR,
+        capture_output=True,
+        text=True
+    )
+    elapsed = time.perf_counter() - start
+    if result.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{result.stderr[-2000:]}")
+    rows = []
+    for line in result.stderr.splitlines():
+        # "import time:      self [us] |  cumulative | imported package"
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+        rows.append((name.rstrip(), int(self_us), int(cumulative_us)))
+    return elapsed, rows
+
+
+def top_level(rows: List[Tuple[str, int, int]]) -> Dict[str, int]:
+    """Sum self time by top-level package, e.g. every torch.* module under torch"""
+    totals: Dict[str, int] = {}
+    for name, self_us, _ in rows:
+        package = name.strip().split(".")[0]
+        totals[package] = totals.get(package, 0) + self_us
+    return totals
+
+
+def wait_for(url: str, deadline: float) -> float:
+    """Poll url until it returns 200; return the time it happened or raise on timeout"""
+    while time.perf_counter() < deadline:
+        try:
+            with urllib.request.urlopen(url, timeout=1) as response:
+                if response.status == 200:
+                    return time.perf_counter()
+        except (urllib.error.URLError, ConnectionError, OSError):
+            pass
+        time.sleep(0.05)
+    raise TimeoutError(f"{url} did not answer in time")
+
+
+def serve(port: int, timeout: float):
+    """Start uvicorn and time the first liveness and readiness responses"""
+    start = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=BACKEND_DIR
+    )
+    try:
+        base = f"http://127.0.0.1:{port}"
+        live = wait_for(f"{base}/health/live", start + timeout)
+        ready = wait_for(f"{base}/health/ready", start + timeout)
+        with urllib.request.urlopen(f"{base}/health/ready", timeout=1) as response:
+            status = json.load(response)
+        print(f"first /health/live response {live - start:>8.2f}s")
+        print(f"ready                       {ready - start:>8.2f}s ({status['state']})")
+    finally:
+        process.terminate()
+        process.wait(timeout=30)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Profile API import time per module and time to liveness and readiness")
+    parser.add_argument("--module", default="main")
+    parser.add_argument("--top", type=int, default=25)
+    parser.add_argument("--serve", action="store_true", help="also start the server and time /health/live and /health/ready")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--timeout", type=float, default=300)
+    args = parser.parse_args()
+
+    elapsed, rows = import_times(args.module)
+    total_us = max((cumulative for name, _, cumulative in rows if name.strip() == args.module), default=0)
+    print(f"import {args.module}: {elapsed:.2f}s wall, {total_us / 1e6:.2f}s in imports, {len(rows)} modules")
+
+    print(f"\n{'cumulative ms':>14} {'self ms':>9}  module")
+    for name, self_us, cumulative_us in sorted(rows, key=lambda row: row[2], reverse=True)[:args.top]:
+        print(f"{cumulative_us / 1000:>14.1f} {self_us / 1000:>9.1f}  {name}")
+
+    print(f"\n{'self ms':>9}  package")
+    for package, self_us in sorted(top_level(rows).items(), key=lambda item: item[1], reverse=True)[:args.top]:
+        print(f"{self_us / 1000:>9.1f}  {package}")
+
+    if args.serve:
+        print()
+        serve(args.port, args.timeout)
+
+
+if __name__ == "__main__":
+    main()
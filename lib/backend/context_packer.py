@@ -0,0 +1,151 @@
+"""
+Prompt context packing for AI Tutor system
+Fits retrieved chunks into a token budget, most relevant sentences first, without repeating content
+"""
+
+import copy
+import re
+import threading
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+import logging
+
+logger = logging.getLogger(__name__)
+
+SENTENCE = re.compile(r"[^.!?\n]+(?:[.!?]+|\n|$)")
+WORD = re.compile(r"\w+")
+MAX_SENTENCE_WORDS = 60
+STOPWORDS = frozenset(
+    "a an and are as at be by can do does for from has have how i in is it its of on or "
+    "that the their this to was were what when where which who why will with".split()
+)
+
+
+def load_tokenizer(model_name: str) -> Optional[Callable[[List[str]], List[int]]]:
+    """Token counter for a Hugging Face model, or None if transformers cannot load it"""
+    try:
+        from transformers import AutoTokenizer
+        tokenizer = AutoTokenizer.from_pretrained(model_name)
+    except Exception as e:
+        logger.error(f"Error loading tokenizer {model_name}, estimating token counts instead: {e}")
+        return None
+
+    def count(texts: List[str]) -> List[int]:
+        return [len(ids) for ids in tokenizer(texts, add_special_tokens=False)["input_ids"]]
+
+    return count
+
+
+def estimate_tokens(texts: List[str]) -> List[int]:
+    # Byte-pair tokenizers average about four characters of English per token
+    return [max(1, len(text) // 4) for text in texts]
+
+
+class ContextPacker:
+    """
+    Builds the documents passed to the prompt from the retrieved ones. Chunks are
+    split into sentences, which are ranked by the question words they contain and
+    by their chunk's retrieval rank. A sentence that repeats one already chosen
+    (same words, or word overlap at least redundancy_threshold) is dropped.
+    Sentences are taken in that order while they fit budget_tokens, then put back
+    in their original order within each chunk.
+    """
+
+    def __init__(
+        self,
+        budget_tokens: int = 384,
+        count_tokens: Optional[Callable[[List[str]], List[int]]] = None,
+        redundancy_threshold: float = 0.8
+    ):
+        self.budget_tokens = budget_tokens
+        self.count_tokens = count_tokens or estimate_tokens
+        self.redundancy_threshold = redundancy_threshold
+        self._lock = threading.Lock()
+        self._counters = {"calls": 0, "tokens_in": 0, "tokens_out": 0, "redundant_sentences": 0, "dropped_sentences": 0}
+
+    @staticmethod
+    def _words(text: str) -> Set[str]:
+        return {word for word in WORD.findall(text.lower()) if word not in STOPWORDS}
+
+    def pack(self, question: str, documents: List[Any]) -> List[Any]:
+        """Documents trimmed to the sentences that fit the budget, in retrieval order"""
+        if not documents:
+            return documents
+        question_words = self._words(question)
+        # (document position, sentence position, text)
+        sentences: List[Tuple[int, int, str]] = []
+        for doc_position, document in enumerate(documents):
+            content = getattr(document, "content", None)
+            if not isinstance(content, str):
+                continue
+            for match in SENTENCE.finditer(content):
+                # Text without punctuation, common in PDF extracts, is cut into word runs instead
+                pieces = match.group(0).split()
+                for start in range(0, len(pieces), MAX_SENTENCE_WORDS):
+                    sentences.append((doc_position, len(sentences), " ".join(pieces[start:start + MAX_SENTENCE_WORDS])))
+        if not sentences:
+            return documents
+        tokens = self.count_tokens([text for _, _, text in sentences])
+        words = [self._words(text) for _, _, text in sentences]
+
+        def relevance(index: int) -> Tuple[float, int]:
+            doc_position = sentences[index][0]
+            overlap = len(words[index] & question_words) / (len(question_words) or 1)
+            return (-(overlap + 1.0 / (doc_position + 1)), index)
+
+        chosen: List[int] = []
+        chosen_words: List[Set[str]] = []
+        seen: Set[frozenset] = set()
+        used = 0
+        redundant = 0
+        dropped = 0
+        for index in sorted(range(len(sentences)), key=relevance):
+            key = frozenset(words[index])
+            if key and (key in seen or any(self._overlap(words[index], other) >= self.redundancy_threshold for other in chosen_words)):
+                redundant += 1
+                continue
+            if used + tokens[index] > self.budget_tokens:
+                # A shorter sentence further down may still fit
+                dropped += 1
+                continue
+            seen.add(key)
+            chosen.append(index)
+            chosen_words.append(words[index])
+            used += tokens[index]
+
+        by_document: Dict[int, List[int]] = {}
+        for index in sorted(chosen):
+            by_document.setdefault(sentences[index][0], []).append(index)
+        packed = []
+        for doc_position in sorted(by_document):
+            document = copy.copy(documents[doc_position])
+            document.content = " ".join(sentences[index][2] for index in by_document[doc_position])
+            packed.append(document)
+
+        with self._lock:
+            self._counters["calls"] += 1
+            self._counters["tokens_in"] += sum(tokens)
+            self._counters["tokens_out"] += used
+            self._counters["redundant_sentences"] += redundant
+            self._counters["dropped_sentences"] += dropped
+        return packed
+
+    def pack_batch(self, questions: List[str], document_lists: List[List[Any]]) -> List[List[Any]]:
+        return [self.pack(question, documents) for question, documents in zip(questions, document_lists)]
+
+    @staticmethod
+    def _overlap(words: Set[str], other: Set[str]) -> float:
+        # Share of the smaller sentence's words found in the other one; very short
+        # sentences only count as repeats when their words match exactly
+        if min(len(words), len(other)) < 3:
+            return 0.0
+        return len(words & other) / min(len(words), len(other))
+
+    def stats(self) -> Dict[str, Any]:
+        """Return packing counters for monitoring"""
+        with self._lock:
+            calls = self._counters["calls"]
+            return dict(
+                self._counters,
+                budget_tokens=self.budget_tokens,
+                avg_tokens_out=round(self._counters["tokens_out"] / calls, 1) if calls else None
+            )
@@ -0,0 +1,234 @@
+"""
+Conversation sessions for AI Tutor chat
+Keeps each conversation's recent turns within a token budget and folds older turns into a running summary
+"""
+
+import os
+import re
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+from dataclasses import dataclass, field
+from typing import Any, Deque, Dict, List, Optional, Tuple
+import logging
+
+logger = logging.getLogger(__name__)
+
+TOKEN = re.compile(r"\w+|[^\w\s]")
+SENTENCE_END = re.compile(r"(?<=[.!?])\s+|\n+")
+
+
+def count_tokens(text: str) -> int:
+    """Approximate token count: words and punctuation marks"""
+    return len(TOKEN.findall(text))
+
+
+def _message_key(is_user: bool, text: str) -> Tuple[bool, str]:
+    # Clients stamp messages with their own times, so a turn is identified by speaker and text
+    return is_user, text.strip()
+
+
+def _parse_message(message: Any) -> Optional[Tuple[bool, str]]:
+    """Accept {"text", "isUser"} from the Flutter app and {"role", "content"} chat messages"""
+    if not isinstance(message, dict):
+        return None
+    text = message.get("text", message.get("content"))
+    if not isinstance(text, str) or not text.strip():
+        return None
+    if "isUser" in message:
+        return bool(message["isUser"]), text
+    return message.get("role", "user") == "user", text
+
+
+@dataclass
+class Turn:
+    is_user: bool
+    text: str
+    tokens: int
+
+
+@dataclass
+class ConversationSession:
+    id: str
+    window: Deque[Turn] = field(default_factory=deque)
+    window_tokens: int = 0
+    # One line per summarized turn, oldest first
+    summary: Deque[Turn] = field(default_factory=deque)
+    summary_tokens: int = 0
+    turns: int = 0
+    last_key: Optional[Tuple[bool, str]] = None
+    last_active: float = field(default_factory=time.monotonic)
+
+    @property
+    def tokens(self) -> int:
+        return self.window_tokens + self.summary_tokens
+
+    def summary_text(self) -> str:
+        return "\n".join(line.text for line in self.summary)
+
+    def context(self) -> Dict[str, Any]:
+        """Summary of older turns plus the recent window, ready to feed into generation"""
+        return {
+            "summary": self.summary_text(),
+            "messages": [{"role": "user" if turn.is_user else "assistant", "content": turn.text} for turn in self.window]
+        }
+
+
+class SessionStore:
+    """
+    Conversation state kept on the server, so each request only has to carry
+    the messages the server has not seen yet. Recent turns stay verbatim up to
+    window_tokens. Older turns are folded into the summary one at a time as they
+    leave the window, so each turn is summarized once. The summary keeps its
+    newest lines within summary_tokens.
+
+    Sessions idle for longer than idle_ttl are dropped. When there are more than
+    max_sessions sessions, or together they hold more than max_tokens, the least
+    recently used sessions are evicted first.
+    """
+
+    def __init__(
+        self,
+        window_tokens: int = 1024,
+        summary_tokens: int = 256,
+        summary_line_tokens: int = 40,
+        max_sessions: int = 1000,
+        max_tokens: int = 2_000_000,
+        idle_ttl: float = 1800.0
+    ):
+        self.window_tokens = window_tokens
+        self.summary_tokens = summary_tokens
+        self.summary_line_tokens = summary_line_tokens
+        self.max_sessions = max_sessions
+        self.max_tokens = max_tokens
+        self.idle_ttl = idle_ttl
+        self._lock = threading.Lock()
+        # Least recently used first
+        self._sessions: "OrderedDict[str, ConversationSession]" = OrderedDict()
+        self._tokens = 0
+        self.evicted = 0
+
+    def session_id(self, conversation_id: Optional[str]) -> str:
+        """
+        The given conversation id, else a new random one for the client to send
+        back. Ids are never derived from message text, since many students open
+        with the same greeting and must not share a session.
+        """
+        if conversation_id:
+            return str(conversation_id)
+        return uuid.uuid4().hex
+
+    def record(self, conversation_id: str, messages: List[Any], user_message: Optional[str] = None) -> ConversationSession:
+        """
+        Add the messages the session has not seen yet. messages may be the full
+        history or only the new turns; anything up to the last turn the session
+        already has is skipped. user_message is added unless it is already the
+        last turn.
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._expire(now)
+            session = self._sessions.get(conversation_id)
+            if session is None:
+                session = ConversationSession(id=conversation_id)
+                self._sessions[conversation_id] = session
+            else:
+                self._sessions.move_to_end(conversation_id)
+            session.last_active = now
+
+            parsed = [message for message in map(_parse_message, messages or []) if message is not None]
+            start = 0
+            if session.last_key is not None:
+                # Scan back from the end, so a full resend costs one comparison per new message
+                for position in range(len(parsed) - 1, -1, -1):
+                    if _message_key(*parsed[position]) == session.last_key:
+                        start = position + 1
+                        break
+            for is_user, text in parsed[start:]:
+                self._append(session, is_user, text)
+            if user_message and user_message.strip() and session.last_key != _message_key(True, user_message):
+                self._append(session, True, user_message)
+            self._evict()
+            return session
+
+    def add_reply(self, conversation_id: str, text: str):
+        """Record the tutor's answer as the latest turn"""
+        with self._lock:
+            session = self._sessions.get(conversation_id)
+            if session is not None:
+                self._append(session, False, text)
+                self._evict()
+
+    def get(self, conversation_id: str) -> Optional[ConversationSession]:
+        with self._lock:
+            return self._sessions.get(conversation_id)
+
+    def _append(self, session: ConversationSession, is_user: bool, text: str):
+        turn = Turn(is_user=is_user, text=text, tokens=count_tokens(text))
+        session.window.append(turn)
+        session.window_tokens += turn.tokens
+        self._tokens += turn.tokens
+        session.turns += 1
+        session.last_key = _message_key(is_user, text)
+        # Keep at least the newest turn verbatim, however long it is
+        while session.window_tokens > self.window_tokens and len(session.window) > 1:
+            self._summarize(session, session.window.popleft())
+
+    def _summarize(self, session: ConversationSession, turn: Turn):
+        """Fold one turn leaving the window into the summary"""
+        session.window_tokens -= turn.tokens
+        self._tokens -= turn.tokens
+        # Extractive: the turn's first sentence, capped at summary_line_tokens
+        first = SENTENCE_END.split(turn.text.strip(), 1)[0]
+        words = first.split()
+        if count_tokens(first) > self.summary_line_tokens:
+            words = words[:self.summary_line_tokens // 2]
+            first = " ".join(words) + " ..."
+        text = f"{'Student' if turn.is_user else 'Tutor'}: {first}"
+        line = Turn(is_user=turn.is_user, text=text, tokens=count_tokens(text))
+        session.summary.append(line)
+        session.summary_tokens += line.tokens
+        self._tokens += line.tokens
+        while session.summary_tokens > self.summary_tokens and len(session.summary) > 1:
+            dropped = session.summary.popleft()
+            session.summary_tokens -= dropped.tokens
+            self._tokens -= dropped.tokens
+
+    def _expire(self, now: float):
+        while self._sessions:
+            oldest = next(iter(self._sessions.values()))
+            if now - oldest.last_active < self.idle_ttl:
+                break
+            self._drop(oldest.id)
+
+    def _evict(self):
+        # The most recently used session is never evicted by its own request
+        while len(self._sessions) > 1 and (len(self._sessions) > self.max_sessions or self._tokens > self.max_tokens):
+            self._drop(next(iter(self._sessions)))
+
+    def _drop(self, conversation_id: str):
+        session = self._sessions.pop(conversation_id)
+        self._tokens -= session.tokens
+        self.evicted += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """Return session store statistics for monitoring"""
+        with self._lock:
+            self._expire(time.monotonic())
+            return {
+                "sessions": len(self._sessions),
+                "tokens": self._tokens,
+                "max_tokens": self.max_tokens,
+                "evicted": self.evicted
+            }
+
+
+# Global session store instance
+session_store = SessionStore(
+    window_tokens=int(os.getenv("EDUCHAT_SESSION_WINDOW_TOKENS", "1024")),
+    summary_tokens=int(os.getenv("EDUCHAT_SESSION_SUMMARY_TOKENS", "256")),
+    max_sessions=int(os.getenv("EDUCHAT_SESSION_MAX", "1000")),
+    max_tokens=int(os.getenv("EDUCHAT_SESSION_MAX_TOKENS", "2000000")),
+    idle_ttl=float(os.getenv("EDUCHAT_SESSION_TTL", "1800"))
+)
@@ -0,0 +1,332 @@
+"""
+Content hashing and deduplication for AI Tutor system
+Fingerprints files and chunks so re-ingestion skips unchanged files and near-duplicate chunks
+"""
+
+import contextlib
+import hashlib
+import json
+import os
+import threading
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set, Tuple
+import logging
+
+import numpy as np
+
+from sparse_index import tokenize
+
+logger = logging.getLogger(__name__)
+
+FINGERPRINT_BITS = 64
+SHINGLE_SIZE = 3
+# Chunks shorter than this many tokens are too small for a meaningful fingerprint
+MIN_FINGERPRINT_TOKENS = 16
+_BIT_POSITIONS = np.arange(FINGERPRINT_BITS, dtype=np.uint64)
+
+
+def file_hash(file_path: str, block_size: int = 1 << 20) -> str:
+    """SHA-256 of a file's bytes, read in blocks"""
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as handle:
+        for block in iter(lambda: handle.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def source_key(subject: Optional[str], name: str) -> str:
+    """Identity of an ingested file: the same name under the same subject is the same source"""
+    return f"{(subject or 'general').strip().lower()}/{name}"
+
+
+def simhash(text: str) -> Optional[int]:
+    """64-bit SimHash over word shingles, or None when the text is too short to fingerprint"""
+    tokens = tokenize(text)
+    if len(tokens) < MIN_FINGERPRINT_TOKENS:
+        return None
+    shingles = {" ".join(tokens[i:i + SHINGLE_SIZE]) for i in range(len(tokens) - SHINGLE_SIZE + 1)}
+    hashes = np.fromiter(
+        (int.from_bytes(hashlib.blake2b(s.encode("utf-8"), digest_size=8).digest(), "little") for s in shingles),
+        dtype=np.uint64,
+        count=len(shingles)
+    )
+    # Each bit of the fingerprint is the majority vote of that bit across shingle hashes
+    votes = ((hashes[:, None] >> _BIT_POSITIONS) & np.uint64(1)).sum(axis=0)
+    fingerprint = 0
+    for bit in np.flatnonzero(votes * 2 > len(hashes)):
+        fingerprint |= 1 << int(bit)
+    return fingerprint
+
+
+class SimHashIndex:
+    """
+    Finds stored fingerprints within max_distance bits of a query. Fingerprints are
+    split into max_distance + 1 bands; two fingerprints that close must agree
+    exactly on at least one band, so only that band's bucket is compared.
+    """
+
+    def __init__(self, max_distance: int = 6):
+        self.max_distance = max_distance
+        self._bands = max_distance + 1
+        self._band_bits = FINGERPRINT_BITS // self._bands
+        self._buckets: List[Dict[int, Set[str]]] = [{} for _ in range(self._bands)]
+        self._fingerprints: Dict[str, int] = {}
+
+    def __len__(self) -> int:
+        return len(self._fingerprints)
+
+    def _band_keys(self, fingerprint: int) -> Iterable[Tuple[int, int]]:
+        mask = (1 << self._band_bits) - 1
+        for band in range(self._bands):
+            yield band, (fingerprint >> (band * self._band_bits)) & mask
+
+    def add(self, doc_id: str, fingerprint: int):
+        self._fingerprints[doc_id] = fingerprint
+        for band, key in self._band_keys(fingerprint):
+            self._buckets[band].setdefault(key, set()).add(doc_id)
+
+    def remove(self, doc_id: str):
+        fingerprint = self._fingerprints.pop(doc_id, None)
+        if fingerprint is None:
+            return
+        for band, key in self._band_keys(fingerprint):
+            bucket = self._buckets[band].get(key)
+            if bucket is not None:
+                bucket.discard(doc_id)
+                if not bucket:
+                    del self._buckets[band][key]
+
+    def get(self, doc_id: str) -> Optional[int]:
+        return self._fingerprints.get(doc_id)
+
+    def find(self, fingerprint: int) -> Optional[str]:
+        """Return the id of a stored near-duplicate, if any"""
+        for band, key in self._band_keys(fingerprint):
+            for doc_id in self._buckets[band].get(key, ()):
+                if bin(self._fingerprints[doc_id] ^ fingerprint).count("1") <= self.max_distance:
+                    return doc_id
+        return None
+
+
+@dataclass
+class SyncPlan:
+    """What has to change in the store to hold the latest version of one source file"""
+    source: str
+    file_hash: str
+    new_documents: List[Any] = field(default_factory=list)
+    chunk_ids: List[str] = field(default_factory=list)
+    fingerprints: Dict[str, Optional[int]] = field(default_factory=dict)
+    reused: int = 0
+    near_duplicates: int = 0
+
+
+class ContentDeduplicator:
+    """
+    Tracks which chunks each ingested source file contributed, in an append-only
+    manifest next to the document store. A source whose file hash is unchanged is
+    skipped before parsing; a changed source only writes chunks the store does not
+    hold yet, and chunks no source references any more are returned for deletion.
+    Chunk ids are Haystack's content hashes, so identical chunks share one id.
+
+    Several processes share the manifest. Only a caller holding write_lock (the
+    document store's lock) may truncate or rewrite it; other reads skip an
+    incomplete last line, which may be another process's append in progress.
+    """
+
+    def __init__(self, manifest_path: str, max_distance: int = 6, write_lock=None):
+        self.manifest_path = manifest_path
+        self.max_distance = max_distance
+        self.write_lock = write_lock if write_lock is not None else contextlib.nullcontext()
+        self._lock = threading.Lock()
+        self._reset()
+        with self.write_lock:
+            self._load(repair=True)
+
+    def _reset(self):
+        # A negative distance turns near-duplicate detection off
+        self.near_duplicates = SimHashIndex(self.max_distance) if self.max_distance >= 0 else None
+        self._sources: Dict[str, Dict[str, Any]] = {}
+        self._references: Dict[str, int] = {}
+        # Chunks that were in the store before any source claimed them, such as sample content
+        self._external: Set[str] = set()
+        # Manifest size after our last read or write, to notice appends by other processes
+        self._size = 0
+        # Bytes of complete records in it; anything past this is an incomplete tail
+        self._valid_size = 0
+
+    def refresh(self, repair: bool = False) -> bool:
+        """
+        Reload the manifest if another process changed it; returns True if it did.
+        Pass repair=True only while holding write_lock.
+        """
+        with self._lock:
+            size = os.path.getsize(self.manifest_path) if os.path.exists(self.manifest_path) else 0
+            if size == self._size and not (repair and self._size > self._valid_size):
+                return False
+            self._reset()
+            self._load(repair)
+            return True
+
+    def _load(self, repair: bool = False):
+        if not os.path.exists(self.manifest_path):
+            return
+        records = 0
+        offset = 0
+        with open(self.manifest_path, "rb") as log:
+            for line in log:
+                if not line.endswith(b"\n"):
+                    break
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    break
+                records += 1
+                offset += len(line)
+                if "external" in record:
+                    self._external.update(record["external"])
+                else:
+                    self._sources[record["source"]] = record
+        for record in self._sources.values():
+            for doc_id, fingerprint in record["chunks"]:
+                self._references[doc_id] = self._references.get(doc_id, 0) + 1
+                if fingerprint is not None and self.near_duplicates is not None:
+                    self.near_duplicates.add(doc_id, int(fingerprint, 16))
+        self._size = os.path.getsize(self.manifest_path)
+        self._valid_size = offset
+        if repair:
+            if self._size > offset:
+                logger.warning(f"Truncating incomplete tail of {self.manifest_path}")
+                with open(self.manifest_path, "r+b") as handle:
+                    handle.truncate(offset)
+            # Superseded records only slow down the next open, so drop them once they dominate the log
+            if records > 2 * (len(self._sources) + 1):
+                self._rewrite()
+            self._size = self._valid_size = os.path.getsize(self.manifest_path)
+        logger.info(f"Loaded ingestion manifest with {len(self._sources)} sources and {len(self._references)} chunks")
+
+    def _rewrite(self):
+        temp_path = f"{self.manifest_path}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as handle:
+            if self._external:
+                handle.write(json.dumps({"external": sorted(self._external)}) + "\n")
+            for record in self._sources.values():
+                handle.write(json.dumps(record) + "\n")
+            handle.flush()
+            os.fsync(handle.fileno())
+        os.replace(temp_path, self.manifest_path)
+
+    def known_hash(self, source: str) -> Optional[str]:
+        """File hash recorded the last time the source was ingested"""
+        record = self._sources.get(source)
+        return record["file_hash"] if record else None
+
+    def is_unchanged(self, source: str, file_hash: str) -> bool:
+        return self.known_hash(source) == file_hash
+
+    def plan(self, files: List[Tuple[str, str, List[Any]]], has_document: Callable[[str], bool]) -> List[SyncPlan]:
+        """
+        Decide which chunks of each (source, file_hash, documents) still need
+        embedding. Chunks already stored are reused by id, and near-duplicates of
+        other sources' chunks or earlier chunks in the same call map to the
+        existing chunk.
+        """
+        plans = []
+        pending = SimHashIndex(self.near_duplicates.max_distance) if self.near_duplicates is not None else None
+        pending_ids: Set[str] = set()
+        with self._lock:
+            for source, digest, documents in files:
+                plan = SyncPlan(source=source, file_hash=digest)
+                previous = self._sources.get(source)
+                previous_ids = {doc_id for doc_id, _ in previous["chunks"]} if previous else set()
+                for doc in documents:
+                    if doc.id in plan.fingerprints:
+                        continue
+                    if doc.id in pending_ids or doc.id in self._references or has_document(doc.id):
+                        plan.chunk_ids.append(doc.id)
+                        plan.fingerprints[doc.id] = self._fingerprint_of(doc.id, pending)
+                        plan.reused += 1
+                        continue
+                    fingerprint = simhash(doc.content) if pending is not None else None
+                    if fingerprint is not None:
+                        match = self.near_duplicates.find(fingerprint) or pending.find(fingerprint)
+                        # An edited chunk replaces its own earlier version rather than collapsing into it
+                        if match is not None and match not in previous_ids:
+                            if match not in plan.fingerprints:
+                                plan.chunk_ids.append(match)
+                                plan.fingerprints[match] = self._fingerprint_of(match, pending)
+                            plan.near_duplicates += 1
+                            continue
+                        pending.add(doc.id, fingerprint)
+                    pending_ids.add(doc.id)
+                    plan.new_documents.append(doc)
+                    plan.chunk_ids.append(doc.id)
+                    plan.fingerprints[doc.id] = fingerprint
+                plans.append(plan)
+        return plans
+
+    def _fingerprint_of(self, doc_id: str, pending: Optional[SimHashIndex]) -> Optional[int]:
+        if self.near_duplicates is None:
+            return None
+        fingerprint = self.near_duplicates.get(doc_id)
+        return fingerprint if fingerprint is not None else pending.get(doc_id)
+
+    def commit(self, plans: List[SyncPlan]) -> List[str]:
+        """
+        Record written plans and return chunk ids that no source references any more.
+        Call while holding write_lock, after refresh(repair=True).
+        """
+        with self._lock:
+            released: Set[str] = set()
+            external = []
+            lines = []
+            for plan in plans:
+                record = {
+                    "source": plan.source,
+                    "file_hash": plan.file_hash,
+                    "chunks": [
+                        [doc_id, format(plan.fingerprints[doc_id], "x") if plan.fingerprints.get(doc_id) is not None else None]
+                        for doc_id in plan.chunk_ids
+                    ]
+                }
+                new_ids = {doc.id for doc in plan.new_documents}
+                for doc_id in plan.chunk_ids:
+                    if doc_id not in self._references and doc_id not in new_ids and doc_id not in self._external:
+                        # Reused from the store without any source owning it, so it is never ours to delete
+                        self._external.add(doc_id)
+                        external.append(doc_id)
+                    self._references[doc_id] = self._references.get(doc_id, 0) + 1
+                    fingerprint = plan.fingerprints.get(doc_id)
+                    if fingerprint is not None and self.near_duplicates is not None and self.near_duplicates.get(doc_id) is None:
+                        self.near_duplicates.add(doc_id, fingerprint)
+                previous = self._sources.get(plan.source)
+                if previous is not None:
+                    for doc_id, _ in previous["chunks"]:
+                        self._references[doc_id] -= 1
+                        if self._references[doc_id] == 0:
+                            released.add(doc_id)
+                self._sources[plan.source] = record
+                lines.append(json.dumps(record) + "\n")
+            if external:
+                lines.insert(0, json.dumps({"external": external}) + "\n")
+
+            stale = [doc_id for doc_id in released if self._references.get(doc_id) == 0 and doc_id not in self._external]
+            for doc_id in released:
+                if self._references.get(doc_id) == 0:
+                    del self._references[doc_id]
+                    if self.near_duplicates is not None:
+                        self.near_duplicates.remove(doc_id)
+            with open(self.manifest_path, "a", encoding="utf-8") as handle:
+                handle.write("".join(lines))
+                handle.flush()
+                os.fsync(handle.fileno())
+            self._size = self._valid_size = os.path.getsize(self.manifest_path)
+            return stale
+
+    def stats(self) -> Dict[str, Any]:
+        """Return manifest statistics for monitoring"""
+        with self._lock:
+            return {
+                "sources": len(self._sources),
+                "chunks": len(self._references),
+                "fingerprints": len(self.near_duplicates) if self.near_duplicates is not None else 0
+            }
@@ -3,32 +3,60 @@ Document processing service for AI Tutor system
 Handles various file formats and prepares documents for Haystack
 """
 
+from __future__ import annotations
+
 import os
-from typing import List, Dict, Any
-from haystack.schema import Document
-from haystack.nodes import PreProcessor
+from typing import TYPE_CHECKING, List, Dict, Any, Generator, Optional
 import logging
 
-# Document processing imports
-try:
-    from docx import Document as DocxDocument
-    from PyPDF2 import PdfReader
-    from pptx import Presentation
-except ImportError:
-    logging.warning("Some document processing libraries not available")
+import dedup
+from pdf_extraction import iter_pdf_pages
+from text_splitter import StreamingSplitter
+
+# Haystack and the format libraries are imported on first use so importing this module stays cheap
+if TYPE_CHECKING:
+    from haystack.schema import Document
 
 logger = logging.getLogger(__name__)
 
+
+def _document(content: str, meta: Dict[str, Any]) -> Document:
+    from haystack.schema import Document
+    return Document(content=content, meta=meta)
+
+SUPPORTED_EXTENSIONS = ('.txt', '.pdf', '.docx', '.pptx')
+
 class DocumentProcessor:
     def __init__(self):
-        self.preprocessor = PreProcessor(
-            clean_empty_lines=True,
-            clean_whitespace=True,
-            clean_header_footer=True,
-            split_by="word",
-            split_length=200,
-            split_overlap=20
-        )
+        self._preprocessor = None
+        # Page, paragraph and slide based formats are split as they are read instead of as one string
+        self.splitter = StreamingSplitter(split_length=200, split_overlap=20)
+    
+    @property
+    def preprocessor(self):
+        """Haystack PreProcessor for plain text, created on first use"""
+        if self._preprocessor is None:
+            from haystack.nodes import PreProcessor
+            self._preprocessor = PreProcessor(
+                clean_empty_lines=True,
+                clean_whitespace=True,
+                clean_header_footer=True,
+                split_by="word",
+                split_length=200,
+                split_overlap=20
+            )
+        return self._preprocessor
+    
+    def _split_units(self, units, meta: Dict[str, Any], unit_name: str) -> List[Document]:
+        """Split (number, text) units into chunks, recording the units each chunk spans"""
+        documents = []
+        for content, first, last in self.splitter.split(units):
+            chunk_meta = dict(meta)
+            chunk_meta[unit_name] = first
+            if last != first:
+                chunk_meta[f"{unit_name}_end"] = last
+            documents.append(_document(content, chunk_meta))
+        return documents
     
     def process_text_file(self, file_path: str, subject: str = "General") -> List[Document]:
         """Process a text file and return Haystack documents"""
@@ -37,7 +65,7 @@ class DocumentProcessor:
                 content = file.read()
             
             # Create document with metadata
-            doc = Document(
+            doc = _document(
                 content=content,
                 meta={
                     "source": file_path,
@@ -58,27 +86,18 @@ class DocumentProcessor:
     def process_pdf_file(self, file_path: str, subject: str = "General") -> List[Document]:
         """Process a PDF file and return Haystack documents"""
         try:
+            from PyPDF2 import PdfReader
             reader = PdfReader(file_path)
-            content = ""
-            
-            for page in reader.pages:
-                content += page.extract_text() + "\n"
-            
-            # Create document with metadata
-            doc = Document(
-                content=content,
-                meta={
-                    "source": file_path,
-                    "subject": subject,
-                    "type": "pdf",
-                    "filename": os.path.basename(file_path),
-                    "pages": len(reader.pages)
-                }
-            )
             
-            # Preprocess the document
-            processed_docs = self.preprocessor.process([doc])
-            return processed_docs
+            # Pages are extracted lazily, on a process pool for large PDFs, and go straight into the splitter
+            pages = iter_pdf_pages(file_path, reader)
+            return self._split_units(pages, {
+                "source": file_path,
+                "subject": subject,
+                "type": "pdf",
+                "filename": os.path.basename(file_path),
+                "pages": len(reader.pages)
+            }, "page")
             
         except Exception as e:
             logger.error(f"Error processing PDF file {file_path}: {e}")
@@ -87,26 +106,16 @@ class DocumentProcessor:
     def process_docx_file(self, file_path: str, subject: str = "General") -> List[Document]:
         """Process a Word document and return Haystack documents"""
         try:
+            from docx import Document as DocxDocument
             doc = DocxDocument(file_path)
-            content = ""
             
-            for paragraph in doc.paragraphs:
-                content += paragraph.text + "\n"
-            
-            # Create document with metadata
-            haystack_doc = Document(
-                content=content,
-                meta={
-                    "source": file_path,
-                    "subject": subject,
-                    "type": "docx",
-                    "filename": os.path.basename(file_path)
-                }
-            )
-            
-            # Preprocess the document
-            processed_docs = self.preprocessor.process([haystack_doc])
-            return processed_docs
+            paragraphs = ((number, paragraph.text) for number, paragraph in enumerate(doc.paragraphs, start=1))
+            return self._split_units(paragraphs, {
+                "source": file_path,
+                "subject": subject,
+                "type": "docx",
+                "filename": os.path.basename(file_path)
+            }, "paragraph")
             
         except Exception as e:
             logger.error(f"Error processing DOCX file {file_path}: {e}")
@@ -115,61 +124,59 @@ class DocumentProcessor:
     def process_pptx_file(self, file_path: str, subject: str = "General") -> List[Document]:
         """Process a PowerPoint presentation and return Haystack documents"""
         try:
+            from pptx import Presentation
             prs = Presentation(file_path)
-            content = ""
-            
-            for slide in prs.slides:
-                for shape in slide.shapes:
-                    if hasattr(shape, "text"):
-                        content += shape.text + "\n"
             
-            # Create document with metadata
-            doc = Document(
-                content=content,
-                meta={
-                    "source": file_path,
-                    "subject": subject,
-                    "type": "pptx",
-                    "filename": os.path.basename(file_path),
-                    "slides": len(prs.slides)
-                }
+            slides = (
+                (number, "\n".join(shape.text for shape in slide.shapes if hasattr(shape, "text")))
+                for number, slide in enumerate(prs.slides, start=1)
             )
-            
-            # Preprocess the document
-            processed_docs = self.preprocessor.process([doc])
-            return processed_docs
+            return self._split_units(slides, {
+                "source": file_path,
+                "subject": subject,
+                "type": "pptx",
+                "filename": os.path.basename(file_path),
+                "slides": len(prs.slides)
+            }, "slide")
             
         except Exception as e:
             logger.error(f"Error processing PPTX file {file_path}: {e}")
             return []
     
-    def process_file(self, file_path: str, subject: str = "General") -> List[Document]:
+    def process_file(self, file_path: str, subject: str = "General", file_hash: Optional[str] = None) -> List[Document]:
         """Process any supported file type"""
         file_extension = os.path.splitext(file_path)[1].lower()
         
         if file_extension == '.txt':
-            return self.process_text_file(file_path, subject)
+            documents = self.process_text_file(file_path, subject)
         elif file_extension == '.pdf':
-            return self.process_pdf_file(file_path, subject)
+            documents = self.process_pdf_file(file_path, subject)
         elif file_extension == '.docx':
-            return self.process_docx_file(file_path, subject)
+            documents = self.process_docx_file(file_path, subject)
         elif file_extension == '.pptx':
-            return self.process_pptx_file(file_path, subject)
+            documents = self.process_pptx_file(file_path, subject)
         else:
             logger.warning(f"Unsupported file type: {file_extension}")
             return []
+        
+        # Chunk ids are already content hashes; the file hash ties each chunk to the file version it came from
+        if documents:
+            file_hash = file_hash or dedup.file_hash(file_path)
+            for doc in documents:
+                doc.meta["file_hash"] = file_hash
+        return documents
     
-    def process_directory(self, directory_path: str, subject: str = "General") -> List[Document]:
-        """Process all supported files in a directory"""
-        all_documents = []
+    def iter_directory(self, directory_path: str, subject: str = "General", workers: Optional[int] = None) -> Generator[Document, None, None]:
+        """Parse supported files in a directory in parallel, yielding chunks as each file finishes"""
+        from ingestion import IngestionPipeline, discover_files
         
+        pipeline = IngestionPipeline(workers=workers)
+        yield from pipeline.iter_chunks(discover_files(directory_path), subject)
+    
+    def process_directory(self, directory_path: str, subject: str = "General", workers: Optional[int] = None) -> List[Document]:
+        """Process all supported files in a directory"""
         try:
-            for filename in os.listdir(directory_path):
-                file_path = os.path.join(directory_path, filename)
-                if os.path.isfile(file_path):
-                    documents = self.process_file(file_path, subject)
-                    all_documents.extend(documents)
-            
+            all_documents = list(self.iter_directory(directory_path, subject, workers))
             logger.info(f"Processed {len(all_documents)} documents from directory")
             return all_documents
             
@@ -233,7 +240,7 @@ class DocumentProcessor:
         
         documents = []
         for content in sample_content:
-            doc = Document(
+            doc = _document(
                 content=content["content"],
                 meta={
                     "subject": content["subject"],
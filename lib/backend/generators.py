@@ -0,0 +1,334 @@
+"""
+Answer generators for AI Tutor system
+Local text generation backends that can stand in for the Haystack PromptNode
+"""
+
+import hashlib
+import os
+from abc import ABC, abstractmethod
+import threading
+import time
+from typing import Any, Callable, Dict, Iterator, List, Optional, Set, Tuple
+import logging
+
+from context_packer import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+EDUCATIONAL_PROMPT = """You are an expert AI tutor. Use the following context to answer the student's question in a clear, educational manner.
+
+Context: {context}
+
+Question: {query}
+
+Answer: Provide a comprehensive, step-by-step explanation that helps the student understand the concept. Include examples when helpful and encourage critical thinking."""
+
+
+def parse_cpus(spec: Optional[str]) -> Optional[Set[int]]:
+    """CPU list such as "0-3,6" to a set of CPU numbers"""
+    if not spec:
+        return None
+    cpus: Set[int] = set()
+    for part in spec.split(","):
+        part = part.strip()
+        if "-" in part:
+            first, last = part.split("-", 1)
+            cpus.update(range(int(first), int(last) + 1))
+        elif part:
+            cpus.add(int(part))
+    return cpus or None
+
+
+def configure_process(cpus: Optional[Set[int]] = None, threads: int = 0):
+    """
+    Pin the whole process to cpus and set torch's intra-op thread count. Both
+    settings are process-wide, so they are applied once when the generator is
+    built rather than around each call.
+    """
+    if cpus and hasattr(os, "sched_setaffinity"):
+        # An affinity mask belongs to a single thread: set it on every thread running
+        # now, and threads started later inherit it from the thread that starts them
+        try:
+            tasks = [int(task) for task in os.listdir("/proc/self/task")]
+        except OSError:
+            tasks = [0]
+        for task in tasks:
+            try:
+                os.sched_setaffinity(task, cpus)
+            except OSError:
+                # The thread exited in the meantime
+                pass
+        logger.info(f"Pinned the process to CPUs {sorted(cpus)}")
+    if threads > 0:
+        try:
+            import torch
+        except ImportError:
+            return
+        torch.set_num_threads(threads)
+
+
+class Generator(ABC):
+    """
+    A backend turns a prompt into answer text, optionally reporting each token as
+    it is produced. run_batch and prompt mirror the PromptNode methods the tutor
+    calls, so any backend can take the PromptNode's place.
+    """
+
+    name = "generator"
+
+    def __init__(self, max_tokens: int = 500):
+        self.max_tokens = max_tokens
+        self._stats_lock = threading.Lock()
+        self._counters = {"calls": 0, "prompt_tokens": 0, "generated_tokens": 0, "reused_prompt_tokens": 0}
+        self._generate_seconds = 0.0
+
+    @abstractmethod
+    def _tokens(self, prompt: str, max_tokens: int) -> Iterator[str]:
+        """Yield generated text pieces; subclasses record prompt and reused token counts"""
+
+    def count_tokens(self, texts: List[str]) -> List[int]:
+        """Token counts in this backend's vocabulary"""
+        return estimate_tokens(texts)
+
+    def generate(self, prompt: str, max_tokens: Optional[int] = None, on_token: Optional[Callable[[str], Any]] = None) -> str:
+        """Generate an answer, calling on_token with each piece of text"""
+        start = time.perf_counter()
+        pieces = []
+        tokens = self._tokens(prompt, max_tokens or self.max_tokens)
+        try:
+            for piece in tokens:
+                pieces.append(piece)
+                if on_token is not None:
+                    on_token(piece)
+        finally:
+            # Releases the backend's lock at once if on_token stopped generation
+            tokens.close()
+            with self._stats_lock:
+                self._counters["calls"] += 1
+                self._counters["generated_tokens"] += len(pieces)
+                self._generate_seconds += time.perf_counter() - start
+        return "".join(pieces).strip()
+
+    def _record_prompt(self, prompt_tokens: int, reused: int = 0):
+        with self._stats_lock:
+            self._counters["prompt_tokens"] += prompt_tokens
+            self._counters["reused_prompt_tokens"] += reused
+
+    @staticmethod
+    def build_prompt(query: str, documents: List[Any]) -> str:
+        context = " ".join(getattr(document, "content", str(document)) for document in documents or [])
+        return EDUCATIONAL_PROMPT.format(context=context, query=query)
+
+    def run_batch(self, queries: List[str], documents: List[List[Any]]) -> Tuple[Dict[str, Any], str]:
+        """PromptNode.run_batch: one answer list per query"""
+        results = [[self.generate(self.build_prompt(query, docs))] for query, docs in zip(queries, documents)]
+        return {"results": results}, "output_1"
+
+    def prompt(self, template, query: str, documents: List[Any], stream: bool = False, stream_handler: Optional[Callable] = None, **kwargs) -> List[str]:
+        """PromptNode.prompt with the educational template; stream_handler receives each token"""
+        on_token = stream_handler if stream else None
+        return [self.generate(self.build_prompt(query, documents), on_token=on_token)]
+
+    def stats(self) -> Dict[str, Any]:
+        """Return generation counters for monitoring"""
+        with self._stats_lock:
+            seconds = self._generate_seconds
+            return dict(
+                self._counters,
+                backend=self.name,
+                tokens_per_second=round(self._counters["generated_tokens"] / seconds, 1) if seconds else None
+            )
+
+
+class StubGenerator(Generator):
+    """
+    Deterministic answers without a model, for tests and for measuring everything
+    around generation: the answer repeats the first words of the context and the
+    question, one word per token, optionally at a fixed pace.
+    """
+
+    name = "stub"
+
+    def __init__(self, max_tokens: int = 500, seconds_per_token: float = 0.0):
+        super().__init__(max_tokens)
+        self.seconds_per_token = seconds_per_token
+
+    def _tokens(self, prompt: str, max_tokens: int) -> Iterator[str]:
+        self._record_prompt(len(prompt.split()))
+        context = prompt.split("Context: ", 1)[-1].split("\n\nQuestion: ", 1)
+        question = context[1].split("\n\n", 1)[0] if len(context) > 1 else ""
+        digest = hashlib.sha256(prompt.encode("utf-8")).hexdigest()[:8]
+        words = f"[{digest}] {question} {context[0]}".split()
+        for word in words[:max_tokens]:
+            if self.seconds_per_token:
+                time.sleep(self.seconds_per_token)
+            yield word + " "
+
+
+class TransformersGenerator(Generator):
+    """
+    A Hugging Face causal LM on CPU with greedy decoding, optionally with int8
+    dynamic quantization of its linear layers. The attention key/value cache of
+    the previous call is kept, so a prompt that starts with the same tokens (the
+    template, or an earlier turn of a conversation) only runs the new suffix.
+    Calls are serialized, since they share that cache.
+    """
+
+    name = "transformers"
+
+    def __init__(
+        self,
+        model_name: str = "gpt2",
+        max_tokens: int = 500,
+        quantize: Optional[str] = None,
+        reuse_cache: bool = True
+    ):
+        super().__init__(max_tokens)
+        import torch
+        from transformers import AutoModelForCausalLM, AutoTokenizer
+        self.torch = torch
+        self.tokenizer = AutoTokenizer.from_pretrained(model_name)
+        model = AutoModelForCausalLM.from_pretrained(model_name)
+        model.eval()
+        if quantize == "int8":
+            self._conv1d_to_linear(model, torch)
+            model = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+            logger.info(f"Using int8 dynamically quantized {model_name} for generation")
+        elif quantize:
+            raise ValueError(f"Unsupported generator quantization: {quantize}")
+        self.model = model
+        self.name = f"transformers-{quantize}" if quantize else "transformers"
+        self.context_length = getattr(model.config, "n_positions", None) or getattr(model.config, "max_position_embeddings", 1024)
+        self.reuse_cache = reuse_cache
+        self._lock = threading.Lock()
+        self._cached_ids: List[int] = []
+        self._cached_past = None
+
+    @staticmethod
+    def _conv1d_to_linear(model, torch):
+        """GPT-2 style Conv1D layers are linear layers with a transposed weight; swap them so they get quantized too"""
+        try:
+            from transformers.pytorch_utils import Conv1D
+        except ImportError:
+            return
+        for parent in list(model.modules()):
+            for name, child in list(parent.named_children()):
+                if isinstance(child, Conv1D):
+                    linear = torch.nn.Linear(child.weight.shape[0], child.weight.shape[1])
+                    linear.weight.data = child.weight.data.t().contiguous()
+                    linear.bias.data = child.bias.data
+                    setattr(parent, name, linear)
+
+    def count_tokens(self, texts: List[str]) -> List[int]:
+        return [len(ids) for ids in self.tokenizer(texts, add_special_tokens=False)["input_ids"]]
+
+    def _crop(self, past, length: int):
+        if hasattr(past, "crop"):
+            past.crop(length)
+            return past
+        return tuple((key[:, :, :length], value[:, :, :length]) for key, value in past)
+
+    def _tokens(self, prompt: str, max_tokens: int) -> Iterator[str]:
+        torch = self.torch
+        ids = self.tokenizer.encode(prompt)
+        max_tokens = min(max_tokens, self.context_length // 2)
+        # Keep the end of an over-long prompt, where the question is
+        ids = ids[-(self.context_length - max_tokens):]
+        with self._lock, torch.inference_mode():
+            reused = 0
+            past = None
+            if self.reuse_cache and self._cached_past is not None:
+                limit = min(len(ids) - 1, len(self._cached_ids))
+                while reused < limit and ids[reused] == self._cached_ids[reused]:
+                    reused += 1
+                if reused:
+                    past = self._crop(self._cached_past, reused)
+            self._cached_past = None
+            self._record_prompt(len(ids), reused)
+            feed = ids[reused:]
+            sequence = list(ids)
+            fed = reused
+            for _ in range(max_tokens):
+                output = self.model(input_ids=torch.tensor([feed]), past_key_values=past, use_cache=True)
+                past = output.past_key_values
+                fed += len(feed)
+                token = int(output.logits[0, -1].argmax())
+                if token == self.tokenizer.eos_token_id:
+                    break
+                sequence.append(token)
+                feed = [token]
+                yield self.tokenizer.decode([token])
+            if self.reuse_cache:
+                # The cache holds every token fed to the model, which excludes a last token cut off by max_tokens
+                self._cached_ids = sequence[:fed]
+                self._cached_past = past
+
+
+class LlamaCppGenerator(Generator):
+    """
+    A quantized GGUF model run by llama.cpp (llama-cpp-python). Prompt states are
+    kept in a RAM cache of cache_bytes, so a prompt sharing a prefix with an
+    earlier one resumes from that state instead of evaluating it again.
+    """
+
+    name = "llama_cpp"
+
+    def __init__(
+        self,
+        model_path: str,
+        max_tokens: int = 500,
+        threads: int = 0,
+        context_length: int = 2048,
+        cache_bytes: int = 256 << 20
+    ):
+        super().__init__(max_tokens)
+        from llama_cpp import Llama, LlamaRAMCache
+        self.model = Llama(
+            model_path=model_path,
+            n_ctx=context_length,
+            n_threads=threads or None,
+            verbose=False
+        )
+        if cache_bytes > 0:
+            self.model.set_cache(LlamaRAMCache(capacity_bytes=cache_bytes))
+        self.context_length = context_length
+        self._lock = threading.Lock()
+
+    def count_tokens(self, texts: List[str]) -> List[int]:
+        return [len(self.model.tokenize(text.encode("utf-8"), add_bos=False)) for text in texts]
+
+    def _tokens(self, prompt: str, max_tokens: int) -> Iterator[str]:
+        with self._lock:
+            self._record_prompt(self.count_tokens([prompt])[0])
+            for chunk in self.model(prompt, max_tokens=max_tokens, temperature=0.0, stream=True):
+                text = chunk["choices"][0]["text"]
+                if text:
+                    yield text
+
+
+def create_generator(backend: str, max_tokens: int = 500, cpus: Optional[Set[int]] = None, threads: int = 0, **options) -> Generator:
+    """
+    Build a generator backend by name: "transformers", "llama_cpp" or "stub".
+    cpus and threads apply to the whole process, see configure_process.
+    """
+    configure_process(cpus, threads)
+    if backend == "stub":
+        return StubGenerator(max_tokens, seconds_per_token=options.get("seconds_per_token", 0.0))
+    if backend == "transformers":
+        return TransformersGenerator(
+            options.get("model_name") or "gpt2",
+            max_tokens,
+            quantize=options.get("quantize"),
+            reuse_cache=options.get("reuse_cache", True)
+        )
+    if backend == "llama_cpp":
+        if not options.get("model_path"):
+            raise ValueError("The llama_cpp generator needs a GGUF model path")
+        return LlamaCppGenerator(
+            options["model_path"],
+            max_tokens,
+            threads,
+            context_length=options.get("context_length", 2048),
+            cache_bytes=options.get("cache_bytes", 256 << 20)
+        )
+    raise ValueError(f"Unknown generator backend: {backend}")
@@ -0,0 +1,30 @@
+"""
+Gunicorn settings for running the AI Tutor API on several worker processes
+Models and indexes are loaded once in the master and shared with the forked workers
+
+Usage:
+    gunicorn -c gunicorn_conf.py main:app
+"""
+
+import gc
+import os
+
+bind = os.getenv("EDUCHAT_BIND", "0.0.0.0:8000")
+workers = int(os.getenv("EDUCHAT_WORKERS", "2"))
+worker_class = "uvicorn.workers.UvicornWorker"
+timeout = int(os.getenv("EDUCHAT_WORKER_TIMEOUT", "120"))
+# Import main in the master so everything loaded before the fork is shared copy-on-write
+preload_app = True
+
+
+def when_ready(server):
+    """Load the models in the master, after the app is imported and before any worker is forked"""
+    if os.getenv("EDUCHAT_INFERENCE_MODE", "local").lower() != "local":
+        # The inference worker processes own the models; the API workers never load them
+        server.log.info(f"Inference runs in worker processes, forking {workers} workers without preloading models")
+        return
+    from haystack_config import haystack_config
+    haystack_config.ensure_initialized()
+    # Keep the collector from touching, and so copying, the preloaded objects in every worker
+    gc.freeze()
+    server.log.info(f"Models loaded in the master ({haystack_config.state}), forking {workers} workers")
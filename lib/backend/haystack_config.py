@@ -3,21 +3,518 @@ Haystack configuration for AI Tutor system
 This file sets up the document processing pipeline and AI components
 """
 
+import asyncio
+import copy
+import hashlib
+import json
 import os
-from typing import List, Dict, Any
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import List, Dict, Any, AsyncIterator, Callable, Optional, Tuple
 import logging
 
+import numpy as np
+
+from batch_scheduler import MicroBatcher
+from inference_executor import InferenceExecutor
+
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+class AnswerCache:
+    """Two-tier answer cache: exact normalized question match, then embedding similarity"""
+    
+    def __init__(
+        self,
+        max_entries: int = 1024,
+        max_semantic_entries: int = 512,
+        ttl: float = 3600.0,
+        similarity_threshold: float = 0.92
+    ):
+        self.max_entries = max_entries
+        self.max_semantic_entries = max_semantic_entries
+        self.ttl = ttl
+        self.similarity_threshold = similarity_threshold
+        self._lock = threading.Lock()
+        self._exact: "OrderedDict[Tuple[str, str], Tuple[float, Dict[str, Any]]]" = OrderedDict()
+        # Semantic entries live in fixed rows of a preallocated matrix so a lookup is one matrix product
+        self._semantic: "OrderedDict[Tuple[str, str], int]" = OrderedDict()
+        self._rows: List[Optional[Tuple[str, float, Dict[str, Any]]]] = [None] * max_semantic_entries
+        self._free_rows = list(range(max_semantic_entries - 1, -1, -1))
+        self._vectors = None
+        self._counters = {
+            "exact_hits": 0,
+            "semantic_hits": 0,
+            "misses": 0,
+            "evictions": 0,
+            "expirations": 0,
+            "invalidations": 0
+        }
+    
+    @staticmethod
+    def normalize(question: str) -> str:
+        """Normalize a question for exact matching"""
+        question = re.sub(r"\s+", " ", question.lower()).strip()
+        return question.rstrip("?!. ")
+    
+    def _key(self, question: str, subject: Optional[str]) -> Tuple[str, str]:
+        return (self.normalize(question), (subject or "").lower())
+    
+    def get(self, question: str, subject: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """Look up the exact-match tier"""
+        key = self._key(question, subject)
+        with self._lock:
+            entry = self._exact.get(key)
+            if entry is not None:
+                expires_at, response = entry
+                if expires_at > time.monotonic():
+                    self._exact.move_to_end(key)
+                    self._counters["exact_hits"] += 1
+                    return response
+                del self._exact[key]
+                self._counters["expirations"] += 1
+        return None
+    
+    def record_miss(self, count: int = 1):
+        """Count lookups that missed the exact tier and never reached the semantic tier"""
+        with self._lock:
+            self._counters["misses"] += count
+    
+    def get_similar(self, embedding, subject: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """Look up the semantic tier by cosine similarity to earlier questions"""
+        subject_key = (subject or "").lower()
+        query = self._unit(embedding)
+        with self._lock:
+            if self._vectors is None or not self._semantic:
+                self._counters["misses"] += 1
+                return None
+            scores = self._vectors @ query
+            now = time.monotonic()
+            for row in np.argsort(-scores):
+                if scores[row] < self.similarity_threshold:
+                    break
+                entry = self._rows[row]
+                if entry is None or entry[0] != subject_key:
+                    continue
+                if entry[1] <= now:
+                    self._drop_row(int(row))
+                    self._counters["expirations"] += 1
+                    continue
+                self._counters["semantic_hits"] += 1
+                return entry[2]
+            self._counters["misses"] += 1
+        return None
+    
+    def put(self, question: str, subject: Optional[str], response: Dict[str, Any], embedding=None):
+        """Store an answer in the exact tier and, when an embedding is given, the semantic tier"""
+        key = self._key(question, subject)
+        expires_at = time.monotonic() + self.ttl
+        with self._lock:
+            self._exact[key] = (expires_at, response)
+            self._exact.move_to_end(key)
+            while len(self._exact) > self.max_entries:
+                self._exact.popitem(last=False)
+                self._counters["evictions"] += 1
+            
+            if embedding is None or self.max_semantic_entries <= 0:
+                return
+            vector = self._unit(embedding)
+            if self._vectors is None:
+                self._vectors = np.zeros((self.max_semantic_entries, vector.shape[0]), dtype=np.float32)
+            row = self._semantic.pop(key, None)
+            if row is None:
+                if not self._free_rows:
+                    _, oldest = self._semantic.popitem(last=False)
+                    self._rows[oldest] = None
+                    self._vectors[oldest] = 0.0
+                    self._free_rows.append(oldest)
+                    self._counters["evictions"] += 1
+                row = self._free_rows.pop()
+            self._semantic[key] = row
+            self._rows[row] = (key[1], expires_at, response)
+            self._vectors[row] = vector
+    
+    def _drop_row(self, row: int):
+        """Free one semantic row; the caller holds the lock"""
+        self._rows[row] = None
+        self._vectors[row] = 0.0
+        self._free_rows.append(row)
+        for key, value in self._semantic.items():
+            if value == row:
+                del self._semantic[key]
+                break
+    
+    @staticmethod
+    def _unit(embedding):
+        vector = np.asarray(embedding, dtype=np.float32).reshape(-1)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm > 0 else vector
+    
+    def clear(self):
+        """Invalidate every cached answer"""
+        with self._lock:
+            self._exact.clear()
+            self._semantic.clear()
+            self._rows = [None] * self.max_semantic_entries
+            self._free_rows = list(range(self.max_semantic_entries - 1, -1, -1))
+            if self._vectors is not None:
+                self._vectors[:] = 0.0
+            self._counters["invalidations"] += 1
+    
+    def stats(self) -> Dict[str, Any]:
+        """Return cache counters for monitoring"""
+        with self._lock:
+            return dict(
+                self._counters,
+                exact_entries=len(self._exact),
+                semantic_entries=len(self._semantic)
+            )
+
+class RetrievalCache:
+    """
+    Retrieved document lists, separate from the answer cache. Dense results are keyed on
+    the query embedding quantized to a grid, so near-identical questions share an entry;
+    keyword results on the normalized question. Both keys include the filters and top_k.
+    Entries are stamped with the corpus version and ignored once the corpus has changed.
+    """
+    
+    def __init__(self, max_entries: int = 2048, scale: float = 64.0):
+        self.max_entries = max_entries
+        # Embedding components are rounded to multiples of 1/scale of a unit vector
+        self.scale = scale
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[Tuple[Any, ...], Tuple[int, List[Any]]]" = OrderedDict()
+        self._counters = {"hits": 0, "misses": 0, "stale": 0, "evictions": 0}
+    
+    @staticmethod
+    def _filters_key(filters: Optional[Dict[str, Any]]) -> str:
+        return json.dumps(filters, sort_keys=True, default=str) if filters else ""
+    
+    def embedding_key(self, embedding, filters: Optional[Dict[str, Any]], top_k: int) -> Tuple[Any, ...]:
+        vector = AnswerCache._unit(embedding)
+        quantized = np.clip(np.rint(vector * self.scale), -127, 127).astype(np.int8)
+        return ("dense", quantized.tobytes(), self._filters_key(filters), top_k)
+    
+    def text_key(self, question: str, filters: Optional[Dict[str, Any]], top_k: int) -> Tuple[Any, ...]:
+        return ("bm25", AnswerCache.normalize(question), self._filters_key(filters), top_k)
+    
+    def get(self, key: Tuple[Any, ...], version: int) -> Optional[List[Any]]:
+        """Documents cached for key against this corpus version"""
+        if self.max_entries <= 0:
+            return None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._counters["misses"] += 1
+                return None
+            if entry[0] != version:
+                del self._entries[key]
+                self._counters["stale"] += 1
+                return None
+            self._entries.move_to_end(key)
+            self._counters["hits"] += 1
+            return list(entry[1])
+    
+    def put(self, key: Tuple[Any, ...], version: int, documents: List[Any]):
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (version, list(documents))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._counters["evictions"] += 1
+    
+    def fetch(self, keys: List[Tuple[Any, ...]], version: int, retrieve: Callable[[List[int]], List[List[Any]]]) -> List[List[Any]]:
+        """Cached results for keys, calling retrieve(positions) once for all the misses"""
+        results: List[Optional[List[Any]]] = [self.get(key, version) for key in keys]
+        misses = [i for i, result in enumerate(results) if result is None]
+        if misses:
+            for i, documents in zip(misses, retrieve(misses)):
+                self.put(keys[i], version, documents)
+                results[i] = documents
+        return results
+    
+    def stats(self) -> Dict[str, Any]:
+        """Return cache counters for monitoring"""
+        with self._lock:
+            return dict(self._counters, entries=len(self._entries))
+
+class EmbeddingService:
+    """
+    Sentence embeddings shared by ingestion and queries. Texts are looked up by a
+    hash of model and text in an in-memory LRU, then in an on-disk SQLite cache,
+    and only the misses are encoded, in batches. It implements the embedding
+    encoder interface of EmbeddingRetriever so every retriever call goes through it.
+    """
+    
+    def __init__(
+        self,
+        model,
+        model_name: str,
+        batch_size: int = 64,
+        threads: int = 0,
+        cache_size: int = 10_000,
+        cache_path: Optional[str] = None,
+        quantize: Optional[str] = None
+    ):
+        self.batch_size = batch_size
+        self.cache_size = cache_size
+        # Quantized vectors differ slightly, so they get their own cache entries
+        self.model_key = f"{model_name}:{quantize}" if quantize else model_name
+        if threads > 0:
+            import torch
+            torch.set_num_threads(threads)
+        if quantize == "int8":
+            import torch
+            model = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+            logger.info(f"Using int8 dynamically quantized {model_name} for embeddings")
+        elif quantize:
+            raise ValueError(f"Unsupported embedding quantization: {quantize}")
+        self.model = model
+        self.cache_path = cache_path
+        self._lock = threading.Lock()
+        self._disk_lock = threading.Lock()
+        self._memory: "OrderedDict[bytes, np.ndarray]" = OrderedDict()
+        self._disk = None
+        self._disk_pid = None
+        if cache_path:
+            self._connect()
+        self._counters = {"memory_hits": 0, "disk_hits": 0, "encoded": 0}
+    
+    def _connect(self):
+        import sqlite3
+        self._disk = sqlite3.connect(self.cache_path, check_same_thread=False, isolation_level=None)
+        self._disk.execute("PRAGMA journal_mode=WAL")
+        self._disk.execute("CREATE TABLE IF NOT EXISTS embeddings (key BLOB PRIMARY KEY, vector BLOB NOT NULL)")
+        self._disk_pid = os.getpid()
+    
+    def _connection(self):
+        """The disk cache connection, reopened in a worker forked after it was opened"""
+        if self._disk_pid != os.getpid():
+            # SQLite connections must not be used across fork; the parent still owns the old one
+            self._connect()
+        return self._disk
+    
+    def _key(self, text: str) -> bytes:
+        return hashlib.sha256(f"{self.model_key}\n{text}".encode("utf-8")).digest()
+    
+    def embed(self, texts: List[str]) -> np.ndarray:
+        """Embed texts, encoding only those not already cached"""
+        keys = [self._key(text) for text in texts]
+        found: Dict[bytes, np.ndarray] = {}
+        with self._lock:
+            for key in keys:
+                vector = self._memory.get(key)
+                if vector is not None:
+                    self._memory.move_to_end(key)
+                    found[key] = vector
+            self._counters["memory_hits"] += len(found)
+        
+        missing = list(dict.fromkeys(key for key in keys if key not in found))
+        if missing and self._disk is not None:
+            from_disk = self._read_disk(missing)
+            found.update(from_disk)
+            missing = [key for key in missing if key not in from_disk]
+        
+        if missing:
+            first_text = {}
+            for key, text in zip(keys, texts):
+                first_text.setdefault(key, text)
+            vectors = self.model.encode(
+                [first_text[key] for key in missing],
+                batch_size=self.batch_size,
+                show_progress_bar=False,
+                convert_to_numpy=True
+            ).astype(np.float32)
+            encoded = dict(zip(missing, vectors))
+            found.update(encoded)
+            if self._disk is not None:
+                self._write_disk(encoded)
+        
+        with self._lock:
+            self._counters["encoded"] += len(missing)
+            for key in keys:
+                self._memory[key] = found[key]
+                self._memory.move_to_end(key)
+            while len(self._memory) > self.cache_size:
+                self._memory.popitem(last=False)
+        return np.stack([found[key] for key in keys]) if keys else np.zeros((0, 0), dtype=np.float32)
+    
+    def _read_disk(self, keys: List[bytes]) -> Dict[bytes, np.ndarray]:
+        found = {}
+        with self._disk_lock:
+            # SQLite limits the number of bound parameters per statement
+            for start in range(0, len(keys), 500):
+                batch = keys[start:start + 500]
+                rows = self._connection().execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({','.join('?' * len(batch))})", batch
+                ).fetchall()
+                for key, vector in rows:
+                    found[bytes(key)] = np.frombuffer(vector, dtype=np.float32)
+        with self._lock:
+            self._counters["disk_hits"] += len(found)
+        return found
+    
+    def _write_disk(self, encoded: Dict[bytes, np.ndarray]):
+        with self._disk_lock:
+            disk = self._connection()
+            with disk:
+                disk.executemany(
+                    "INSERT OR REPLACE INTO embeddings (key, vector) VALUES (?, ?)",
+                    [(key, vector.tobytes()) for key, vector in encoded.items()]
+                )
+    
+    def embed_queries(self, queries: List[str]) -> np.ndarray:
+        """Embedding encoder interface used by EmbeddingRetriever"""
+        return self.embed(list(queries))
+    
+    def embed_documents(self, docs: List[Any]) -> np.ndarray:
+        """Embedding encoder interface used by EmbeddingRetriever"""
+        return self.embed([doc.content for doc in docs])
+    
+    def stats(self) -> Dict[str, Any]:
+        """Return cache counters for monitoring"""
+        with self._lock:
+            return dict(self._counters, memory_entries=len(self._memory), model=self.model_key)
+    
+    def close(self):
+        if self._disk is not None:
+            with self._disk_lock:
+                if self._disk_pid == os.getpid():
+                    self._disk.close()
+                self._disk = None
+
+def reciprocal_rank_fusion(result_lists: List[List[Any]], top_k: int, k: int = 60) -> List[Any]:
+    """Merge ranked document lists by reciprocal rank, keeping the first copy of each document"""
+    scores: Dict[str, float] = {}
+    documents: Dict[str, Any] = {}
+    for results in result_lists:
+        for rank, document in enumerate(results):
+            scores[document.id] = scores.get(document.id, 0.0) + 1.0 / (k + rank + 1)
+            documents.setdefault(document.id, document)
+    ranked = sorted(scores, key=scores.get, reverse=True)[:top_k]
+    fused = []
+    for doc_id in ranked:
+        # A copy, so the cached dense and keyword results keep their own scores
+        document = copy.copy(documents[doc_id])
+        document.score = scores[doc_id]
+        fused.append(document)
+    return fused
+
+class GenerationCancelled(Exception):
+    """Raised inside the generator when a streaming client goes away"""
+
+class _TokenStreamHandler:
+    """Token handler passed to the PromptNode invocation layer while streaming"""
+    
+    def __init__(self, emit: Callable[[Dict[str, Any]], None], cancelled: threading.Event):
+        self.emit = emit
+        self.cancelled = cancelled
+    
+    def __call__(self, token_received: str, **kwargs) -> str:
+        if self.cancelled.is_set():
+            raise GenerationCancelled()
+        self.emit({"type": "token", "text": token_received})
+        return token_received
+
 class HaystackConfig:
     def __init__(self):
         self.document_store = None
         self.retriever = None
         self.prompt_node = None
         self.pipeline = None
-        self.initialize_components()
+        self.deduplicator = None
+        self.embedding_service = None
+        self.reranker = None
+        self.context_packer = None
+        self.executor = InferenceExecutor(
+            max_workers=int(os.getenv("EDUCHAT_INFERENCE_WORKERS", "2")),
+            max_queue_size=int(os.getenv("EDUCHAT_INFERENCE_QUEUE_SIZE", "16")),
+            timeout=float(os.getenv("EDUCHAT_INFERENCE_TIMEOUT", "60"))
+        )
+        self.batcher = MicroBatcher(
+            self._run_batch,
+            self.executor,
+            max_batch_size=int(os.getenv("EDUCHAT_BATCH_MAX_SIZE", "8")),
+            window_ms=float(os.getenv("EDUCHAT_BATCH_WINDOW_MS", "10"))
+        )
+        self.answer_cache = AnswerCache(
+            max_entries=int(os.getenv("EDUCHAT_CACHE_MAX_ENTRIES", "1024")),
+            max_semantic_entries=int(os.getenv("EDUCHAT_CACHE_MAX_SEMANTIC_ENTRIES", "512")),
+            ttl=float(os.getenv("EDUCHAT_CACHE_TTL", "3600")),
+            similarity_threshold=float(os.getenv("EDUCHAT_CACHE_SIMILARITY", "0.92"))
+        )
+        self.retrieval_cache = RetrievalCache(
+            max_entries=int(os.getenv("EDUCHAT_RETRIEVAL_CACHE_ENTRIES", "2048")),
+            scale=float(os.getenv("EDUCHAT_RETRIEVAL_CACHE_SCALE", "64"))
+        )
+        # "dense", "bm25" or "hybrid" (reciprocal-rank fusion of both)
+        self.retrieval_mode = os.getenv("EDUCHAT_RETRIEVAL_MODE", "hybrid").lower()
+        self.fusion_depth = int(os.getenv("EDUCHAT_FUSION_DEPTH", "4"))
+        self.bm25_fallback_load = float(os.getenv("EDUCHAT_BM25_FALLBACK_LOAD", "0.75"))
+        # Models are loaded on first use or by start_warmup, never at import time
+        self.state = "cold"
+        self.init_seconds: Optional[float] = None
+        self._init_lock = threading.Lock()
+        self._warmup_thread: Optional[threading.Thread] = None
+        # Store version the answer cache was filled against; retrieval cache entries are stamped with it
+        self._corpus_version = 0
+    
+    @property
+    def ready(self) -> bool:
+        """True once initialization has finished, with or without the full pipeline"""
+        return self.state in ("ready", "degraded")
+    
+    def ensure_initialized(self):
+        """Load the components on first use; concurrent callers wait for the same load"""
+        if self.ready:
+            return
+        with self._init_lock:
+            if self.ready:
+                return
+            self.state = "loading"
+            start = time.perf_counter()
+            self.initialize_components()
+            self.init_seconds = time.perf_counter() - start
+            self.state = "ready" if self.pipeline else "degraded"
+            logger.info(f"Components initialized in {self.init_seconds:.1f}s ({self.state})")
+    
+    def start_warmup(self, on_ready: Optional[Callable[[], None]] = None) -> threading.Thread:
+        """Initialize the components on a background thread, then call on_ready"""
+        def warmup():
+            try:
+                self.ensure_initialized()
+                if on_ready:
+                    on_ready()
+            except Exception as e:
+                logger.error(f"Error during warm-up: {e}")
+        
+        if self._warmup_thread is None:
+            self._warmup_thread = threading.Thread(target=warmup, name="warmup", daemon=True)
+            self._warmup_thread.start()
+        return self._warmup_thread
+    
+    def status(self) -> Dict[str, Any]:
+        """Return initialization state for readiness checks"""
+        return {"state": self.state, "ready": self.ready, "init_seconds": self.init_seconds}
+    
+    def stats(self) -> Dict[str, Any]:
+        """Return queue, cache and index statistics for monitoring"""
+        return {
+            "inference": self.executor.stats(),
+            "batching": self.batcher.stats(),
+            "answer_cache": self.answer_cache.stats(),
+            "retrieval_cache": self.retrieval_cache.stats(),
+            "ingestion": self.deduplicator.stats() if self.deduplicator else None,
+            "embeddings": self.embedding_service.stats() if self.embedding_service else None,
+            "reranker": self.reranker.stats() if self.reranker else None,
+            "context": self.context_packer.stats() if self.context_packer else None,
+            "generator": self.prompt_node.stats() if hasattr(self.prompt_node, "stats") else None
+        }
     
     def initialize_components(self):
         """Initialize all Haystack components"""
@@ -29,7 +526,6 @@ class HaystackConfig:
                 
                 # Try different import paths for components
                 try:
-                    from haystack.document_stores import ChromaDocumentStore
                     from haystack.nodes import (
                         PreProcessor,
                         EmbeddingRetriever,
@@ -38,49 +534,100 @@ class HaystackConfig:
                     )
                     logger.info("Using standard Haystack imports")
                 except ImportError:
-                    try:
-                        from haystack.document_stores.chroma import ChromaDocumentStore
-                        from haystack.nodes.retriever import EmbeddingRetriever
-                        from haystack.nodes.prompt import PromptNode, PromptTemplate
-                        logger.info("Using alternative Haystack import paths")
-                    except ImportError:
-                        # Use in-memory document store as fallback
-                        from haystack.document_stores import InMemoryDocumentStore
-                        ChromaDocumentStore = InMemoryDocumentStore
-                        from haystack.nodes.retriever import EmbeddingRetriever
-                        from haystack.nodes.prompt import PromptNode, PromptTemplate
-                        logger.info("Using InMemoryDocumentStore as fallback")
+                    from haystack.nodes.retriever import EmbeddingRetriever
+                    from haystack.nodes.prompt import PromptNode, PromptTemplate
+                    logger.info("Using alternative Haystack import paths")
                 
-                # Initialize document store
-                if ChromaDocumentStore == InMemoryDocumentStore:
-                    self.document_store = ChromaDocumentStore()
-                    logger.info("Using InMemoryDocumentStore")
-                else:
-                    self.document_store = ChromaDocumentStore(
-                        embedding_dim=768,
-                        embedding_function="sentence-transformers/all-MiniLM-L6-v2"
-                    )
-                    logger.info("Using ChromaDocumentStore")
+                from persistent_store import PersistentDocumentStore
+                from vector_index import create_vector_index
+                
+                # Initialize document store; an existing index is opened without re-embedding
+                index_dir = os.getenv("EDUCHAT_INDEX_DIR", "educhat_index")
+                os.makedirs(index_dir, exist_ok=True)
+                vector_index_params = {}
+                if os.getenv("EDUCHAT_ANN_BACKEND", "auto") != "exact":
+                    vector_index_params = {
+                        "m": int(os.getenv("EDUCHAT_HNSW_M", "16")),
+                        "ef_construction": int(os.getenv("EDUCHAT_HNSW_EF_CONSTRUCTION", "200")),
+                        "ef_search": int(os.getenv("EDUCHAT_HNSW_EF_SEARCH", "64")),
+                        "exact_threshold": int(os.getenv("EDUCHAT_ANN_EXACT_THRESHOLD", "20000"))
+                    }
+                self.document_store = PersistentDocumentStore(
+                    index_dir=index_dir,
+                    embedding_dim=384,
+                    similarity="cosine",
+                    vector_index=create_vector_index(
+                        os.getenv("EDUCHAT_ANN_BACKEND", "auto"),
+                        dim=384,
+                        index_dir=index_dir,
+                        **vector_index_params
+                    ),
+                    sync_interval=float(os.getenv("EDUCHAT_INDEX_SYNC_INTERVAL", "1.0"))
+                )
+                logger.info("Using PersistentDocumentStore")
+                
+                # Tracks file and chunk hashes so re-ingesting a file only writes what changed
+                from dedup import ContentDeduplicator
+                self.deduplicator = ContentDeduplicator(
+                    os.path.join(index_dir, "manifest.jsonl"),
+                    max_distance=int(os.getenv("EDUCHAT_NEAR_DUPLICATE_DISTANCE", "6")),
+                    write_lock=self.document_store.write_lock
+                )
                 
                 # Initialize retriever
+                embedding_batch_size = int(os.getenv("EDUCHAT_EMBEDDING_BATCH_SIZE", "64"))
                 self.retriever = EmbeddingRetriever(
                     document_store=self.document_store,
                     embedding_model="sentence-transformers/all-MiniLM-L6-v2",
                     model_format="sentence_transformers",
+                    batch_size=embedding_batch_size,
                     top_k=5
                 )
                 
-                # Initialize prompt node with educational context
-                self.prompt_node = PromptNode(
-                    model_name_or_path="gpt2",
-                    default_prompt_template=self._get_educational_prompt_template(),
-                    max_length=500
+                # Route every retriever embedding call through one cached, batched service
+                self.embedding_service = EmbeddingService(
+                    self.retriever.embedding_encoder.embedding_model,
+                    model_name="sentence-transformers/all-MiniLM-L6-v2",
+                    batch_size=embedding_batch_size,
+                    threads=int(os.getenv("EDUCHAT_EMBEDDING_THREADS", "0")),
+                    cache_size=int(os.getenv("EDUCHAT_EMBEDDING_CACHE_SIZE", "10000")),
+                    cache_path=os.path.join(index_dir, "embedding_cache.sqlite")
+                    if os.getenv("EDUCHAT_EMBEDDING_DISK_CACHE", "1") != "0" else None,
+                    quantize=os.getenv("EDUCHAT_EMBEDDING_QUANTIZE") or None
                 )
+                self.retriever.embedding_encoder = self.embedding_service
+                
+                # Optional cross-encoder stage between the retriever and the prompt
+                if os.getenv("EDUCHAT_RERANKER", "0") != "0":
+                    self._create_reranker()
+                
+                # Initialize prompt node with educational context, or a local generator backend in its place
+                generator_backend = os.getenv("EDUCHAT_GENERATOR", "haystack").lower()
+                max_answer_tokens = int(os.getenv("EDUCHAT_GENERATOR_MAX_TOKENS", "500"))
+                if generator_backend == "haystack":
+                    self.prompt_node = PromptNode(
+                        model_name_or_path="gpt2",
+                        default_prompt_template=self._get_educational_prompt_template(),
+                        max_length=max_answer_tokens
+                    )
+                else:
+                    self.prompt_node = self._create_generator(generator_backend, max_answer_tokens)
+                
+                # Retrieved chunks are packed into a fixed token budget before they reach the prompt
+                context_tokens = int(os.getenv("EDUCHAT_CONTEXT_TOKENS", "384"))
+                if context_tokens > 0:
+                    from context_packer import ContextPacker, load_tokenizer
+                    self.context_packer = ContextPacker(
+                        budget_tokens=context_tokens,
+                        count_tokens=getattr(self.prompt_node, "count_tokens", None) or load_tokenizer("gpt2"),
+                        redundancy_threshold=float(os.getenv("EDUCHAT_CONTEXT_REDUNDANCY", "0.8"))
+                    )
                 
                 # Create the pipeline
                 self.pipeline = Pipeline()
                 self.pipeline.add_node(component=self.retriever, name="Retriever", inputs=["Query"])
-                self.pipeline.add_node(component=self.prompt_node, name="PromptNode", inputs=["Retriever"])
+                if generator_backend == "haystack":
+                    self.pipeline.add_node(component=self.prompt_node, name="PromptNode", inputs=["Retriever"])
                 
                 logger.info("Haystack components initialized successfully")
                 
@@ -92,6 +639,41 @@ class HaystackConfig:
             logger.error(f"Error initializing Haystack components: {e}")
             self._create_minimal_config()
     
+    def _create_generator(self, backend: str, max_tokens: int):
+        """Build a local generator backend that takes the PromptNode's place"""
+        from generators import create_generator, parse_cpus
+        generator = create_generator(
+            backend,
+            max_tokens=max_tokens,
+            cpus=parse_cpus(os.getenv("EDUCHAT_GENERATOR_CPUS")),
+            threads=int(os.getenv("EDUCHAT_GENERATOR_THREADS", "0")),
+            model_name=os.getenv("EDUCHAT_GENERATOR_MODEL"),
+            model_path=os.getenv("EDUCHAT_GENERATOR_MODEL_PATH"),
+            quantize=os.getenv("EDUCHAT_GENERATOR_QUANTIZE") or None,
+            reuse_cache=os.getenv("EDUCHAT_GENERATOR_KV_CACHE", "1") != "0",
+            context_length=int(os.getenv("EDUCHAT_GENERATOR_CONTEXT", "2048")),
+            cache_bytes=int(os.getenv("EDUCHAT_GENERATOR_CACHE_MB", "256")) << 20
+        )
+        logger.info(f"Using the {generator.name} generator")
+        return generator
+    
+    def _create_reranker(self):
+        """Load the cross-encoder reranker; retrieval works as before if it cannot be loaded"""
+        try:
+            from reranker import CrossEncoderReranker
+            self.reranker = CrossEncoderReranker(
+                model_name=os.getenv("EDUCHAT_RERANKER_MODEL", "cross-encoder/ms-marco-MiniLM-L-6-v2"),
+                candidates=int(os.getenv("EDUCHAT_RERANK_CANDIDATES", "20")),
+                top_k=int(os.getenv("EDUCHAT_RERANK_TOP_K", "3")),
+                batch_size=int(os.getenv("EDUCHAT_RERANK_BATCH_SIZE", "16")),
+                budget_ms=float(os.getenv("EDUCHAT_RERANK_BUDGET_MS", "200")),
+                probe_after=int(os.getenv("EDUCHAT_RERANK_PROBE_AFTER", "10"))
+            )
+            logger.info(f"Reranking {self.reranker.candidates} candidates with {self.reranker.model_name}")
+        except Exception as e:
+            logger.error(f"Error loading reranker: {e}")
+            self.reranker = None
+    
     def _create_minimal_config(self):
         """Create a minimal working configuration when Haystack fails"""
         logger.info("Creating minimal configuration...")
@@ -101,6 +683,10 @@ class HaystackConfig:
             self.retriever = None
             self.prompt_node = None
             self.pipeline = None
+            self.deduplicator = None
+            self.embedding_service = None
+            self.reranker = None
+            self.context_packer = None
             logger.info("Minimal configuration created successfully")
             
         except Exception as e:
@@ -109,15 +695,14 @@ class HaystackConfig:
     def _get_educational_prompt_template(self):
         """Create a prompt template for educational AI tutoring"""
         try:
+            try:
+                from haystack.nodes import PromptTemplate
+            except ImportError:
+                from haystack.nodes.prompt import PromptTemplate
+            from generators import EDUCATIONAL_PROMPT
             # Try to create a proper PromptTemplate
             return PromptTemplate(
-                prompt="""You are an expert AI tutor. Use the following context to answer the student's question in a clear, educational manner.
-
-Context: {join(documents)}
-
-Question: {query}
-
-Answer: Provide a comprehensive, step-by-step explanation that helps the student understand the concept. Include examples when helpful and encourage critical thinking.""",
+                prompt=EDUCATIONAL_PROMPT.replace("{context}", "{join(documents)}"),
                 input_variables=["documents", "query"]
             )
         except Exception as e:
@@ -127,45 +712,402 @@ Answer: Provide a comprehensive, step-by-step explanation that helps the student
     
     def add_documents(self, documents):
         """Add documents to the document store"""
+        self.ensure_initialized()
         try:
             if self.document_store:
+                # Only embed documents the store has not seen, so restarts and re-uploads are cheap
+                documents = [d for d in documents if not self.document_store.has_document(d.id)]
+                if not documents:
+                    logger.info("All documents already in the store")
+                    return
+                embeddings = self.retriever.embed_documents(documents)
+                for doc, embedding in zip(documents, embeddings):
+                    doc.embedding = embedding
                 self.document_store.write_documents(documents)
+                # Cached answers may no longer reflect the corpus
+                self._sync_corpus()
                 logger.info(f"Added {len(documents)} documents to the store")
             else:
                 logger.warning("Document store not available")
         except Exception as e:
             logger.error(f"Error adding documents: {e}")
     
-    def query(self, question: str) -> Dict[str, Any]:
+    def load_sample_content(self):
+        """Load the built-in sample educational content"""
+        from document_processor import document_processor
+        try:
+            self.add_documents(document_processor.create_sample_educational_content())
+            logger.info("AI Tutor system initialized with sample content")
+        except Exception as e:
+            logger.error(f"Error loading sample content: {e}")
+    
+    def process_upload(self, file_path: str, filename: str, subject: str, topic: Optional[str], file_hash: str) -> Dict[str, Any]:
+        """Parse, embed and store one uploaded file"""
+        import dedup
+        from document_processor import document_processor
+        # Re-uploading an identical file is a no-op, so skip parsing and embedding entirely
+        source = dedup.source_key(subject, filename)
+        if self.file_unchanged(source, file_hash):
+            return {"document_count": 0, "unchanged": True}
+        
+        documents = document_processor.process_file(file_path, subject, file_hash)
+        if not documents:
+            raise ValueError("Failed to process document")
+        for doc in documents:
+            # Record the uploaded name rather than the temporary path
+            doc.meta["source"] = filename
+            doc.meta["filename"] = filename
+            if topic:
+                doc.meta["topic"] = topic
+        
+        # Only chunks that changed since the last upload of this file are embedded and written
+        sync = self.sync_files([(source, file_hash, documents)])
+        return {
+            "document_count": len(documents),
+            "chunks_added": sync["added"],
+            "chunks_reused": sync["reused"],
+            "near_duplicates": sync["near_duplicates"],
+            "chunks_removed": sync["removed"]
+        }
+    
+    def file_unchanged(self, source: str, file_hash: str) -> bool:
+        """Check whether a source file was already ingested with the same content"""
+        self.ensure_initialized()
+        if self.deduplicator is None:
+            return False
+        self.deduplicator.refresh()
+        return self.deduplicator.is_unchanged(source, file_hash)
+    
+    def sync_files(self, files: List[Tuple[str, str, List[Any]]]) -> Dict[str, int]:
+        """
+        Bring the store in line with the latest version of each (source, file_hash, documents).
+        Only chunks the store does not already hold are embedded, and chunks that were
+        dropped from a source are deleted once no other source references them.
+        """
+        self.ensure_initialized()
+        stats = {"files": len(files), "added": 0, "reused": 0, "near_duplicates": 0, "removed": 0}
+        if self.deduplicator is None:
+            for _, _, documents in files:
+                self.add_documents(documents)
+                stats["added"] += len(documents)
+            return stats
+        try:
+            # One writer at a time across worker processes, working from the latest manifest
+            with self.document_store.write_lock:
+                self.deduplicator.refresh(repair=True)
+                plans = self.deduplicator.plan(files, self.document_store.has_document)
+                new_documents = [doc for plan in plans for doc in plan.new_documents]
+                if new_documents:
+                    embeddings = self.retriever.embed_documents(new_documents)
+                    for doc, embedding in zip(new_documents, embeddings):
+                        doc.embedding = embedding
+                    self.document_store.write_documents(new_documents)
+                # Old chunks go only after their replacements are written
+                stale_ids = self.deduplicator.commit(plans)
+                if stale_ids:
+                    self.document_store.delete_documents(ids=stale_ids)
+            self._sync_corpus()
+            stats["added"] = len(new_documents)
+            stats["reused"] = sum(plan.reused for plan in plans)
+            stats["near_duplicates"] = sum(plan.near_duplicates for plan in plans)
+            stats["removed"] = len(stale_ids)
+            logger.info(f"Synced {len(files)} files: {stats}")
+        except Exception as e:
+            logger.error(f"Error syncing documents: {e}")
+            raise
+        return stats
+    
+    def _sync_corpus(self):
+        """Drop cached answers once the corpus changed, including writes by other worker processes"""
+        store = self.document_store
+        if store is None or not hasattr(store, "version"):
+            return
+        store.maybe_refresh()
+        if store.version != self._corpus_version:
+            self._corpus_version = store.version
+            self.answer_cache.clear()
+    
+    def query(self, question: str, subject: Optional[str] = None) -> Dict[str, Any]:
         """Query the AI tutor with a question"""
+        return self.query_batch([question], [subject])[0]
+    
+    def query_batch(
+        self,
+        questions: List[str],
+        subjects: Optional[List[Optional[str]]] = None
+    ) -> List[Dict[str, Any]]:
+        """Answer several questions with one batched retrieval and generation pass"""
+        self.ensure_initialized()
+        subjects = subjects or [None] * len(questions)
+        self._sync_corpus()
+        responses: List[Optional[Dict[str, Any]]] = [
+            self.answer_cache.get(question, subject) for question, subject in zip(questions, subjects)
+        ]
+        pending = [i for i, response in enumerate(responses) if response is None]
+        if not pending:
+            return responses
+        
         try:
-            if self.pipeline:
-                results = self.pipeline.run(query=question)
-                return {
-                    "answer": results.get("answers", []),
-                    "documents": results.get("documents", []),
-                    "query": question
-                }
-            else:
+            if not self.pipeline:
+                self.answer_cache.record_miss(len(pending))
                 # Return a simple response when pipeline is not available
-                return {
-                    "answer": [f"I understand your question: '{question}'. Let me help you with this."],
-                    "documents": [],
-                    "query": question
+                for i in pending:
+                    responses[i] = {
+                        "answer": [f"I understand your question: '{questions[i]}'. Let me help you with this."],
+                        "documents": [],
+                        "query": questions[i]
+                    }
+                return responses
+            
+            # Under heavy load the keyword fast path skips the embedding model entirely
+            mode = self._effective_retrieval_mode()
+            embeddings = [None] * len(pending)
+            if mode != "bm25":
+                # Embed every uncached question in a single forward pass
+                embeddings = self.retriever.embed_queries([questions[i] for i in pending])
+            misses = []
+            for i, embedding in zip(pending, embeddings):
+                if embedding is not None:
+                    responses[i] = self.answer_cache.get_similar(embedding, subjects[i])
+                else:
+                    # get_similar counts its own misses; here only the exact tier was tried
+                    self.answer_cache.record_miss()
+                if responses[i] is None:
+                    misses.append((i, embedding))
+            if not misses:
+                return responses
+            
+            miss_questions = [questions[i] for i, _ in misses]
+            documents = self._retrieve_batch(
+                miss_questions,
+                [embedding for _, embedding in misses],
+                [self._subject_filters(subjects[i]) for i, _ in misses],
+                mode
+            )
+            results, _ = self.prompt_node.run_batch(queries=miss_questions, documents=self._pack_context(miss_questions, documents))
+            answers = results.get("results", [])
+            for j, (i, embedding) in enumerate(misses):
+                response = {
+                    "answer": answers[j] if j < len(answers) else [],
+                    "documents": documents[j],
+                    "query": questions[i]
                 }
+                self.answer_cache.put(questions[i], subjects[i], response, embedding)
+                responses[i] = response
+            return responses
         except Exception as e:
             logger.error(f"Error querying pipeline: {e}")
-            return {"error": str(e)}
+            return [response if response is not None else {"error": str(e)} for response in responses]
+    
+    def _effective_retrieval_mode(self) -> str:
+        """Pick the retrieval mode for the next request, falling back to BM25 when saturated"""
+        if getattr(self.document_store, "sparse_index", None) is None:
+            return "dense"
+        if self.retrieval_mode != "bm25" and self.executor.load() >= self.bm25_fallback_load:
+            return "bm25"
+        return self.retrieval_mode
+    
+    def _retrieve_batch(
+        self,
+        questions: List[str],
+        embeddings: List[Any],
+        filters: List[Optional[Dict[str, Any]]],
+        mode: str
+    ) -> List[List[Any]]:
+        """Retrieve documents for several questions, reranking a wider candidate set when a reranker is loaded"""
+        if self.reranker is None:
+            return self._retrieve_candidates(questions, embeddings, filters, mode, self.retriever.top_k)
+        candidates = self._retrieve_candidates(questions, embeddings, filters, mode, self.reranker.candidates)
+        if mode == "bm25" and self.retrieval_mode != "bm25":
+            # Saturated: keep the retrieval order rather than spend more CPU
+            return [documents[:self.reranker.top_k] for documents in candidates]
+        return self.reranker.rerank_batch(questions, candidates)
+    
+    def _retrieve_candidates(
+        self,
+        questions: List[str],
+        embeddings: List[Any],
+        filters: List[Optional[Dict[str, Any]]],
+        mode: str,
+        top_k: int
+    ) -> List[List[Any]]:
+        """Retrieve documents for several questions with dense, BM25 or hybrid retrieval"""
+        if mode == "bm25":
+            return self._retrieve_sparse(questions, filters, top_k)
+        depth = top_k if mode == "dense" else top_k * self.fusion_depth
+        dense = self._retrieve_dense(embeddings, filters, depth)
+        if mode == "dense":
+            return dense
+        sparse = self._retrieve_sparse(questions, filters, depth)
+        return [reciprocal_rank_fusion([d, k], top_k) for d, k in zip(dense, sparse)]
+    
+    def _retrieve_dense(self, embeddings: List[Any], filters: List[Optional[Dict[str, Any]]], top_k: int) -> List[List[Any]]:
+        """Nearest-neighbour search for the embeddings not answered by the retrieval cache"""
+        keys = [self.retrieval_cache.embedding_key(e, f, top_k) for e, f in zip(embeddings, filters)]
+        return self.retrieval_cache.fetch(keys, self._corpus_version, lambda misses: self.document_store.query_by_embedding_batch(
+            query_embs=np.stack([embeddings[i] for i in misses]),
+            filters=[filters[i] for i in misses],
+            top_k=top_k
+        ))
+    
+    def _retrieve_sparse(self, questions: List[str], filters: List[Optional[Dict[str, Any]]], top_k: int) -> List[List[Any]]:
+        """BM25 search for the questions not answered by the retrieval cache"""
+        keys = [self.retrieval_cache.text_key(q, f, top_k) for q, f in zip(questions, filters)]
+        return self.retrieval_cache.fetch(keys, self._corpus_version, lambda misses: self.document_store.query_batch(
+            [questions[i] for i in misses],
+            filters=[filters[i] for i in misses],
+            top_k=top_k
+        ))
+    
+    def _pack_context(self, questions: List[str], documents: List[List[Any]]) -> List[List[Any]]:
+        """Trim each question's documents to the prompt token budget; responses still list the full documents"""
+        if self.context_packer is None:
+            return documents
+        return self.context_packer.pack_batch(questions, documents)
+    
+    def _subject_filters(self, subject: Optional[str]) -> Optional[Dict[str, Any]]:
+        """Restrict retrieval to a subject when the store holds documents for it"""
+        if not subject or not self.document_store:
+            return None
+        filters = {"subject": subject}
+        if self.document_store.get_document_count(filters=filters) == 0:
+            return None
+        return filters
+    
+    def _run_batch(self, items: List[Tuple[str, Optional[str]]]) -> List[Dict[str, Any]]:
+        """Batch entry point for the micro-batcher"""
+        return self.query_batch([question for question, _ in items], [subject for _, subject in items])
+    
+    async def query_async(self, question: str, subject: Optional[str] = None) -> Dict[str, Any]:
+        """Query the AI tutor on the inference executor without blocking the event loop"""
+        # Exact cache hits never need a worker
+        self._sync_corpus()
+        cached = self.answer_cache.get(question, subject)
+        if cached is not None:
+            return cached
+        if self.batcher.max_batch_size > 1:
+            return await self.executor.wait(self.batcher.submit((question, subject)))
+        return await self.executor.run(self.query, question, subject)
+    
+    def stream_query(
+        self,
+        question: str,
+        subject: Optional[str],
+        emit: Callable[[Dict[str, Any]], None],
+        cancelled: Optional[threading.Event] = None
+    ):
+        """Answer a question, emitting the retrieved documents first and then tokens as they are generated"""
+        self.ensure_initialized()
+        cancelled = cancelled or threading.Event()
+        self._sync_corpus()
+        response = self.answer_cache.get(question, subject)
+        embedding = None
+        mode = self._effective_retrieval_mode()
+        if response is None and self.pipeline and mode != "bm25":
+            embedding = self.retriever.embed_queries([question])[0]
+            response = self.answer_cache.get_similar(embedding, subject)
+        elif response is None and self.pipeline:
+            self.answer_cache.record_miss()
+        if response is None and not self.pipeline:
+            response = self.query(question, subject)
+        
+        if response is not None:
+            # Cached or fallback answers are sent as a single fragment
+            emit({"type": "documents", "documents": [self._document_to_dict(d) for d in response.get("documents", [])]})
+            for text in response.get("answer", []):
+                emit({"type": "token", "text": str(text)})
+            emit({"type": "done", "answer": response.get("answer", [])})
+            return
+        
+        documents = self._retrieve_batch([question], [embedding], [self._subject_filters(subject)], mode)[0]
+        emit({"type": "documents", "documents": [self._document_to_dict(d) for d in documents]})
+        answers = self.prompt_node.prompt(
+            None,
+            query=question,
+            documents=self._pack_context([question], [documents])[0],
+            stream=True,
+            stream_handler=_TokenStreamHandler(emit, cancelled)
+        )
+        response = {"answer": answers, "documents": documents, "query": question}
+        self.answer_cache.put(question, subject, response, embedding)
+        emit({"type": "done", "answer": answers})
+    
+    def stream_events(self, question: str, subject: Optional[str] = None) -> AsyncIterator[Dict[str, Any]]:
+        """Start a streaming answer on the inference executor and return its events"""
+        loop = asyncio.get_running_loop()
+        queue: "asyncio.Queue[Optional[Dict[str, Any]]]" = asyncio.Queue()
+        cancelled = threading.Event()
+        
+        def emit(event: Optional[Dict[str, Any]]):
+            try:
+                loop.call_soon_threadsafe(queue.put_nowait, event)
+            except RuntimeError:
+                # The event loop is gone, so nobody is listening any more
+                cancelled.set()
+        
+        def work():
+            try:
+                self.stream_query(question, subject, emit, cancelled)
+            except GenerationCancelled:
+                logger.info("Streaming client disconnected, generation stopped")
+            except Exception as e:
+                logger.error(f"Error streaming answer: {e}")
+                emit({"type": "error", "detail": str(e)})
+            finally:
+                emit(None)
+        
+        # Submitting here, not in the generator, lets a full queue fail before the response starts
+        self.executor.submit(work)
+        return self._drain_events(queue, cancelled, loop.time() + self.executor.timeout)
+    
+    async def _drain_events(self, queue, cancelled: threading.Event, deadline: float) -> AsyncIterator[Dict[str, Any]]:
+        loop = asyncio.get_running_loop()
+        try:
+            while True:
+                try:
+                    event = await asyncio.wait_for(queue.get(), timeout=max(deadline - loop.time(), 0))
+                except asyncio.TimeoutError:
+                    yield {"type": "error", "detail": f"Inference did not finish within {self.executor.timeout} seconds"}
+                    return
+                if event is None:
+                    return
+                yield event
+        finally:
+            cancelled.set()
+    
+    @staticmethod
+    def _document_to_dict(document) -> Dict[str, Any]:
+        """Reduce a Haystack document to a JSON-friendly reference"""
+        if isinstance(document, dict):
+            return document
+        return {
+            "id": getattr(document, "id", None),
+            "content": getattr(document, "content", str(document)),
+            "meta": getattr(document, "meta", {}),
+            "score": getattr(document, "score", None)
+        }
+    
+    def shutdown(self):
+        """Stop background workers and persist indexes"""
+        self.batcher.close()
+        self.executor.shutdown(wait=False)
+        # Shutting down never triggers a load, but waits for one in progress so the store is not closed half-built
+        with self._init_lock:
+            if self.document_store and hasattr(self.document_store, "close"):
+                self.document_store.close()
+            if self.embedding_service:
+                self.embedding_service.close()
     
     def get_subject_expertise(self, subject: str) -> List:
         """Get documents related to a specific subject"""
+        self.ensure_initialized()
         try:
             if self.retriever:
-                results = self.retriever.retrieve(
-                    query=f"subject: {subject}",
-                    top_k=10
-                )
-                return results
+                # Repeated dashboard calls are served by the retrieval cache until the corpus changes
+                self._sync_corpus()
+                embedding = self.retriever.embed_queries([subject])[0]
+                # Filter on the subject field rather than matching it in the query text
+                return self._retrieve_dense([embedding], [{"subject": subject}], 10)[0]
             else:
                 logger.warning("Retriever not available")
                 return []
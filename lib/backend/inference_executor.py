@@ -0,0 +1,108 @@
+"""
+Inference executor for AI Tutor system
+Runs blocking Haystack work on dedicated worker threads with a bounded queue
+"""
+
+import asyncio
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class InferenceQueueFull(Exception):
+    """Raised when the inference queue has no free slots"""
+
+
+class InferenceTimeout(Exception):
+    """Raised when an inference request exceeds its timeout"""
+
+
+class InferenceWorkerUnavailable(Exception):
+    """Raised when no inference worker process is connected"""
+
+
+class InferenceExecutor:
+    def __init__(self, max_workers: int = 2, max_queue_size: int = 16, timeout: float = 60.0):
+        self.max_workers = max_workers
+        self.max_queue_size = max_queue_size
+        self.timeout = timeout
+        # One slot per running or queued request; slots are held until the work finishes
+        self._slots = threading.BoundedSemaphore(max_workers + max_queue_size)
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="inference")
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._rejected = 0
+        self._timed_out = 0
+
+    def acquire(self, count: int = 1):
+        """Reserve queue slots without blocking, or raise InferenceQueueFull"""
+        acquired = 0
+        while acquired < count:
+            if not self._slots.acquire(blocking=False):
+                self.release(acquired)
+                with self._lock:
+                    self._rejected += 1
+                raise InferenceQueueFull("Inference queue is full, try again later")
+            acquired += 1
+        with self._lock:
+            self._in_flight += count
+
+    def release(self, count: int = 1):
+        """Return previously reserved queue slots"""
+        if count <= 0:
+            return
+        with self._lock:
+            self._in_flight -= count
+        for _ in range(count):
+            self._slots.release()
+
+    def submit(self, fn: Callable, *args, **kwargs) -> Future:
+        """Reserve a slot and run fn on an inference worker"""
+        self.acquire()
+        return self.submit_acquired(1, fn, *args, **kwargs)
+
+    def submit_acquired(self, slots: int, fn: Callable, *args, **kwargs) -> Future:
+        """Run fn on an inference worker using slots reserved by the caller"""
+        try:
+            future = self._executor.submit(fn, *args, **kwargs)
+        except Exception:
+            self.release(slots)
+            raise
+        future.add_done_callback(lambda _: self.release(slots))
+        return future
+
+    async def wait(self, future: Future) -> Any:
+        """Await a worker future from the event loop, applying the request timeout"""
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(future), timeout=self.timeout)
+        except asyncio.TimeoutError:
+            with self._lock:
+                self._timed_out += 1
+            raise InferenceTimeout(f"Inference did not finish within {self.timeout} seconds")
+
+    async def run(self, fn: Callable, *args, **kwargs) -> Any:
+        """Run fn on an inference worker without blocking the event loop"""
+        return await self.wait(self.submit(fn, *args, **kwargs))
+
+    def load(self) -> float:
+        """Fraction of queue capacity currently in use"""
+        with self._lock:
+            return self._in_flight / (self.max_workers + self.max_queue_size)
+
+    def stats(self) -> Dict[str, Any]:
+        """Return queue statistics for monitoring"""
+        with self._lock:
+            return {
+                "workers": self.max_workers,
+                "queue_size": self.max_queue_size,
+                "in_flight": self._in_flight,
+                "rejected": self._rejected,
+                "timed_out": self._timed_out
+            }
+
+    def shutdown(self, wait: bool = True):
+        """Stop accepting work and shut down the worker threads"""
+        self._executor.shutdown(wait=wait, cancel_futures=True)
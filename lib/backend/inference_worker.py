@@ -0,0 +1,592 @@
+#!/usr/bin/env python3
+"""
+Inference worker for AI Tutor system
+Runs the Haystack pipeline and document parsers in their own process and serves
+the API over a Unix socket, so generation and parsing never hold the API's GIL
+
+Usage:
+    EDUCHAT_INFERENCE_AUTHKEY=change-me python inference_worker.py --socket /run/educhat/w1.sock
+"""
+
+import argparse
+import asyncio
+import itertools
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from multiprocessing.connection import Client, Connection, Listener
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional
+import logging
+
+from inference_executor import InferenceQueueFull, InferenceTimeout, InferenceWorkerUnavailable
+
+logger = logging.getLogger(__name__)
+
+AUTHKEY_ENV = "EDUCHAT_INFERENCE_AUTHKEY"
+# In a per-user directory that only its owner can enter
+DEFAULT_SOCKET = os.path.join(
+    tempfile.gettempdir(),
+    f"educhat-{os.getuid()}" if hasattr(os, "getuid") else "educhat",
+    "inference.sock"
+)
+
+
+# Exceptions that keep their type across the socket; anything else arrives as RuntimeError
+ERRORS = {
+    "InferenceQueueFull": InferenceQueueFull,
+    "InferenceTimeout": InferenceTimeout,
+    "InferenceWorkerUnavailable": InferenceWorkerUnavailable,
+    "ValueError": ValueError
+}
+
+
+def _error(request_id: int, error: BaseException) -> Dict[str, Any]:
+    return {"id": request_id, "error": type(error).__name__, "detail": str(error)}
+
+
+def _private_socket_dir(address: str):
+    """
+    Create the socket's directory with mode 0700, or check that an existing one
+    belongs to this user and is closed to everyone else, so no other local user
+    can reach or replace the socket
+    """
+    directory = os.path.dirname(os.path.abspath(address))
+    os.makedirs(directory, mode=0o700, exist_ok=True)
+    info = os.stat(directory)
+    if hasattr(os, "getuid") and info.st_uid != os.getuid():
+        raise PermissionError(f"Socket directory {directory} belongs to another user")
+    if info.st_mode & 0o077:
+        raise PermissionError(f"Socket directory {directory} must only be accessible by its owner (chmod 700)")
+
+
+class InferenceServer:
+    """
+    Serves HaystackConfig over a Unix socket. Messages are dicts with an id,
+    so one connection carries many concurrent requests: queries go through the
+    micro-batcher, streams send one message per event, and uploads and other
+    slow calls run on a separate pool. Pings are answered on the connection's
+    reader thread, so they succeed while the models are still loading.
+    Messages are pickles, so every connection must pass the authkey handshake.
+    """
+
+    def __init__(self, config, address: str, authkey: bytes, upload_workers: int = 1):
+        if not authkey:
+            raise ValueError(f"The inference worker needs an authkey; set {AUTHKEY_ENV}")
+        self.config = config
+        self.address = address
+        self.authkey = authkey
+        self._background = ThreadPoolExecutor(max_workers=upload_workers + 1, thread_name_prefix="worker-background")
+        self._methods: Dict[str, Callable] = {
+            "warmup": self._warmup,
+            "stats": config.stats,
+            "load_sample_content": config.load_sample_content,
+            "process_upload": config.process_upload
+        }
+
+    def serve_forever(self):
+        """Accept API connections until the process is stopped"""
+        _private_socket_dir(self.address)
+        if os.path.exists(self.address):
+            # Left behind by a worker that did not shut down cleanly
+            os.remove(self.address)
+        with Listener(self.address, family="AF_UNIX", authkey=self.authkey) as listener:
+            logger.info(f"Inference worker {os.getpid()} listening on {self.address}")
+            while True:
+                try:
+                    connection = listener.accept()
+                except Exception as e:
+                    logger.error(f"Error accepting connection: {e}")
+                    continue
+                threading.Thread(target=self._serve, args=(connection,), name="worker-connection", daemon=True).start()
+
+    def _serve(self, connection: Connection):
+        send_lock = threading.Lock()
+        # Cancellation flags of the streams running for this connection
+        streams: Dict[int, threading.Event] = {}
+
+        def reply(message: Dict[str, Any]):
+            try:
+                with send_lock:
+                    connection.send(message)
+            except (OSError, EOFError, ValueError):
+                for cancelled in list(streams.values()):
+                    cancelled.set()
+
+        try:
+            while True:
+                message = connection.recv()
+                try:
+                    self._dispatch(message, reply, streams)
+                except Exception as e:
+                    reply(_error(message["id"], e))
+        except (EOFError, OSError):
+            pass
+        finally:
+            # The API went away, so nobody is listening to its streams any more
+            for cancelled in list(streams.values()):
+                cancelled.set()
+            connection.close()
+
+    def _dispatch(self, message: Dict[str, Any], reply: Callable[[Dict[str, Any]], None], streams: Dict[int, threading.Event]):
+        request_id, method, args = message["id"], message["method"], message.get("args", [])
+        if method == "ping":
+            reply({"id": request_id, "result": dict(self.config.status(), pid=os.getpid())})
+        elif method == "cancel":
+            cancelled = streams.get(args[0])
+            if cancelled is not None:
+                cancelled.set()
+        elif method == "query":
+            future = self._submit_query(*args)
+            future.add_done_callback(lambda done: reply(self._outcome(request_id, done, self._serializable)))
+        elif method == "stream":
+            self._start_stream(request_id, args, reply, streams)
+        elif method in self._methods:
+            future = self._background.submit(self._methods[method], *args)
+            future.add_done_callback(lambda done: reply(self._outcome(request_id, done)))
+        else:
+            raise ValueError(f"Unknown method {method}")
+
+    def _submit_query(self, question: str, subject: Optional[str]) -> Future:
+        # Same path as an in-process query_async, minus the event loop
+        if self.config.batcher.max_batch_size > 1:
+            return self.config.batcher.submit((question, subject))
+        return self.config.executor.submit(self.config.query, question, subject)
+
+    def _start_stream(self, request_id: int, args: List[Any], reply: Callable[[Dict[str, Any]], None], streams: Dict[int, threading.Event]):
+        from haystack_config import GenerationCancelled
+        question, subject = args
+        cancelled = threading.Event()
+
+        def emit(event: Dict[str, Any]):
+            reply({"id": request_id, "event": event})
+
+        def work():
+            try:
+                self.config.stream_query(question, subject, emit, cancelled)
+            except GenerationCancelled:
+                logger.info("Streaming client disconnected, generation stopped")
+            except Exception as e:
+                logger.error(f"Error streaming answer: {e}")
+                emit({"type": "error", "detail": str(e)})
+            finally:
+                streams.pop(request_id, None)
+                reply({"id": request_id, "result": None})
+
+        streams[request_id] = cancelled
+        try:
+            self.config.executor.submit(work)
+        except Exception:
+            streams.pop(request_id, None)
+            raise
+
+    def _warmup(self) -> Dict[str, Any]:
+        self.config.ensure_initialized()
+        return self.config.status()
+
+    def _serializable(self, response: Dict[str, Any]) -> Dict[str, Any]:
+        # Plain dicts, so the API process never needs Haystack to unpickle a reply
+        return dict(response, documents=[self.config._document_to_dict(d) for d in response.get("documents", [])])
+
+    @staticmethod
+    def _outcome(request_id: int, future: Future, convert: Optional[Callable] = None) -> Dict[str, Any]:
+        error = future.exception()
+        if error is not None:
+            return _error(request_id, error)
+        result = future.result()
+        return {"id": request_id, "result": convert(result) if convert else result}
+
+
+class _PendingCall:
+    def __init__(self, on_event: Optional[Callable[[Dict[str, Any]], None]] = None):
+        self.future: Future = Future()
+        self.on_event = on_event
+
+
+class _WorkerHandle:
+    """
+    One worker socket. When spawn is set the handle owns the worker process
+    and restarts it with backoff whenever it exits, stops answering pings, or
+    drops the connection; otherwise it only reconnects to a worker started
+    elsewhere.
+    """
+
+    def __init__(self, address: str, authkey: Optional[bytes], spawn: bool):
+        self.address = address
+        self.authkey = authkey
+        self.spawn = spawn
+        self.process: Optional[subprocess.Popen] = None
+        self.connection: Optional[Connection] = None
+        self.status: Dict[str, Any] = {"state": "down", "ready": False}
+        self.restarts = 0
+        self.last_pong = 0.0
+        # Shared by the reader thread and the request threads
+        self.pending: Dict[int, _PendingCall] = {}
+        self._pending_lock = threading.Lock()
+        self._send_lock = threading.Lock()
+        self._closed = False
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def connected(self) -> bool:
+        return self.connection is not None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._supervise, name="inference-supervisor", daemon=True)
+            self._thread.start()
+
+    def _supervise(self):
+        backoff = 0.5
+        while not self._closed:
+            if self.spawn and (self.process is None or self.process.poll() is not None):
+                self._start_process()
+            connection = self._connect(timeout=30.0)
+            if connection is None:
+                self._stop_process()
+                time.sleep(backoff)
+                backoff = min(backoff * 2, 30.0)
+                continue
+            connected_at = time.monotonic()
+            self.connection = connection
+            self.last_pong = time.monotonic()
+            self._read(connection)
+            self.connection = None
+            self.status = {"state": "down", "ready": False}
+            self._fail_pending(InferenceWorkerUnavailable(f"Inference worker at {self.address} went away"))
+            if self._closed:
+                break
+            logger.warning(f"Lost inference worker at {self.address}, restarting")
+            self.restarts += 1
+            self._stop_process()
+            # Back off only when the worker keeps failing soon after it starts
+            backoff = 0.5 if time.monotonic() - connected_at > 60 else min(backoff * 2, 30.0)
+            time.sleep(backoff)
+
+    def _start_process(self):
+        env = dict(os.environ)
+        if self.authkey:
+            env[AUTHKEY_ENV] = self.authkey.decode()
+        self.process = subprocess.Popen(
+            [sys.executable, os.path.abspath(__file__), "--socket", self.address],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            env=env
+        )
+        logger.info(f"Started inference worker {self.process.pid} on {self.address}")
+
+    def _stop_process(self):
+        if not self.spawn or self.process is None or self.process.poll() is not None:
+            return
+        self.process.terminate()
+        try:
+            self.process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+            self.process.wait()
+
+    def _connect(self, timeout: float) -> Optional[Connection]:
+        deadline = time.monotonic() + timeout
+        while not self._closed and time.monotonic() < deadline:
+            if self.spawn and self.process is not None and self.process.poll() is not None:
+                return None
+            try:
+                return Client(self.address, family="AF_UNIX", authkey=self.authkey)
+            except (FileNotFoundError, ConnectionRefusedError):
+                time.sleep(0.1)
+            except Exception as e:
+                logger.error(f"Error connecting to inference worker at {self.address}: {e}")
+                time.sleep(0.5)
+        return None
+
+    def _read(self, connection: Connection):
+        try:
+            while True:
+                message = connection.recv()
+                with self._pending_lock:
+                    call = self.pending.get(message["id"])
+                    if call is not None and "event" not in message:
+                        del self.pending[message["id"]]
+                if call is None:
+                    continue
+                if "event" in message:
+                    call.on_event(message["event"])
+                    continue
+                if "error" in message:
+                    call.future.set_exception(ERRORS.get(message["error"], RuntimeError)(message["detail"]))
+                else:
+                    call.future.set_result(message["result"])
+        except (EOFError, OSError):
+            pass
+        finally:
+            connection.close()
+
+    def _fail_pending(self, error: Exception):
+        with self._pending_lock:
+            pending, self.pending = self.pending, {}
+        for call in pending.values():
+            if not call.future.done():
+                call.future.set_exception(error)
+
+    def send(self, request_id: int, method: str, args: List[Any], call: Optional[_PendingCall]):
+        connection = self.connection
+        if connection is None:
+            raise InferenceWorkerUnavailable(f"Inference worker at {self.address} is not connected")
+        if call is not None:
+            with self._pending_lock:
+                self.pending[request_id] = call
+        try:
+            with self._send_lock:
+                connection.send({"id": request_id, "method": method, "args": args})
+        except (OSError, ValueError) as e:
+            with self._pending_lock:
+                self.pending.pop(request_id, None)
+            raise InferenceWorkerUnavailable(f"Inference worker at {self.address} is not reachable: {e}")
+
+    def restart(self, reason: str):
+        """Drop the connection so the supervisor restarts or reconnects the worker"""
+        logger.warning(f"Inference worker at {self.address} {reason}")
+        if self.spawn and self.process is not None and self.process.poll() is None:
+            self.process.kill()
+        connection = self.connection
+        if connection is not None:
+            connection.close()
+
+    def close(self):
+        self._closed = True
+        connection = self.connection
+        if connection is not None:
+            connection.close()
+        self._stop_process()
+
+    def info(self) -> Dict[str, Any]:
+        with self._pending_lock:
+            pending = len(self.pending)
+        return dict(self.status, address=self.address, connected=self.connected, restarts=self.restarts, pending=pending)
+
+
+class InferenceClient:
+    """
+    API-side stand-in for HaystackConfig that forwards queries, streams and
+    uploads to one or more inference worker processes. Requests go to the
+    connected worker with the fewest in flight, and a background thread pings
+    every worker and restarts those that stop answering.
+    """
+
+    def __init__(
+        self,
+        addresses: List[str],
+        spawn: bool = True,
+        authkey: Optional[bytes] = None,
+        timeout: float = 60.0,
+        health_interval: float = 5.0,
+        health_timeout: float = 30.0
+    ):
+        if not authkey:
+            if not spawn:
+                raise ValueError(f"{AUTHKEY_ENV} must be set when the inference workers are started separately")
+            # A fresh key, handed to the workers this client starts
+            authkey = os.urandom(16).hex().encode()
+        self.timeout = timeout
+        self.health_interval = health_interval
+        self.health_timeout = health_timeout
+        self.workers = [_WorkerHandle(address, authkey, spawn) for address in addresses]
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._started = False
+        self._closed = False
+
+    def _ensure_started(self):
+        with self._lock:
+            if self._started or self._closed:
+                return
+            self._started = True
+        for worker in self.workers:
+            worker.start()
+        threading.Thread(target=self._health_loop, name="inference-health", daemon=True).start()
+
+    def _health_loop(self):
+        while not self._closed:
+            time.sleep(self.health_interval)
+            for worker in self.workers:
+                if not worker.connected:
+                    continue
+                if time.monotonic() - worker.last_pong > self.health_timeout:
+                    worker.restart(f"did not answer a health check for {self.health_timeout:.0f} seconds")
+                    continue
+                try:
+                    self._call(worker, "ping", []).add_done_callback(lambda done, worker=worker: self._on_pong(worker, done))
+                except InferenceWorkerUnavailable:
+                    pass
+
+    @staticmethod
+    def _on_pong(worker: _WorkerHandle, future: Future):
+        if future.exception() is None:
+            worker.status = future.result()
+            worker.last_pong = time.monotonic()
+
+    def _pick(self) -> _WorkerHandle:
+        self._ensure_started()
+        connected = [worker for worker in self.workers if worker.connected]
+        if not connected:
+            raise InferenceWorkerUnavailable("No inference worker is available, try again later")
+        # Ready workers first, then the least busy
+        return min(connected, key=lambda worker: (not worker.status.get("ready"), len(worker.pending)))
+
+    def _call(self, worker: _WorkerHandle, method: str, args: List[Any], on_event=None) -> Future:
+        call = _PendingCall(on_event)
+        worker.send(next(self._ids), method, args, call)
+        return call.future
+
+    def request(self, method: str, *args) -> Future:
+        """Send a request to a worker and return a future for its reply"""
+        return self._call(self._pick(), method, list(args))
+
+    @property
+    def ready(self) -> bool:
+        return any(worker.status.get("ready") for worker in self.workers)
+
+    def status(self) -> Dict[str, Any]:
+        """Return worker states for readiness checks"""
+        self._ensure_started()
+        states = [worker.status.get("state", "down") for worker in self.workers]
+        state = next((s for s in ("ready", "degraded", "loading", "cold") if s in states), "down")
+        return {"state": state, "ready": self.ready, "workers": [worker.info() for worker in self.workers]}
+
+    def stats(self) -> Dict[str, Any]:
+        """Collect statistics from every connected worker"""
+        collected = []
+        for worker in self.workers:
+            try:
+                collected.append(dict(self._call(worker, "stats", []).result(timeout=2), address=worker.address))
+            except Exception as e:
+                collected.append({"address": worker.address, "error": str(e)})
+        return {"inference_workers": collected}
+
+    def start_warmup(self, on_ready: Optional[Callable[[], None]] = None) -> threading.Thread:
+        """Start the workers and load their models in the background, then call on_ready"""
+        def warmup():
+            deadline = time.monotonic() + 60
+            while not any(worker.connected for worker in self.workers):
+                if self._closed or time.monotonic() > deadline:
+                    logger.error("No inference worker came up during warm-up")
+                    return
+                time.sleep(0.1)
+            try:
+                for future in [self._call(worker, "warmup", []) for worker in self.workers if worker.connected]:
+                    future.result()
+                if on_ready:
+                    on_ready()
+            except Exception as e:
+                logger.error(f"Error during warm-up: {e}")
+
+        self._ensure_started()
+        thread = threading.Thread(target=warmup, name="warmup", daemon=True)
+        thread.start()
+        return thread
+
+    def load_sample_content(self):
+        """Load the built-in sample content through one worker; the index is shared"""
+        self.request("load_sample_content").result()
+
+    def process_upload(self, file_path: str, filename: str, subject: str, topic: Optional[str], file_hash: str) -> Dict[str, Any]:
+        """Parse, embed and store an uploaded file on a worker; blocks until it is done"""
+        return self.request("process_upload", file_path, filename, subject, topic, file_hash).result()
+
+    async def query_async(self, question: str, subject: Optional[str] = None) -> Dict[str, Any]:
+        """Answer a question on a worker without blocking the event loop"""
+        future = self.request("query", question, subject)
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(future), timeout=self.timeout)
+        except asyncio.TimeoutError:
+            raise InferenceTimeout(f"Inference did not finish within {self.timeout} seconds")
+
+    def stream_events(self, question: str, subject: Optional[str] = None) -> AsyncIterator[Dict[str, Any]]:
+        """Start a streaming answer on a worker and return its events"""
+        loop = asyncio.get_running_loop()
+        queue: "asyncio.Queue[Optional[Dict[str, Any]]]" = asyncio.Queue()
+        worker = self._pick()
+        request_id = next(self._ids)
+        call = _PendingCall(lambda event: loop.call_soon_threadsafe(queue.put_nowait, event))
+        call.future.add_done_callback(lambda done: loop.call_soon_threadsafe(queue.put_nowait, self._stream_end(done)))
+        worker.send(request_id, "stream", [question, subject], call)
+        return self._drain_events(worker, request_id, call, queue, loop.time() + self.timeout)
+
+    @staticmethod
+    def _stream_end(future: Future) -> Optional[Dict[str, Any]]:
+        # A clean finish closes the stream; a queue-full or lost worker becomes a final error event
+        error = future.exception()
+        return {"type": "error", "detail": str(error), "final": True} if error is not None else None
+
+    async def _drain_events(self, worker: _WorkerHandle, request_id: int, call: _PendingCall, queue, deadline: float) -> AsyncIterator[Dict[str, Any]]:
+        loop = asyncio.get_running_loop()
+        try:
+            while True:
+                try:
+                    event = await asyncio.wait_for(queue.get(), timeout=max(deadline - loop.time(), 0))
+                except asyncio.TimeoutError:
+                    yield {"type": "error", "detail": f"Inference did not finish within {self.timeout} seconds"}
+                    return
+                if event is None:
+                    return
+                if event.pop("final", False):
+                    yield event
+                    return
+                yield event
+        finally:
+            if not call.future.done():
+                # The client went away or timed out, so stop generating on the worker
+                try:
+                    worker.send(next(self._ids), "cancel", [request_id], None)
+                except InferenceWorkerUnavailable:
+                    pass
+
+    def shutdown(self):
+        """Stop the health checks and any worker processes this client started"""
+        self._closed = True
+        for worker in self.workers:
+            worker.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the AI Tutor inference worker")
+    parser.add_argument("--socket", default=os.getenv("EDUCHAT_INFERENCE_SOCKETS", DEFAULT_SOCKET).split(",")[0])
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    authkey = os.getenv(AUTHKEY_ENV)
+    if not authkey:
+        # Without a key anyone who can reach the socket could send pickles to unpickle
+        parser.error(f"{AUTHKEY_ENV} must be set")
+    from haystack_config import haystack_config
+    server = InferenceServer(
+        haystack_config,
+        args.socket,
+        authkey=authkey.encode(),
+        upload_workers=int(os.getenv("EDUCHAT_UPLOAD_WORKERS", "1"))
+    )
+    # Load the models straight away, including after an automatic restart
+    if os.getenv("EDUCHAT_WARMUP", "1") != "0":
+        haystack_config.start_warmup()
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        haystack_config.shutdown()
+
+# Global instance, used by main.py when EDUCHAT_INFERENCE_MODE=worker; nothing starts until first use
+_authkey = os.getenv(AUTHKEY_ENV)
+inference_client = InferenceClient(
+    addresses=os.getenv("EDUCHAT_INFERENCE_SOCKETS", DEFAULT_SOCKET).split(","),
+    spawn=os.getenv("EDUCHAT_INFERENCE_SPAWN", "1") != "0",
+    authkey=_authkey.encode() if _authkey else None,
+    timeout=float(os.getenv("EDUCHAT_INFERENCE_TIMEOUT", "60")),
+    health_interval=float(os.getenv("EDUCHAT_INFERENCE_HEALTH_INTERVAL", "5")),
+    health_timeout=float(os.getenv("EDUCHAT_INFERENCE_HEALTH_TIMEOUT", "30"))
+)
+
+if __name__ == "__main__":
+    main()
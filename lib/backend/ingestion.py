@@ -0,0 +1,277 @@
+#!/usr/bin/env python3
+"""
+Parallel ingestion engine for AI Tutor system
+Parses files on a process pool, streams chunks as they are produced and writes them in batches
+
+Usage:
+    python ingestion.py ./course_packs --subject Physics --workers 4 --recursive
+"""
+
+import argparse
+import multiprocessing
+import os
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass, field
+from typing import Callable, Deque, Dict, Generator, Iterable, List, Optional
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def _parse_file(file_path: str, subject: str, known_hash: Optional[str] = None):
+    """Hash and parse one file in a worker process; documents is None when the file is unchanged"""
+    import dedup
+    from document_processor import document_processor
+    file_hash = dedup.file_hash(file_path)
+    if file_hash == known_hash:
+        return file_hash, None
+    return file_hash, document_processor.process_file(file_path, subject, file_hash)
+
+
+def discover_files(directory_path: str, recursive: bool = False) -> List[str]:
+    """List supported files under a directory in a stable order"""
+    from document_processor import SUPPORTED_EXTENSIONS
+    paths = []
+    if recursive:
+        for root, _, filenames in os.walk(directory_path):
+            paths.extend(os.path.join(root, filename) for filename in filenames)
+    else:
+        paths = [os.path.join(directory_path, filename) for filename in os.listdir(directory_path)]
+    return sorted(
+        path for path in paths
+        if os.path.isfile(path) and os.path.splitext(path)[1].lower() in SUPPORTED_EXTENSIONS
+    )
+
+
+@dataclass
+class IngestionReport:
+    files_total: int = 0
+    files_done: int = 0
+    files_failed: int = 0
+    files_unchanged: int = 0
+    chunks: int = 0
+    chunks_added: int = 0
+    chunks_removed: int = 0
+    started_at: float = field(default_factory=time.monotonic)
+    errors: Dict[str, str] = field(default_factory=dict)
+
+    @property
+    def elapsed(self) -> float:
+        return time.monotonic() - self.started_at
+
+    def as_dict(self) -> Dict:
+        return {
+            "files_total": self.files_total,
+            "files_done": self.files_done,
+            "files_failed": self.files_failed,
+            "files_unchanged": self.files_unchanged,
+            "chunks": self.chunks,
+            "chunks_added": self.chunks_added,
+            "chunks_removed": self.chunks_removed,
+            "elapsed_seconds": round(self.elapsed, 2),
+            "errors": self.errors
+        }
+
+
+class IngestionPipeline:
+    """
+    Parsing runs on a process pool while the caller embeds and writes. At most
+    max_pending_files parse jobs are outstanding, so a slow consumer holds the
+    pool back instead of letting parsed chunks pile up in memory.
+    """
+
+    def __init__(
+        self,
+        workers: Optional[int] = None,
+        max_pending_files: Optional[int] = None,
+        write_batch_size: int = 256,
+        progress_callback: Optional[Callable[[IngestionReport, str], None]] = None
+    ):
+        self.workers = workers or max(1, (os.cpu_count() or 2) - 1)
+        self.max_pending_files = max_pending_files or self.workers * 2
+        self.write_batch_size = write_batch_size
+        self.progress_callback = progress_callback or self._log_progress
+
+    @staticmethod
+    def _log_progress(report: IngestionReport, file_path: str):
+        rate = report.files_done / report.elapsed if report.elapsed > 0 else 0.0
+        processed = report.files_done + report.files_failed + report.files_unchanged
+        logger.info(
+            f"[{processed}/{report.files_total}] {os.path.basename(file_path)} "
+            f"- {report.chunks} chunks, {rate:.1f} files/s"
+        )
+
+    def _new_pool(self) -> ProcessPoolExecutor:
+        # Spawn keeps workers clear of model threads already running in the parent
+        return ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"))
+
+    def iter_chunks(
+        self,
+        file_paths: Iterable[str],
+        subject: str = "General",
+        report: Optional[IngestionReport] = None
+    ) -> Generator:
+        """Yield chunks from every file as soon as each file has been parsed"""
+        for _, _, documents in self.iter_files(file_paths, subject, report):
+            yield from documents
+
+    def iter_files(
+        self,
+        file_paths: Iterable[str],
+        subject: str = "General",
+        report: Optional[IngestionReport] = None,
+        known_hashes: Optional[Dict[str, str]] = None
+    ) -> Generator:
+        """
+        Yield (file_path, file_hash, documents) for each parsed file as soon as it
+        finishes. Files whose hash matches known_hashes are counted as unchanged
+        and never parsed.
+
+        When a worker dies (for example on a malformed PDF) every outstanding
+        future fails, so the culprit is unknown. The files that were in flight
+        are then parsed again one at a time on a new pool; a file that crashes
+        the pool while it runs alone is the one marked failed.
+        """
+        known_hashes = known_hashes or {}
+        queue: Deque[str] = deque(file_paths)
+        # Files in flight when the pool broke, retried alone before anything else is submitted
+        suspects: Deque[str] = deque()
+        isolated: Optional[str] = None
+        report = report or IngestionReport()
+        report.files_total = len(queue)
+        pool = self._new_pool()
+        pending: Dict = {}
+        try:
+            while queue or suspects or pending:
+                if suspects:
+                    if not pending:
+                        isolated = suspects.popleft()
+                        pending[pool.submit(_parse_file, isolated, subject, known_hashes.get(isolated))] = isolated
+                else:
+                    while queue and len(pending) < self.max_pending_files:
+                        file_path = queue.popleft()
+                        pending[pool.submit(_parse_file, file_path, subject, known_hashes.get(file_path))] = file_path
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    file_path = pending.pop(future)
+                    ran_alone = file_path == isolated
+                    isolated = None
+                    try:
+                        file_hash, documents = future.result()
+                    except BrokenProcessPool as e:
+                        pool.shutdown(wait=False, cancel_futures=True)
+                        pool = self._new_pool()
+                        if not ran_alone:
+                            logger.warning(f"A parser process crashed, retrying {len(pending) + 1} files one at a time")
+                            suspects.append(file_path)
+                            suspects.extend(pending.values())
+                            pending.clear()
+                            break
+                        report.files_failed += 1
+                        report.errors[file_path] = f"worker crashed: {e}"
+                        self.progress_callback(report, file_path)
+                        continue
+                    except Exception as e:
+                        report.files_failed += 1
+                        report.errors[file_path] = str(e)
+                        self.progress_callback(report, file_path)
+                        continue
+                    if documents is None:
+                        report.files_unchanged += 1
+                    elif not documents:
+                        report.files_failed += 1
+                        report.errors[file_path] = "no content extracted"
+                    else:
+                        report.files_done += 1
+                        report.chunks += len(documents)
+                    self.progress_callback(report, file_path)
+                    if documents:
+                        yield file_path, file_hash, documents
+        finally:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    def iter_batches(self, file_paths: Iterable[str], subject: str = "General", report: Optional[IngestionReport] = None) -> Generator:
+        """Group streamed chunks into write-sized batches"""
+        batch = []
+        for document in self.iter_chunks(file_paths, subject, report):
+            batch.append(document)
+            if len(batch) >= self.write_batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    def ingest(self, file_paths: Iterable[str], subject: str = "General", config=None) -> IngestionReport:
+        """Parse, embed and write changed files into the document store in batches"""
+        if config is None:
+            from haystack_config import haystack_config as config
+        import dedup
+        file_paths = [os.path.abspath(path) for path in file_paths]
+        sources = {path: dedup.source_key(subject, path) for path in file_paths}
+        # The deduplicator only exists once the components are loaded
+        config.ensure_initialized()
+        known_hashes = {}
+        if config.deduplicator is not None:
+            known_hashes = {path: config.deduplicator.known_hash(source) for path, source in sources.items()}
+
+        report = IngestionReport()
+        batch = []
+        batch_chunks = 0
+        for file_path, file_hash, documents in self.iter_files(file_paths, subject, report, known_hashes):
+            batch.append((sources[file_path], file_hash, documents))
+            batch_chunks += len(documents)
+            # Whole files go into a batch, so each file's old chunks are replaced in one step
+            if batch_chunks >= self.write_batch_size:
+                self._flush(config, batch, report)
+                batch = []
+                batch_chunks = 0
+        if batch:
+            self._flush(config, batch, report)
+        logger.info(
+            f"Ingested {report.files_done} files ({report.chunks_added} new chunks, {report.chunks_removed} removed) "
+            f"in {report.elapsed:.1f}s, {report.files_unchanged} unchanged, {report.files_failed} failed"
+        )
+        return report
+
+    @staticmethod
+    def _flush(config, batch, report: IngestionReport):
+        # One sync embeds every new chunk of the batch in a single call and writes it in one append
+        stats = config.sync_files(batch)
+        report.chunks_added += stats["added"]
+        report.chunks_removed += stats["removed"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk-load course material into the AI tutor document store")
+    parser.add_argument("directory", help="Directory containing PDF, DOCX, PPTX or TXT files")
+    parser.add_argument("--subject", default="General", help="Subject tag for every document")
+    parser.add_argument("--workers", type=int, default=None, help="Parser processes (default: CPU count - 1)")
+    parser.add_argument("--batch-size", type=int, default=256, help="Chunks embedded and written per batch")
+    parser.add_argument("--recursive", action="store_true", help="Include subdirectories")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    file_paths = discover_files(args.directory, recursive=args.recursive)
+    if not file_paths:
+        print(f"No supported files found in {args.directory}")
+        return
+
+    pipeline = IngestionPipeline(workers=args.workers, write_batch_size=args.batch_size)
+    from haystack_config import haystack_config
+    try:
+        report = pipeline.ingest(file_paths, args.subject, haystack_config)
+    finally:
+        haystack_config.shutdown()
+    for file_path, error in report.errors.items():
+        print(f"Failed: {file_path}: {error}")
+    print(
+        f"Done: {report.files_done}/{report.files_total} files ({report.files_unchanged} unchanged), "
+        f"{report.chunks_added} chunks added, {report.chunks_removed} removed in {report.elapsed:.1f}s"
+    )
+
+
+if __name__ == "__main__":
+    main()
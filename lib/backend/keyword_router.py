@@ -0,0 +1,107 @@
+"""
+Keyword router for AI Tutor system
+Maps a question to the best-matching topic in one regex pass over the text
+"""
+
+import re
+from typing import Dict, Iterable, List, Optional, Sequence, Set, Tuple, Union
+import logging
+
+logger = logging.getLogger(__name__)
+
+# A pattern is one keyword, or a tuple of keywords that must all appear
+Pattern = Union[str, Sequence[str]]
+
+
+def _trie_regex(terms: Iterable[str]) -> str:
+    """
+    Build an alternation shaped like a trie, so the regex engine follows one
+    branch per character instead of trying every keyword at every position
+    """
+    trie: Dict[str, dict] = {}
+    for term in terms:
+        node = trie
+        for char in term:
+            node = node.setdefault(char, {})
+        node[""] = {}
+
+    def build(node: Dict[str, dict]) -> str:
+        branches = [re.escape(char) + build(child) for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ""
+        body = branches[0] if len(branches) == 1 else f"(?:{'|'.join(branches)})"
+        # Greedy, so the longest keyword starting at a position wins
+        return f"(?:{body})?" if "" in node else body
+
+    return build(trie)
+
+
+class KeywordRouter:
+    """
+    Routes are (name, patterns) pairs; a route matches when any of its patterns
+    does, and scores the number of distinct keywords in its matching patterns.
+    Keywords match anywhere in the lowercased text, like `"x" in question`. All
+    keywords are compiled into one regex, so routing costs one pass over the
+    question however many routes there are. Ties go to the route listed first.
+    """
+
+    def __init__(self, routes: Iterable[Tuple[str, Iterable[Pattern]]]):
+        self.names: List[str] = []
+        self._patterns: List[List[Tuple[str, ...]]] = []
+        # keyword -> (route index, pattern index) of every pattern using it
+        self._uses: Dict[str, List[Tuple[int, int]]] = {}
+        for name, patterns in routes:
+            index = len(self.names)
+            self.names.append(name)
+            compiled = []
+            for pattern in patterns:
+                terms = (pattern,) if isinstance(pattern, str) else tuple(pattern)
+                terms = tuple(dict.fromkeys(term.lower() for term in terms if term))
+                if not terms:
+                    continue
+                for term in terms:
+                    self._uses.setdefault(term, []).append((index, len(compiled)))
+                compiled.append(terms)
+            self._patterns.append(compiled)
+
+        # The regex reports the longest keyword at each position; shorter keywords that
+        # are prefixes of it also occur there
+        self._prefixes = {
+            term: [term[:end] for end in range(1, len(term) + 1) if term[:end] in self._uses]
+            for term in self._uses
+        }
+        self._regex = re.compile(f"(?=({_trie_regex(self._uses)}))") if self._uses else None
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def keywords_in(self, text: str) -> Set[str]:
+        """Every keyword occurring in text, including overlapping ones"""
+        if self._regex is None:
+            return set()
+        found: Set[str] = set()
+        # The lookahead is zero-width, so every start position is tried
+        for match in self._regex.finditer(text.lower()):
+            found.update(self._prefixes[match.group(1)])
+        return found
+
+    def scores(self, text: str) -> Dict[str, int]:
+        """Score of every matching route"""
+        return {self.names[index]: score for index, score in self._score(self.keywords_in(text)).items()}
+
+    def route(self, text: str) -> Optional[str]:
+        """Name of the best-scoring route, or None if nothing matches"""
+        scored = self._score(self.keywords_in(text))
+        if not scored:
+            return None
+        best = min(scored, key=lambda index: (-scored[index], index))
+        return self.names[best]
+
+    def _score(self, found: Set[str]) -> Dict[int, int]:
+        matched: Dict[int, Set[str]] = {}
+        for term in found:
+            for index, pattern_index in self._uses[term]:
+                terms = self._patterns[index][pattern_index]
+                if all(other in found for other in terms):
+                    matched.setdefault(index, set()).update(terms)
+        return {index: len(terms) for index, terms in matched.items()}
@@ -0,0 +1,175 @@
+"""
+Knowledge base for the simple AI Tutor servers
+Loads subjects, facts and topic responses from a JSON file into lookup tables and reloads them when the file changes
+"""
+
+import json
+import os
+import re
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+import logging
+
+from keyword_router import KeywordRouter
+
+logger = logging.getLogger(__name__)
+
+TOKEN = re.compile(r"\w+")
+STOPWORDS = frozenset(
+    "a an and are as at be by can do does for from how i in is it me of on or so "
+    "the this that to was what when where which who why with you your".split()
+)
+
+
+def tokenize(text: str) -> List[str]:
+    return [token for token in TOKEN.findall(text.lower()) if token not in STOPWORDS]
+
+
+class KnowledgeIndex:
+    """
+    Lookup tables for one version of the knowledge file: subject -> topic -> facts,
+    a keyword router per subject and one for general topics, and a token inverted
+    index per topic. Built once and never modified, so readers need no lock.
+
+    File layout:
+        {"subjects": {"Physics": {"expertise": "High", "topics": {"Mechanics": ["fact", ...]}}},
+         "topics": [{"name": "algebra", "keywords": ["algebra", ["linear", "equation"]], "response": "..."}],
+         "default_response": "... {question} ..."}
+    A subject topic may also be {"keywords": [...], "facts": [...]}; by default it
+    matches on any word of its name. A nested keyword list means all of them must appear.
+    """
+
+    def __init__(self, data: Dict[str, Any]):
+        self.subjects: Dict[str, Dict[str, List[str]]] = {}
+        self.expertise: Dict[str, str] = {}
+        self.subject_routers: Dict[str, KeywordRouter] = {}
+        # (subject, topic) -> token -> indexes of the facts containing it
+        self.postings: Dict[Tuple[str, str], Dict[str, List[int]]] = {}
+        for subject, entry in (data.get("subjects") or {}).items():
+            self.expertise[subject] = entry.get("expertise", "Medium")
+            topics: Dict[str, List[str]] = {}
+            routes = []
+            for topic, value in (entry.get("topics") or {}).items():
+                if isinstance(value, dict):
+                    facts = list(value.get("facts") or [])
+                    keywords = value.get("keywords") or topic.lower().split()
+                else:
+                    facts = list(value)
+                    keywords = topic.lower().split()
+                topics[topic] = facts
+                routes.append((topic, keywords))
+                postings: Dict[str, List[int]] = {}
+                for position, fact in enumerate(facts):
+                    for token in dict.fromkeys(tokenize(fact)):
+                        postings.setdefault(token, []).append(position)
+                self.postings[(subject, topic)] = postings
+            self.subjects[subject] = topics
+            self.subject_routers[subject] = KeywordRouter(routes)
+
+        general = data.get("topics") or []
+        self.topic_router = KeywordRouter((topic["name"], topic["keywords"]) for topic in general)
+        self.responses: Dict[str, str] = {topic["name"]: topic["response"] for topic in general}
+        self.default_response: str = data.get("default_response", "")
+        self.fact_count = sum(len(facts) for topics in self.subjects.values() for facts in topics.values())
+
+    def route_subject(self, subject: str, question: str) -> Optional[str]:
+        """Best-matching topic of a subject, or None"""
+        router = self.subject_routers.get(subject)
+        return router.route(question) if router is not None else None
+
+    def route_topic(self, question: str) -> Optional[str]:
+        """Best-matching general topic, or None"""
+        return self.topic_router.route(question)
+
+    def best_fact(self, subject: str, topic: str, question: str) -> Optional[str]:
+        """The topic's fact sharing the most words with the question, else its first fact"""
+        facts = self.subjects.get(subject, {}).get(topic)
+        if not facts:
+            return None
+        postings = self.postings[(subject, topic)]
+        overlap: Dict[int, int] = {}
+        for token in dict.fromkeys(tokenize(question)):
+            for position in postings.get(token, ()):
+                overlap[position] = overlap.get(position, 0) + 1
+        if not overlap:
+            return facts[0]
+        return facts[min(overlap, key=lambda position: (-overlap[position], position))]
+
+
+class KnowledgeBase:
+    """
+    Serves the current KnowledgeIndex for a JSON file. At most every
+    reload_interval seconds a lookup checks the file's modification time, and
+    a changed file is parsed into a new index that replaces the old one in a
+    single assignment. A file that fails to parse is logged and the previous
+    index stays in use.
+    """
+
+    def __init__(self, path: str, reload_interval: float = 2.0):
+        self.path = path
+        self.reload_interval = reload_interval
+        self.index = KnowledgeIndex({})
+        self.loaded_at: Optional[float] = None
+        self.reloads = 0
+        self._lock = threading.Lock()
+        self._signature: Optional[Tuple[int, int]] = None
+        self._checked_at = time.monotonic()
+        self.reload()
+
+    def current(self) -> KnowledgeIndex:
+        """The latest index, reloading first if the file changed"""
+        if time.monotonic() - self._checked_at >= self.reload_interval:
+            self._check()
+        return self.index
+
+    def _check(self):
+        # Other threads keep using the current index while one thread checks
+        if not self._lock.acquire(blocking=False):
+            return
+        try:
+            self._checked_at = time.monotonic()
+            if self._file_signature() != self._signature:
+                self._load()
+        finally:
+            self._lock.release()
+
+    def _file_signature(self) -> Optional[Tuple[int, int]]:
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def reload(self) -> bool:
+        """Load the file now; returns False and keeps the current index if it cannot be read"""
+        with self._lock:
+            return self._load()
+
+    def _load(self) -> bool:
+        signature = self._file_signature()
+        try:
+            with open(self.path, encoding="utf-8") as handle:
+                index = KnowledgeIndex(json.load(handle))
+        except (OSError, ValueError, KeyError, TypeError, AttributeError) as e:
+            logger.error(f"Error loading knowledge base {self.path}: {e}")
+            return False
+        self.index = index
+        # Recorded only on success, so a half-written file is retried once it changes again
+        self._signature = signature
+        self.loaded_at = time.time()
+        self.reloads += 1
+        logger.info(f"Loaded knowledge base {self.path}: {len(index.subjects)} subjects, {index.fact_count} facts, {len(index.responses)} topics")
+        return True
+
+    def stats(self) -> Dict[str, Any]:
+        """Return knowledge base statistics for monitoring"""
+        index = self.index
+        return {
+            "path": self.path,
+            "subjects": len(index.subjects),
+            "facts": index.fact_count,
+            "topics": len(index.responses),
+            "loaded_at": self.loaded_at,
+            "loads": self.reloads
+        }
@@ -1,13 +1,23 @@
-from fastapi import FastAPI, HTTPException, UploadFile, File, Form
+from fastapi import FastAPI, HTTPException, Request, UploadFile, File, Form
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
-from typing import List, Dict, Any, Optional
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from typing import Dict, Any, AsyncIterator, Optional
 import uvicorn
+import asyncio
 import logging
+import json
+import os
 
-# Import our Haystack components
-from haystack_config import haystack_config
-from document_processor import document_processor
+# Import our Haystack components; inference runs in this process, or in separate
+# worker processes reached over a Unix socket when EDUCHAT_INFERENCE_MODE=worker
+if os.getenv("EDUCHAT_INFERENCE_MODE", "local").lower() == "worker":
+    from inference_worker import inference_client as inference
+else:
+    from haystack_config import haystack_config as inference
+from inference_executor import InferenceQueueFull, InferenceTimeout, InferenceWorkerUnavailable
+from document_processor import SUPPORTED_EXTENSIONS
+from upload_jobs import UploadQueueFull, UploadTooLarge, upload_jobs
+from static_responses import JSON_RESPONSE_CLASS, PrecomputedResponse, json_bytes, json_object_bytes, precompute_all
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -16,7 +26,9 @@ logger = logging.getLogger(__name__)
 app = FastAPI(
     title="EduChat AI Tutor API",
     description="AI-powered tutoring system using Haystack",
-    version="1.0.0"
+    version="1.0.0",
+    # ORJSONResponse when orjson is installed
+    default_response_class=JSON_RESPONSE_CLASS
 )
 
 # Add CORS middleware for Flutter app
@@ -30,14 +42,17 @@ app.add_middleware(
 
 @app.on_event("startup")
 async def startup_event():
-    """Initialize Haystack and load sample content on startup"""
-    try:
-        # Load sample educational content
-        sample_docs = document_processor.create_sample_educational_content()
-        haystack_config.add_documents(sample_docs)
-        logger.info("AI Tutor system initialized with sample content")
-    except Exception as e:
-        logger.error(f"Error during startup: {e}")
+    """Start loading models in the background so the port is bound immediately"""
+    # With warm-up disabled, models load on the first request that needs them
+    if os.getenv("EDUCHAT_WARMUP", "1") != "0":
+        # Sample content is loaded once the components are ready
+        inference.start_warmup(on_ready=inference.load_sample_content)
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Stop the upload and inference workers and persist indexes"""
+    upload_jobs.shutdown()
+    inference.shutdown()
 
 @app.get("/")
 def read_root():
@@ -45,14 +60,35 @@ def read_root():
 
 @app.get("/health")
 def health_check():
-    """Health check endpoint"""
-    return {"status": "healthy", "service": "AI Tutor API"}
+    """Health check endpoint; the process is live even while models are still loading"""
+    return {
+        "status": "healthy",
+        "service": "AI Tutor API",
+        "ready": inference.ready,
+        "components": inference.status(),
+        **inference.stats(),
+        "uploads": upload_jobs.stats()
+    }
+
+@app.get("/health/live")
+def liveness_check():
+    """Liveness probe: answers as soon as the server is up"""
+    return {"status": "alive"}
+
+@app.get("/health/ready")
+def readiness_check():
+    """Readiness probe: 503 until the retriever and generator have been loaded"""
+    status = inference.status()
+    if not status["ready"]:
+        return JSONResponse(status_code=503, content=status)
+    return status
 
 @app.post("/chat")
 async def chat_with_tutor(
     question: str = Form(...),
     subject: Optional[str] = Form(None),
-    tutor_id: Optional[str] = Form(None)
+    tutor_id: Optional[str] = Form(None),
+    stream: bool = Form(False)
 ):
     """
     Chat with an AI tutor using Haystack
@@ -61,8 +97,24 @@ async def chat_with_tutor(
         if not question.strip():
             raise HTTPException(status_code=400, detail="Question cannot be empty")
         
-        # Get response from Haystack
-        response = haystack_config.query(question)
+        if stream:
+            # Stream document references first, then answer tokens, as NDJSON
+            try:
+                events = inference.stream_events(question, subject)
+            except (InferenceQueueFull, InferenceWorkerUnavailable) as e:
+                raise HTTPException(status_code=503, detail=str(e))
+            return StreamingResponse(
+                _ndjson_stream(events, {"type": "start", "question": question, "subject": subject, "tutor_id": tutor_id}),
+                media_type="application/x-ndjson"
+            )
+        
+        # Get response from Haystack on the inference executor
+        try:
+            response = await inference.query_async(question, subject)
+        except (InferenceQueueFull, InferenceWorkerUnavailable) as e:
+            raise HTTPException(status_code=503, detail=str(e))
+        except InferenceTimeout as e:
+            raise HTTPException(status_code=504, detail=str(e))
         
         if "error" in response:
             raise HTTPException(status_code=500, detail=response["error"])
@@ -76,110 +128,171 @@ async def chat_with_tutor(
             "tutor_id": tutor_id
         }
         
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error in chat endpoint: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.post("/upload-document")
+async def _ndjson_stream(events: AsyncIterator[Dict[str, Any]], first: Dict[str, Any]) -> AsyncIterator[str]:
+    """Serialize streaming events as newline-delimited JSON"""
+    yield json.dumps(first) + "\n"
+    async for event in events:
+        yield json.dumps(event, default=str) + "\n"
+
+@app.post("/upload-document", status_code=202)
 async def upload_document(
+    request: Request,
     file: UploadFile = File(...),
     subject: str = Form(...),
     topic: Optional[str] = Form(None)
 ):
     """
-    Upload and process educational documents
+    Upload educational documents; parsing and embedding run as a background job
     """
     try:
-        # Save uploaded file temporarily
-        file_path = f"temp_{file.filename}"
-        with open(file_path, "wb") as buffer:
-            content = await file.read()
-            buffer.write(content)
-        
-        # Process the document
-        documents = document_processor.process_file(file_path, subject)
+        extension = os.path.splitext(file.filename or "")[1].lower()
+        if extension not in SUPPORTED_EXTENSIONS:
+            raise HTTPException(status_code=400, detail=f"Unsupported file type: {extension or 'none'}")
+        declared_size = int(request.headers.get("content-length") or 0)
+        if declared_size > upload_jobs.max_bytes:
+            raise HTTPException(status_code=413, detail=f"Upload exceeds the {upload_jobs.max_bytes // (1 << 20)} MB limit")
         
-        if not documents:
-            raise HTTPException(status_code=400, detail="Failed to process document")
+        # Copy to a unique file in chunks, hashing on the way, without blocking the event loop
+        try:
+            file_path, size, file_hash = await asyncio.to_thread(upload_jobs.save, file.file, extension)
+        except UploadTooLarge as e:
+            raise HTTPException(status_code=413, detail=str(e))
         
-        # Add to Haystack document store
-        haystack_config.add_documents(documents)
-        
-        # Clean up temporary file
-        import os
-        os.remove(file_path)
+        job = upload_jobs.new_job(file.filename, subject, topic, size)
+        try:
+            # Parsing and embedding happen in process_upload, in this process or on an inference worker
+            upload_jobs.submit(job, file_path, inference.process_upload, file.filename, subject, topic, file_hash)
+        except UploadQueueFull as e:
+            os.remove(file_path)
+            raise HTTPException(status_code=503, detail=str(e))
         
         return {
             "success": True,
-            "message": f"Document processed and added successfully",
-            "document_count": len(documents),
+            "message": "Document received and queued for processing",
+            "job_id": job.id,
+            "status": job.status,
+            "status_url": f"/upload-document/{job.id}",
             "subject": subject,
             "topic": topic
         }
         
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error uploading document: {e}")
         raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        await file.close()
+
+@app.get("/upload-document/{job_id}")
+def get_upload_status(job_id: str):
+    """Get the status of a document upload job"""
+    job = upload_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Upload job not found")
+    return job
+
+# Static content, serialized once at startup with an ETag; clients revalidate with If-None-Match
+SUBJECTS = [
+    {"name": "Mathematics", "expertise": "High", "topics": ["Algebra", "Calculus", "Geometry", "Statistics"]},
+    {"name": "Physics", "expertise": "High", "topics": ["Mechanics", "Thermodynamics", "Quantum Physics", "Electromagnetism"]},
+    {"name": "Chemistry", "expertise": "High", "topics": ["Organic Chemistry", "Inorganic Chemistry", "Biochemistry", "Analytical Chemistry"]},
+    {"name": "Biology", "expertise": "Medium", "topics": ["Cell Biology", "Genetics", "Evolutionary Biology", "Ecology"]},
+    {"name": "English Literature", "expertise": "Medium", "topics": ["Literature Analysis", "Essay Writing", "Grammar", "Creative Writing"]},
+    {"name": "History", "expertise": "Medium", "topics": ["World History", "Political Science", "Cultural Studies", "Geography"]}
+]
+
+# This would typically come from a database
+# For now, mock data
+TUTORS = {
+    "1": {
+        "id": "1",
+        "name": "MathGPT",
+        "specialization": "Mathematics",
+        "description": "Expert in algebra, calculus, geometry, and statistics",
+        "expertise_level": "High",
+        "subjects": ["Algebra", "Calculus", "Geometry", "Statistics"],
+        "sample_questions": [
+            "How do I solve quadratic equations?",
+            "What is the derivative of x²?",
+            "Explain the Pythagorean theorem"
+        ]
+    },
+    "2": {
+        "id": "2",
+        "name": "PhysicsAI",
+        "specialization": "Physics",
+        "description": "Specialized in mechanics, thermodynamics, and quantum physics",
+        "expertise_level": "High",
+        "subjects": ["Mechanics", "Thermodynamics", "Quantum Physics", "Electromagnetism"],
+        "sample_questions": [
+            "What is Newton's second law?",
+            "How does entropy work?",
+            "Explain quantum superposition"
+        ]
+    }
+}
+
+# This would use Haystack to generate questions based on the subject/topic
+# For now, sample questions
+SAMPLE_QUESTIONS = {
+    "Mathematics": {
+        "Algebra": [
+            {
+                "question": "Solve for x: 2x + 5 = 13",
+                "options": ["x = 4", "x = 3", "x = 5", "x = 6"],
+                "correct": 0,
+                "explanation": "Subtract 5 from both sides: 2x = 8, then divide by 2: x = 4"
+            }
+        ],
+        "Calculus": [
+            {
+                "question": "What is the derivative of f(x) = x³?",
+                "options": ["3x²", "x²", "3x", "x³"],
+                "correct": 0,
+                "explanation": "Using the power rule: d/dx(x^n) = nx^(n-1), so d/dx(x³) = 3x²"
+            }
+        ]
+    }
+}
+
+subjects_response = PrecomputedResponse({"subjects": SUBJECTS})
+tutor_responses = precompute_all(TUTORS)
+# Quiz responses echo the form fields, so only the question lists are pre-serialized
+quiz_question_bytes = {
+    (subject, topic): json_bytes(questions)
+    for subject, topics in SAMPLE_QUESTIONS.items()
+    for topic, questions in topics.items()
+}
+EMPTY_QUIZ = json_bytes([])
 
 @app.get("/subjects")
-def get_available_subjects():
+def get_available_subjects(request: Request):
     """Get list of available subjects with expertise levels"""
     try:
-        subjects = [
-            {"name": "Mathematics", "expertise": "High", "topics": ["Algebra", "Calculus", "Geometry", "Statistics"]},
-            {"name": "Physics", "expertise": "High", "topics": ["Mechanics", "Thermodynamics", "Quantum Physics", "Electromagnetism"]},
-            {"name": "Chemistry", "expertise": "High", "topics": ["Organic Chemistry", "Inorganic Chemistry", "Biochemistry", "Analytical Chemistry"]},
-            {"name": "Biology", "expertise": "Medium", "topics": ["Cell Biology", "Genetics", "Evolutionary Biology", "Ecology"]},
-            {"name": "English Literature", "expertise": "Medium", "topics": ["Literature Analysis", "Essay Writing", "Grammar", "Creative Writing"]},
-            {"name": "History", "expertise": "Medium", "topics": ["World History", "Political Science", "Cultural Studies", "Geography"]}
-        ]
-        
-        return {"subjects": subjects}
+        return subjects_response.respond(request)
         
     except Exception as e:
         logger.error(f"Error getting subjects: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/tutor/{tutor_id}")
-def get_tutor_info(tutor_id: str):
+def get_tutor_info(tutor_id: str, request: Request):
     """Get information about a specific AI tutor"""
     try:
-        # This would typically come from a database
-        # For now, return mock data
-        tutors = {
-            "1": {
-                "id": "1",
-                "name": "MathGPT",
-                "specialization": "Mathematics",
-                "description": "Expert in algebra, calculus, geometry, and statistics",
-                "expertise_level": "High",
-                "subjects": ["Algebra", "Calculus", "Geometry", "Statistics"],
-                "sample_questions": [
-                    "How do I solve quadratic equations?",
-                    "What is the derivative of x²?",
-                    "Explain the Pythagorean theorem"
-                ]
-            },
-            "2": {
-                "id": "2",
-                "name": "PhysicsAI",
-                "specialization": "Physics",
-                "description": "Specialized in mechanics, thermodynamics, and quantum physics",
-                "expertise_level": "High",
-                "subjects": ["Mechanics", "Thermodynamics", "Quantum Physics", "Electromagnetism"],
-                "sample_questions": [
-                    "What is Newton's second law?",
-                    "How does entropy work?",
-                    "Explain quantum superposition"
-                ]
-            }
-        }
-        
-        if tutor_id not in tutors:
+        if tutor_id not in tutor_responses:
             raise HTTPException(status_code=404, detail="Tutor not found")
         
-        return tutors[tutor_id]
+        return tutor_responses[tutor_id].respond(request)
         
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error getting tutor info: {e}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -194,38 +307,12 @@ async def generate_practice_quiz(
     Generate a practice quiz using Haystack
     """
     try:
-        # This would use Haystack to generate questions based on the subject/topic
-        # For now, return sample questions
-        sample_questions = {
-            "Mathematics": {
-                "Algebra": [
-                    {
-                        "question": "Solve for x: 2x + 5 = 13",
-                        "options": ["x = 4", "x = 3", "x = 5", "x = 6"],
-                        "correct": 0,
-                        "explanation": "Subtract 5 from both sides: 2x = 8, then divide by 2: x = 4"
-                    }
-                ],
-                "Calculus": [
-                    {
-                        "question": "What is the derivative of f(x) = x³?",
-                        "options": ["3x²", "x²", "3x", "x³"],
-                        "correct": 0,
-                        "explanation": "Using the power rule: d/dx(x^n) = nx^(n-1), so d/dx(x³) = 3x²"
-                    }
-                ]
-            }
-        }
-        
-        questions = sample_questions.get(subject, {}).get(topic, [])
-        
-        return {
-            "success": True,
-            "subject": subject,
-            "topic": topic,
-            "difficulty": difficulty,
-            "questions": questions
-        }
+        questions = quiz_question_bytes.get((subject, topic), EMPTY_QUIZ)
+        body = json_object_bytes(
+            {"success": True, "subject": subject, "topic": topic, "difficulty": difficulty},
+            {"questions": questions}
+        )
+        return Response(content=body, media_type="application/json")
         
     except Exception as e:
         logger.error(f"Error generating quiz: {e}")
@@ -4,6 +4,9 @@ from typing import List, Dict, Any, Optional
 import uvicorn
 import logging
 import json
+import os
+
+from knowledge_base import KnowledgeBase
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -24,57 +27,11 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Simple in-memory knowledge base
-KNOWLEDGE_BASE = {
-    "Mathematics": {
-        "Algebra": [
-            "Algebra is a branch of mathematics that deals with symbols and variables.",
-            "Linear equations have the form ax + b = c where a, b, c are constants.",
-            "Quadratic equations have the form ax² + bx + c = 0.",
-            "To solve quadratic equations, use the quadratic formula: x = (-b ± √(b² - 4ac)) / 2a"
-        ],
-        "Calculus": [
-            "Calculus is the study of continuous change and includes differentiation and integration.",
-            "The derivative of x² is 2x.",
-            "The derivative of x³ is 3x².",
-            "Integration is the reverse process of differentiation."
-        ],
-        "Geometry": [
-            "Geometry studies shapes, sizes, and properties of space.",
-            "The area of a circle is πr² where r is the radius.",
-            "The Pythagorean theorem states: a² + b² = c² in a right triangle.",
-            "The sum of angles in a triangle is 180 degrees."
-        ]
-    },
-    "Physics": {
-        "Mechanics": [
-            "Mechanics is the study of motion and forces.",
-            "Newton's First Law: An object at rest stays at rest unless acted upon by a force.",
-            "Newton's Second Law: F = ma (Force equals mass times acceleration).",
-            "Newton's Third Law: For every action, there is an equal and opposite reaction."
-        ],
-        "Thermodynamics": [
-            "Thermodynamics studies heat and energy transfer.",
-            "The First Law: Energy cannot be created or destroyed, only transformed.",
-            "The Second Law: Entropy always increases in isolated systems.",
-            "Temperature is a measure of average kinetic energy of particles."
-        ]
-    },
-    "Chemistry": {
-        "Organic Chemistry": [
-            "Organic chemistry studies carbon-based compounds.",
-            "Hydrocarbons contain only carbon and hydrogen atoms.",
-            "Alkanes have single bonds, alkenes have double bonds, alkynes have triple bonds.",
-            "Functional groups give organic compounds their characteristic properties."
-        ],
-        "Inorganic Chemistry": [
-            "Inorganic chemistry studies non-carbon compounds.",
-            "Acids donate protons (H⁺ ions) in solution.",
-            "Bases accept protons in solution.",
-            "pH measures acidity: pH < 7 is acidic, pH > 7 is basic."
-        ]
-    }
-}
+# Subjects, facts and keyword topics live in a JSON file that is reloaded when it changes
+knowledge_base = KnowledgeBase(
+    os.getenv("EDUCHAT_KNOWLEDGE_BASE", os.path.join(os.path.dirname(os.path.abspath(__file__)), "knowledge", "main_simple.json")),
+    reload_interval=float(os.getenv("EDUCHAT_KNOWLEDGE_RELOAD_INTERVAL", "2"))
+)
 
 @app.on_event("startup")
 async def startup_event():
@@ -88,7 +45,7 @@ def read_root():
 @app.get("/health")
 def health_check():
     """Health check endpoint"""
-    return {"status": "healthy", "service": "Simple AI Tutor API"}
+    return {"status": "healthy", "service": "Simple AI Tutor API", "knowledge_base": knowledge_base.stats()}
 
 @app.post("/chat")
 async def chat_with_tutor(
@@ -122,41 +79,28 @@ async def chat_with_tutor(
 def generate_simple_response(question: str, subject: str = None) -> str:
     """Generate a simple response based on keywords"""
     question_lower = question.lower()
+    # One snapshot per request, so a reload mid-request cannot mix two versions
+    knowledge = knowledge_base.current()
     
     # Check for subject-specific knowledge
-    if subject and subject in KNOWLEDGE_BASE:
-        for topic, facts in KNOWLEDGE_BASE[subject].items():
-            for fact in facts:
-                if any(keyword in question_lower for keyword in topic.lower().split()):
-                    return f"Based on {topic}: {fact}"
+    if subject:
+        topic = knowledge.route_subject(subject, question_lower)
+        fact = knowledge.best_fact(subject, topic, question_lower) if topic is not None else None
+        if fact is not None:
+            return f"Based on {topic}: {fact}"
     
     # General responses based on keywords
-    if "algebra" in question_lower or "equation" in question_lower:
-        return "In algebra, we work with variables and equations. For example, to solve 2x + 5 = 13, subtract 5 from both sides to get 2x = 8, then divide by 2 to get x = 4."
-    
-    elif "calculus" in question_lower or "derivative" in question_lower:
-        return "Calculus involves studying rates of change. The derivative measures how a function changes as its input changes. For example, the derivative of x² is 2x."
-    
-    elif "physics" in question_lower or "force" in question_lower:
-        return "Physics studies the fundamental laws of nature. Newton's laws describe how forces affect motion. Force equals mass times acceleration (F = ma)."
-    
-    elif "chemistry" in question_lower or "molecule" in question_lower:
-        return "Chemistry studies matter and its transformations. Atoms combine to form molecules, and chemical reactions involve breaking and forming bonds."
-    
-    elif "help" in question_lower or "explain" in question_lower:
-        return "I'm here to help! I can explain concepts in Mathematics, Physics, and Chemistry. Try asking about specific topics like algebra, calculus, mechanics, or organic chemistry."
-    
-    else:
-        return "I'm a simple AI tutor focused on Mathematics, Physics, and Chemistry. I can help explain concepts, solve problems, and provide examples. What specific topic would you like to learn about?"
+    topic = knowledge.route_topic(question_lower)
+    return knowledge.responses[topic] if topic is not None else knowledge.default_response
 
 @app.get("/subjects")
 def get_available_subjects():
     """Get list of available subjects"""
     try:
+        knowledge = knowledge_base.current()
         subjects = [
-            {"name": "Mathematics", "expertise": "High", "topics": list(KNOWLEDGE_BASE["Mathematics"].keys())},
-            {"name": "Physics", "expertise": "High", "topics": list(KNOWLEDGE_BASE["Physics"].keys())},
-            {"name": "Chemistry", "expertise": "High", "topics": list(KNOWLEDGE_BASE["Chemistry"].keys())}
+            {"name": subject, "expertise": knowledge.expertise[subject], "topics": list(topics)}
+            for subject, topics in knowledge.subjects.items()
         ]
         
         return {"subjects": subjects}
@@ -215,8 +159,8 @@ async def generate_practice_quiz(
 ):
     """Generate a practice quiz using knowledge base"""
     try:
-        if subject in KNOWLEDGE_BASE and topic in KNOWLEDGE_BASE[subject]:
-            facts = KNOWLEDGE_BASE[subject][topic]
+        facts = knowledge_base.current().subjects.get(subject, {}).get(topic)
+        if facts is not None:
             questions = []
             
             for i, fact in enumerate(facts[:3]):  # Generate up to 3 questions
@@ -0,0 +1,82 @@
+"""
+Metadata filter index for AI Tutor system
+Inverted index from document meta values to store rows, used to narrow retrieval
+"""
+
+from array import array
+from typing import Any, Dict, List, Optional
+import logging
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+INDEXED_FIELDS = ("subject", "topic", "type", "filename")
+
+
+class MetadataIndex:
+    """
+    Maps field -> normalized value -> rows holding that value. Rows are appended
+    in increasing order, so every posting list stays sorted without extra work.
+    """
+
+    def __init__(self, fields=INDEXED_FIELDS):
+        self.fields = tuple(fields)
+        self._postings: Dict[str, Dict[str, array]] = {field: {} for field in self.fields}
+
+    @staticmethod
+    def _normalize(value: Any) -> str:
+        return str(value).strip().lower()
+
+    def add(self, row: int, meta: Dict[str, Any]):
+        """Index the meta of one newly written row"""
+        for field in self.fields:
+            value = meta.get(field)
+            if value is None:
+                continue
+            values = value if isinstance(value, (list, tuple, set)) else [value]
+            for item in values:
+                self._postings[field].setdefault(self._normalize(item), array("q")).append(row)
+
+    def values(self, field: str) -> List[str]:
+        """Return the distinct indexed values of a field"""
+        return sorted(self._postings.get(field, {}))
+
+    def candidates(self, filters: Optional[Dict[str, Any]], metas: List[Dict[str, Any]]) -> Optional[np.ndarray]:
+        """
+        Return the sorted rows matching every filter, or None when filters is empty.
+        Filters use the Haystack form {"field": value}, {"field": [values]} or
+        {"field": {"$eq": value}} / {"$in": [values]}; indexed fields are answered
+        from postings and any other field by scanning the metas.
+        """
+        if not filters:
+            return None
+        result: Optional[np.ndarray] = None
+        for field, condition in filters.items():
+            wanted = self._wanted_values(condition)
+            if field in self._postings:
+                postings = self._postings[field]
+                # Copy out of the arrays so later appends never hit an exported buffer
+                lists = [np.frombuffer(postings[v], dtype=np.int64).copy() for v in wanted if v in postings]
+                rows = np.unique(np.concatenate(lists)) if len(lists) > 1 else (lists[0] if lists else np.empty(0, dtype=np.int64))
+            else:
+                rows = np.array(
+                    [row for row, meta in enumerate(metas) if self._normalize(meta.get(field, "")) in wanted],
+                    dtype=np.int64
+                )
+            result = rows if result is None else np.intersect1d(result, rows, assume_unique=True)
+            if result.size == 0:
+                break
+        return result
+
+    def _wanted_values(self, condition: Any) -> set:
+        if isinstance(condition, dict):
+            if "$eq" in condition:
+                condition = condition["$eq"]
+            elif "$in" in condition:
+                condition = condition["$in"]
+            else:
+                raise ValueError(f"Unsupported filter operator in {condition}")
+        if isinstance(condition, (list, tuple, set)):
+            return {self._normalize(value) for value in condition}
+        return {self._normalize(condition)}
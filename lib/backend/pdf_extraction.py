@@ -0,0 +1,84 @@
+"""
+PDF text extraction for AI Tutor system
+Extracts pages in order, optionally spreading page ranges across a process pool
+"""
+
+import multiprocessing
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Deque, Generator, List, Optional, Tuple
+import logging
+
+logger = logging.getLogger(__name__)
+
+PDF_WORKERS = int(os.getenv("EDUCHAT_PDF_WORKERS", "1"))
+PDF_PARALLEL_MIN_PAGES = int(os.getenv("EDUCHAT_PDF_PARALLEL_MIN_PAGES", "64"))
+
+
+_worker_reader = None
+
+
+def _open_reader(file_path: str):
+    """Pool initializer: parse the PDF structure once per worker, not once per range"""
+    global _worker_reader
+    from PyPDF2 import PdfReader
+    _worker_reader = PdfReader(file_path)
+
+
+def _extract_range(start: int, end: int) -> List[str]:
+    """Extract the text of pages [start, end) in a worker process"""
+    return [_worker_reader.pages[index].extract_text() or "" for index in range(start, end)]
+
+
+def _page_ranges(page_count: int, workers: int) -> List[Tuple[int, int]]:
+    # Several ranges per worker so one slow, image-heavy range does not hold up the rest
+    size = max(4, -(-page_count // (workers * 4)))
+    return [(start, min(start + size, page_count)) for start in range(0, page_count, size)]
+
+
+def iter_pdf_pages(
+    file_path: str,
+    reader=None,
+    workers: Optional[int] = None,
+    min_pages: Optional[int] = None
+) -> Generator[Tuple[int, str], None, None]:
+    """
+    Yield (page number, text) for every page, in order. PDFs with at least
+    min_pages pages are extracted on a pool of workers; smaller ones, or a
+    worker count of 1, stay in this process.
+    """
+    if reader is None:
+        from PyPDF2 import PdfReader
+        reader = PdfReader(file_path)
+    workers = PDF_WORKERS if workers is None else workers
+    min_pages = PDF_PARALLEL_MIN_PAGES if min_pages is None else min_pages
+    page_count = len(reader.pages)
+
+    if workers <= 1 or page_count < min_pages:
+        for number, page in enumerate(reader.pages, start=1):
+            yield number, page.extract_text() or ""
+        return
+
+    ranges = deque(_page_ranges(page_count, workers))
+    # Each worker opens the file itself, so only page numbers and text cross the process boundary
+    pool = ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=_open_reader,
+        initargs=(file_path,)
+    )
+    with pool:
+        pending: Deque = deque()
+        try:
+            while ranges or pending:
+                # Keep a bounded number of ranges in flight so memory does not grow with the page count
+                while ranges and len(pending) < workers * 2:
+                    start, end = ranges.popleft()
+                    pending.append((start, pool.submit(_extract_range, start, end)))
+                start, future = pending.popleft()
+                for offset, text in enumerate(future.result()):
+                    yield start + offset + 1, text
+        finally:
+            for _, future in pending:
+                future.cancel()
@@ -0,0 +1,572 @@
+"""
+Persistent document store for AI Tutor system
+Keeps documents in an append-only log and embeddings in a memory-mapped float32 matrix
+"""
+
+import json
+import os
+import threading
+import time
+from typing import Any, Dict, Generator, List, Optional, Set, Union
+import logging
+
+import numpy as np
+from haystack.schema import Document
+
+from metadata_index import MetadataIndex
+from sparse_index import BM25Index
+from vector_index import ExactVectorIndex
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+DOCUMENTS_FILE = "documents.jsonl"
+EMBEDDINGS_FILE = "embeddings.f32"
+DELETED_FILE = "deleted.jsonl"
+LOCK_FILE = "write.lock"
+
+
+class FileLock:
+    """
+    Exclusive lock shared by every process using the same index directory.
+    Reentrant within a process; the lock file is reopened on each outermost
+    acquire so a forked child never shares its parent's lock.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.RLock()
+        self._depth = 0
+        self._handle = None
+
+    def __enter__(self):
+        self._lock.acquire()
+        try:
+            if self._depth == 0:
+                handle = open(self.path, "a+b")
+                if fcntl is not None:
+                    fcntl.flock(handle.fileno(), fcntl.LOCK_EX)
+                self._handle = handle
+            self._depth += 1
+        except BaseException:
+            self._lock.release()
+            raise
+        return self
+
+    def __exit__(self, *exc_info):
+        self._depth -= 1
+        if self._depth == 0:
+            # Closing the file releases the flock
+            self._handle.close()
+            self._handle = None
+        self._lock.release()
+
+
+class PersistentDocumentStore:
+    """
+    Document store backed by two append-only files in index_dir:
+    documents.jsonl holds one JSON record per document and embeddings.f32 holds
+    the matching rows of a float32 matrix. Embeddings are written before their
+    document record, so a record only exists once its embedding is on disk. Rows
+    left past the last record by a crash mid-write are truncated on the next open
+    and before the next write, so they are never paired with later documents.
+    Deletes append a tombstone to deleted.jsonl; the row stays on disk but is
+    excluded from every lookup.
+
+    Several processes can open the same index_dir: writes are serialized by a
+    lock file, and each process picks up the others' appends at most
+    sync_interval seconds after they land. The embedding matrix is memory-mapped,
+    so its pages are shared by every process through the OS page cache.
+    """
+
+    def __init__(
+        self,
+        index_dir: str,
+        embedding_dim: int = 384,
+        similarity: str = "cosine",
+        vector_index=None,
+        keyword_index: bool = True,
+        sync_interval: float = 1.0
+    ):
+        self.index_dir = index_dir
+        self.embedding_dim = embedding_dim
+        self.similarity = similarity
+        self.vector_index = vector_index or ExactVectorIndex()
+        self.metadata_index = MetadataIndex()
+        self.sparse_index = BM25Index(os.path.join(index_dir, "bm25.pkl")) if keyword_index else None
+        self.index = "document"
+        os.makedirs(index_dir, exist_ok=True)
+        self._documents_path = os.path.join(index_dir, DOCUMENTS_FILE)
+        self._embeddings_path = os.path.join(index_dir, EMBEDDINGS_FILE)
+        self._deleted_path = os.path.join(index_dir, DELETED_FILE)
+        self._lock = threading.RLock()
+        self.write_lock = FileLock(os.path.join(index_dir, LOCK_FILE))
+        self.sync_interval = sync_interval
+        self._synced_at = time.monotonic()
+        # Incremented whenever documents are added or deleted, by this process or another
+        self.version = 0
+        self._ids: List[str] = []
+        self._rows: Dict[str, int] = {}
+        self._metas: List[Dict[str, Any]] = []
+        # Byte offset of each record in the document log, plus the end of the last record
+        self._offsets: List[int] = [0]
+        self._deleted_rows: Set[int] = set()
+        self._deleted_array = np.empty(0, dtype=np.int64)
+        self._deleted_offset = 0
+        self._matrix = np.zeros((0, embedding_dim), dtype=np.float32)
+        self._load()
+
+    def _load(self):
+        """Open the existing index, repairing a partially written tail if needed"""
+        # Holding the write lock keeps the repair from truncating another process's write in progress
+        with self.write_lock, self._lock:
+            open(self._documents_path, "ab").close()
+            open(self._embeddings_path, "ab").close()
+            with open(self._documents_path, "rb") as log:
+                offset = 0
+                for line in log:
+                    if not line.endswith(b"\n"):
+                        break
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        break
+                    self._append_index(record["id"], record.get("meta") or {}, offset + len(line))
+                    offset += len(line)
+
+            row_bytes = self.embedding_dim * 4
+            available_rows = os.path.getsize(self._embeddings_path) // row_bytes
+            if available_rows < len(self._ids):
+                logger.warning(f"Embedding file has {available_rows} rows for {len(self._ids)} documents, dropping the rest")
+                for doc_id in self._ids[available_rows:]:
+                    del self._rows[doc_id]
+                del self._ids[available_rows:]
+                del self._metas[available_rows:]
+                del self._offsets[available_rows + 1:]
+
+            # Rows past the last record belong to a write that never committed; left in place
+            # they would be paired with the next documents written
+            self._truncate(self._documents_path, self._offsets[-1])
+            self._truncate(self._embeddings_path, len(self._ids) * row_bytes)
+            self._remap()
+            for row, meta in enumerate(self._metas):
+                self.metadata_index.add(row, meta)
+            # Catch the vector and keyword indexes up with rows written since they were last saved
+            self.vector_index.add(self._matrix)
+            self._catch_up_sparse_index()
+            self._load_tombstones()
+            logger.info(f"Opened document index at {self.index_dir} with {len(self._ids)} documents")
+
+    def _load_tombstones(self) -> bool:
+        """Apply tombstones appended since the last call; returns True if any row was deleted"""
+        if not os.path.exists(self._deleted_path):
+            return False
+        deleted = []
+        with open(self._deleted_path, "rb") as log:
+            log.seek(self._deleted_offset)
+            for line in log:
+                if not line.endswith(b"\n"):
+                    break
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    break
+                self._deleted_offset += len(line)
+                # A tombstone names the row it deleted, so a later re-add of the same id stays live
+                row = record["row"]
+                if row < len(self._ids) and self._ids[row] == record["id"] and row not in self._deleted_rows:
+                    self._mark_deleted(row)
+                    deleted.append(row)
+        if not deleted:
+            return False
+        self._index_deletions(deleted)
+        return True
+
+    def maybe_refresh(self):
+        """Refresh if sync_interval has passed since the last check"""
+        if time.monotonic() - self._synced_at >= self.sync_interval:
+            self.refresh()
+
+    def refresh(self) -> bool:
+        """Pick up documents and deletions written by other processes; returns True if anything changed"""
+        with self._lock:
+            self._synced_at = time.monotonic()
+            added = self._read_new_records()
+            deleted = self._load_tombstones()
+            if added or deleted:
+                self.version += 1
+            return bool(added or deleted)
+
+    def _read_new_records(self) -> int:
+        """Index complete records appended to the document log past our last offset"""
+        start = self._offsets[-1]
+        if os.path.getsize(self._documents_path) <= start:
+            return 0
+        # Embeddings are written before their records, so every complete record has its row on disk
+        available_rows = os.path.getsize(self._embeddings_path) // (self.embedding_dim * 4)
+        first_row = len(self._ids)
+        with open(self._documents_path, "rb") as log:
+            log.seek(start)
+            offset = start
+            for line in log:
+                if not line.endswith(b"\n") or len(self._ids) >= available_rows:
+                    break
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    break
+                offset += len(line)
+                row = len(self._ids)
+                meta = record.get("meta") or {}
+                self.metadata_index.add(row, meta)
+                if self.sparse_index is not None:
+                    self.sparse_index.add(row, record["content"])
+                self._append_index(record["id"], meta, offset)
+        if len(self._ids) > first_row:
+            self._remap()
+            self.vector_index.add(self._matrix)
+        return len(self._ids) - first_row
+
+    def _mark_deleted(self, row: int):
+        self._deleted_rows.add(row)
+        doc_id = self._ids[row]
+        if self._rows.get(doc_id) == row:
+            del self._rows[doc_id]
+
+    def _index_deletions(self, rows: List[int]):
+        # The vector and keyword indexes skip deleted rows themselves, so unfiltered searches need no candidate list
+        self._deleted_array = np.array(sorted(self._deleted_rows), dtype=np.int64)
+        self.vector_index.mark_deleted(rows)
+        if self.sparse_index is not None:
+            self.sparse_index.mark_deleted(rows)
+
+    def _catch_up_sparse_index(self):
+        if self.sparse_index is None:
+            return
+        if self.sparse_index.count > len(self._ids):
+            logger.warning("BM25 index is ahead of the document store, rebuilding")
+            self.sparse_index.reset()
+        for start in range(self.sparse_index.count, len(self._ids), 10_000):
+            rows = list(range(start, min(start + 10_000, len(self._ids))))
+            for row, doc in zip(rows, self._read_documents(rows)):
+                self.sparse_index.add(row, doc.content)
+
+    @staticmethod
+    def _truncate(path: str, size: int):
+        if os.path.getsize(path) > size:
+            logger.warning(f"Truncating incomplete tail of {path}")
+            with open(path, "r+b") as handle:
+                handle.truncate(size)
+
+    def _append_index(self, doc_id: str, meta: Dict[str, Any], end_offset: int):
+        self._rows[doc_id] = len(self._ids)
+        self._ids.append(doc_id)
+        self._metas.append(meta)
+        self._offsets.append(end_offset)
+
+    def _remap(self):
+        """Map the embedding file read-only; pages are shared through the OS page cache"""
+        rows = len(self._ids)
+        if rows == 0:
+            self._matrix = np.zeros((0, self.embedding_dim), dtype=np.float32)
+        else:
+            self._matrix = np.memmap(self._embeddings_path, dtype=np.float32, mode="r", shape=(rows, self.embedding_dim))
+
+    def _normalize(self, embeddings: np.ndarray) -> np.ndarray:
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        if self.similarity != "cosine":
+            return embeddings
+        norms = np.linalg.norm(embeddings, axis=-1, keepdims=True)
+        return embeddings / np.where(norms > 0, norms, 1.0)
+
+    def has_document(self, doc_id: str) -> bool:
+        """Check whether a document id is already stored"""
+        self.maybe_refresh()
+        return doc_id in self._rows
+
+    def write_documents(
+        self,
+        documents: List[Union[Dict[str, Any], Document]],
+        index: Optional[str] = None,
+        batch_size: int = 10_000,
+        duplicate_documents: Optional[str] = None,
+        headers: Optional[Dict[str, str]] = None
+    ):
+        """Append documents with embeddings; documents whose id is already stored are skipped"""
+        documents = [Document.from_dict(d) if isinstance(d, dict) else d for d in documents]
+        with self.write_lock, self._lock:
+            # Rows are positional, so catch up with other writers before appending
+            self.refresh()
+            seen = set()
+            new_documents = []
+            for doc in documents:
+                if doc.id in self._rows or doc.id in seen:
+                    continue
+                if doc.embedding is None:
+                    raise ValueError(f"Document {doc.id} has no embedding; embed documents before writing them")
+                seen.add(doc.id)
+                new_documents.append(doc)
+            if not new_documents:
+                return
+
+            embeddings = self._normalize(np.stack([np.asarray(d.embedding, dtype=np.float32) for d in new_documents]))
+            if embeddings.shape[1] != self.embedding_dim:
+                raise ValueError(f"Expected embeddings of dimension {self.embedding_dim}, got {embeddings.shape[1]}")
+
+            lines = [
+                (json.dumps({"id": d.id, "content": d.content, "content_type": d.content_type, "meta": d.meta}, default=str) + "\n").encode("utf-8")
+                for d in new_documents
+            ]
+            # Rows are paired with records by position, so drop rows left behind by a writer that
+            # died between the two appends before adding ours
+            committed_rows = len(self._ids) * self.embedding_dim * 4
+            self._truncate(self._embeddings_path, committed_rows)
+            try:
+                # Embeddings first, then the records that commit them
+                with open(self._embeddings_path, "ab") as handle:
+                    handle.write(embeddings.tobytes())
+                    handle.flush()
+                    os.fsync(handle.fileno())
+                with open(self._documents_path, "ab") as handle:
+                    handle.write(b"".join(lines))
+                    handle.flush()
+                    os.fsync(handle.fileno())
+            except BaseException:
+                self._truncate(self._documents_path, self._offsets[-1])
+                self._truncate(self._embeddings_path, committed_rows)
+                raise
+
+            for doc, line in zip(new_documents, lines):
+                self.metadata_index.add(len(self._ids), doc.meta)
+                if self.sparse_index is not None:
+                    self.sparse_index.add(len(self._ids), doc.content)
+                self._append_index(doc.id, doc.meta, self._offsets[-1] + len(line))
+            self._remap()
+            self.vector_index.add(self._matrix)
+            self.version += 1
+
+    def _read_documents(self, rows: List[int], scores: Optional[List[float]] = None, return_embedding: bool = False) -> List[Document]:
+        """Load document records for the given rows from the log"""
+        documents = []
+        with open(self._documents_path, "rb") as log:
+            for i, row in enumerate(rows):
+                log.seek(self._offsets[row])
+                record = json.loads(log.read(self._offsets[row + 1] - self._offsets[row]))
+                documents.append(Document(
+                    content=record["content"],
+                    content_type=record.get("content_type", "text"),
+                    id=record["id"],
+                    meta=record.get("meta") or {},
+                    score=scores[i] if scores is not None else None,
+                    embedding=np.array(self._matrix[row]) if return_embedding else None
+                ))
+        return documents
+
+    def _candidates(self, filters: Optional[Dict[str, Any]]) -> Optional[np.ndarray]:
+        """Live rows matching the filters, or None to search every live row"""
+        candidates = self.metadata_index.candidates(filters, self._metas)
+        if candidates is None or not self._deleted_rows:
+            return candidates
+        return np.setdiff1d(candidates, self._deleted_array, assume_unique=True)
+
+    def delete_documents(
+        self,
+        index: Optional[str] = None,
+        ids: Optional[List[str]] = None,
+        filters: Optional[Dict[str, Any]] = None,
+        headers: Optional[Dict[str, str]] = None
+    ):
+        """Delete documents by id and/or filters; with neither, every document is deleted"""
+        with self.write_lock, self._lock:
+            self.refresh()
+            candidates = self._candidates(filters)
+            if ids is not None:
+                # Ids resolve to live rows only, since deleted ids are dropped from the id map
+                rows = sorted(self._rows[doc_id] for doc_id in set(ids) if doc_id in self._rows)
+                if candidates is not None:
+                    rows = np.intersect1d(rows, candidates).tolist()
+            elif candidates is None:
+                rows = list(range(len(self._ids)))
+            else:
+                rows = candidates.tolist()
+            rows = [row for row in rows if row not in self._deleted_rows]
+            if not rows:
+                return
+            lines = [json.dumps({"id": self._ids[row], "row": row}) + "\n" for row in rows]
+            data = "".join(lines).encode("utf-8")
+            with open(self._deleted_path, "ab") as handle:
+                handle.write(data)
+                handle.flush()
+                os.fsync(handle.fileno())
+            self._deleted_offset += len(data)
+            for row in rows:
+                self._mark_deleted(row)
+            self._index_deletions(rows)
+            self.version += 1
+
+    def get_document_count(self, filters: Optional[Dict[str, Any]] = None, index: Optional[str] = None, **kwargs) -> int:
+        """Return the number of stored documents matching the filters"""
+        self.maybe_refresh()
+        with self._lock:
+            candidates = self._candidates(filters)
+            return len(self._ids) - len(self._deleted_rows) if candidates is None else int(candidates.size)
+
+    def get_embedding_count(self, index: Optional[str] = None, filters: Optional[Dict[str, Any]] = None) -> int:
+        """Return the number of stored embeddings"""
+        return len(self._ids) - len(self._deleted_rows)
+
+    def get_document_by_id(self, id: str, index: Optional[str] = None, headers: Optional[Dict[str, str]] = None) -> Optional[Document]:
+        """Fetch a document by its id"""
+        documents = self.get_documents_by_id([id])
+        return documents[0] if documents else None
+
+    def get_documents_by_id(self, ids: List[str], index: Optional[str] = None, batch_size: int = 10_000, headers: Optional[Dict[str, str]] = None) -> List[Document]:
+        """Fetch documents by id, skipping unknown ids"""
+        self.maybe_refresh()
+        with self._lock:
+            rows = [self._rows[doc_id] for doc_id in ids if doc_id in self._rows]
+            return self._read_documents(rows)
+
+    def get_all_documents_generator(
+        self,
+        index: Optional[str] = None,
+        filters: Optional[Dict[str, Any]] = None,
+        return_embedding: Optional[bool] = None,
+        batch_size: int = 10_000,
+        headers: Optional[Dict[str, str]] = None
+    ) -> Generator[Document, None, None]:
+        """Yield every stored document matching the filters in insertion order"""
+        self.maybe_refresh()
+        with self._lock:
+            candidates = self._candidates(filters)
+            if candidates is None:
+                rows = [row for row in range(len(self._ids)) if row not in self._deleted_rows]
+            else:
+                rows = candidates.tolist()
+        for start in range(0, len(rows), batch_size):
+            with self._lock:
+                batch = self._read_documents(rows[start:start + batch_size], return_embedding=bool(return_embedding))
+            yield from batch
+
+    def get_all_documents(
+        self,
+        index: Optional[str] = None,
+        filters: Optional[Dict[str, Any]] = None,
+        return_embedding: Optional[bool] = None,
+        batch_size: int = 10_000,
+        headers: Optional[Dict[str, str]] = None
+    ) -> List[Document]:
+        """Return every stored document"""
+        return list(self.get_all_documents_generator(index, filters, return_embedding, batch_size, headers))
+
+    def query_by_embedding(
+        self,
+        query_emb: np.ndarray,
+        filters: Optional[Dict[str, Any]] = None,
+        top_k: int = 10,
+        index: Optional[str] = None,
+        return_embedding: Optional[bool] = None,
+        headers: Optional[Dict[str, str]] = None,
+        scale_score: bool = True
+    ) -> List[Document]:
+        """Find the top_k documents most similar to a query embedding"""
+        return self.query_by_embedding_batch(
+            np.asarray(query_emb).reshape(1, -1), filters, top_k, index, return_embedding, headers, scale_score
+        )[0]
+
+    def query_by_embedding_batch(
+        self,
+        query_embs: Union[List[np.ndarray], np.ndarray],
+        filters: Optional[Union[Dict[str, Any], List[Optional[Dict[str, Any]]]]] = None,
+        top_k: int = 10,
+        index: Optional[str] = None,
+        return_embedding: Optional[bool] = None,
+        headers: Optional[Dict[str, str]] = None,
+        scale_score: bool = True
+    ) -> List[List[Document]]:
+        """Find the top_k documents for several query embeddings, narrowing by metadata filters first"""
+        self.maybe_refresh()
+        queries = self._normalize(np.atleast_2d(np.asarray(query_embs, dtype=np.float32)))
+        if isinstance(filters, list):
+            # Per-query filters: group queries that share a filter into one search
+            groups: Dict[str, List[int]] = {}
+            for i, query_filters in enumerate(filters):
+                groups.setdefault(json.dumps(query_filters, sort_keys=True, default=str), []).append(i)
+            results: List[List[Document]] = [[] for _ in range(queries.shape[0])]
+            for positions in groups.values():
+                group_results = self.query_by_embedding_batch(
+                    queries[positions], filters[positions[0]], top_k, index, return_embedding, headers, scale_score
+                )
+                for position, documents in zip(positions, group_results):
+                    results[position] = documents
+            return results
+
+        with self._lock:
+            matrix = self._matrix
+            candidates = self._candidates(filters)
+            if matrix.shape[0] == 0 or (candidates is not None and candidates.size == 0):
+                return [[] for _ in range(queries.shape[0])]
+            all_rows, all_scores = self.vector_index.search(matrix, queries, top_k, candidates=candidates)
+            results = []
+            for rows, scores in zip(all_rows, all_scores):
+                hits = [(int(r), float(s)) for r, s in zip(rows, scores) if r >= 0]
+                row_scores = [self._scale(score, scale_score) for _, score in hits]
+                results.append(self._read_documents([r for r, _ in hits], row_scores, bool(return_embedding)))
+            return results
+
+    def query(
+        self,
+        query: str,
+        filters: Optional[Dict[str, Any]] = None,
+        top_k: int = 10,
+        index: Optional[str] = None,
+        headers: Optional[Dict[str, str]] = None,
+        scale_score: bool = True
+    ) -> List[Document]:
+        """Find the top_k documents for a keyword query with BM25"""
+        return self.query_batch([query], filters, top_k, index, headers, scale_score)[0]
+
+    def query_batch(
+        self,
+        queries: List[str],
+        filters: Optional[Union[Dict[str, Any], List[Optional[Dict[str, Any]]]]] = None,
+        top_k: int = 10,
+        index: Optional[str] = None,
+        headers: Optional[Dict[str, str]] = None,
+        scale_score: bool = True
+    ) -> List[List[Document]]:
+        """Find the top_k documents for several keyword queries with BM25"""
+        if self.sparse_index is None:
+            raise ValueError("This document store was opened without a keyword index")
+        self.maybe_refresh()
+        results = []
+        with self._lock:
+            for i, query in enumerate(queries):
+                query_filters = filters[i] if isinstance(filters, list) else filters
+                candidates = self._candidates(query_filters)
+                if candidates is not None and candidates.size == 0:
+                    results.append([])
+                    continue
+                rows, scores = self.sparse_index.search(query, top_k, candidates)
+                # Same squashing Haystack applies to BM25 scores
+                row_scores = [float(1 / (1 + np.exp(-s / 8))) if scale_score else float(s) for s in scores]
+                results.append(self._read_documents([int(r) for r in rows], row_scores))
+        return results
+
+    def close(self):
+        """Persist the vector and keyword indexes so the next open does not rebuild them"""
+        with self.write_lock, self._lock:
+            self.vector_index.save()
+            if self.sparse_index is not None:
+                self.sparse_index.save()
+
+    def _scale(self, score: float, scale_score: bool) -> float:
+        if not scale_score:
+            return score
+        if self.similarity == "cosine":
+            return (score + 1) / 2
+        return float(1 / (1 + np.exp(-score / 100)))
@@ -0,0 +1,151 @@
+"""
+Cross-encoder reranker for AI Tutor system
+Rescores a wide set of retrieved candidates within a latency budget and keeps the best few
+"""
+
+import copy
+import threading
+import time
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional
+import logging
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class CrossEncoderReranker:
+    """
+    Scores (question, chunk) pairs with a small cross-encoder on CPU, in batches
+    of batch_size pairs across all the questions of a call. Before each batch the
+    remaining budget is compared with the measured cost of a batch: if the next
+    batch would overrun, reranking stops there, and if not even the first batch
+    fits it is skipped. Candidates that were not scored keep their retrieval
+    order behind the scored ones. After probe_after skipped calls in a row the
+    first batch is scored anyway and its timing replaces the estimate, so one
+    slow batch (a cold start, a busy moment) does not turn reranking off for good.
+    """
+
+    def __init__(
+        self,
+        model_name: str = "cross-encoder/ms-marco-MiniLM-L-6-v2",
+        candidates: int = 20,
+        top_k: int = 3,
+        batch_size: int = 16,
+        budget_ms: float = 200.0,
+        max_length: int = 256,
+        probe_after: int = 10,
+        model=None
+    ):
+        self.model_name = model_name
+        self.candidates = candidates
+        self.top_k = top_k
+        self.batch_size = batch_size
+        self.budget_ms = budget_ms
+        self.probe_after = probe_after
+        if model is None:
+            from sentence_transformers import CrossEncoder
+            model = CrossEncoder(model_name, max_length=max_length, device="cpu")
+        self.model = model
+        self._lock = threading.Lock()
+        # Moving average of the seconds one pair takes, learned from the batches run so far
+        self._seconds_per_pair: Optional[float] = None
+        # Calls skipped in a row since a batch was last scored
+        self._skipped_in_row = 0
+        # Milliseconds reranking added to each call, for percentiles
+        self._latencies: Deque[float] = deque(maxlen=1000)
+        self._counters = {"calls": 0, "skipped": 0, "truncated": 0, "pairs_scored": 0, "pairs_total": 0}
+
+    def rerank_batch(self, questions: List[str], document_lists: List[List[Any]], top_k: Optional[int] = None) -> List[List[Any]]:
+        """Rerank each question's candidates and return its top_k documents"""
+        top_k = top_k or self.top_k
+        start = time.perf_counter()
+        deadline = start + self.budget_ms / 1000.0
+        pairs = [
+            (i, position)
+            for i, documents in enumerate(document_lists)
+            for position in range(len(documents))
+        ]
+        scores: List[Dict[int, float]] = [{} for _ in document_lists]
+        scored = 0
+        outcome = "complete"
+        with self._lock:
+            probe = self._skipped_in_row >= self.probe_after
+        while scored < len(pairs):
+            batch = pairs[scored:scored + self.batch_size]
+            overrun = self._seconds_per_pair is not None and time.perf_counter() + self._seconds_per_pair * len(batch) > deadline
+            if overrun and not (probe and not scored):
+                outcome = "truncated" if scored else "skipped"
+                break
+            batch_start = time.perf_counter()
+            values = self.model.predict(
+                [(questions[i], self._text(document_lists[i][position])) for i, position in batch],
+                batch_size=len(batch),
+                show_progress_bar=False
+            )
+            self._observe(time.perf_counter() - batch_start, len(batch), reset=probe and not scored)
+            for (i, position), value in zip(batch, np.asarray(values, dtype=np.float32).reshape(-1)):
+                scores[i][position] = float(value)
+            scored += len(batch)
+
+        results = [self._order(documents, question_scores, top_k) for documents, question_scores in zip(document_lists, scores)]
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        with self._lock:
+            self._latencies.append(elapsed_ms)
+            self._counters["calls"] += 1
+            self._counters["pairs_scored"] += scored
+            self._counters["pairs_total"] += len(pairs)
+            if outcome != "complete":
+                self._counters[outcome] += 1
+            self._skipped_in_row = self._skipped_in_row + 1 if outcome == "skipped" else 0
+            skipped_in_row = self._skipped_in_row
+        if outcome == "skipped":
+            logger.warning(
+                f"Reranking skipped: {self._seconds_per_pair * 1000:.1f} ms per pair does not fit the {self.budget_ms:.0f} ms budget "
+                f"({skipped_in_row} calls in a row, probing again after {self.probe_after})"
+            )
+        elif outcome != "complete":
+            logger.info(f"Reranking {outcome} after {scored} of {len(pairs)} pairs ({elapsed_ms:.0f} ms budget {self.budget_ms:.0f} ms)")
+        return results
+
+    @staticmethod
+    def _text(document) -> str:
+        return document.content if hasattr(document, "content") else str(document)
+
+    @staticmethod
+    def _order(documents: List[Any], scores: Dict[int, float], top_k: int) -> List[Any]:
+        ranked = sorted(scores, key=lambda position: (-scores[position], position))
+        ranked += [position for position in range(len(documents)) if position not in scores]
+        results = []
+        for position in ranked[:top_k]:
+            document = documents[position]
+            if position in scores:
+                # A copy, so cached retrieval results keep their retrieval scores
+                document = copy.copy(document)
+                document.score = scores[position]
+            results.append(document)
+        return results
+
+    def _observe(self, seconds: float, pairs: int, reset: bool = False):
+        per_pair = seconds / max(pairs, 1)
+        with self._lock:
+            if self._seconds_per_pair is None or reset:
+                self._seconds_per_pair = per_pair
+            else:
+                self._seconds_per_pair = 0.8 * self._seconds_per_pair + 0.2 * per_pair
+
+    def stats(self) -> Dict[str, Any]:
+        """Return reranking counters and the latency it adds, for monitoring"""
+        with self._lock:
+            latencies = np.asarray(self._latencies) if self._latencies else None
+            return dict(
+                self._counters,
+                model=self.model_name,
+                budget_ms=self.budget_ms,
+                skipped_in_row=self._skipped_in_row,
+                ms_per_pair=round(self._seconds_per_pair * 1000, 3) if self._seconds_per_pair is not None else None,
+                added_ms_p50=round(float(np.percentile(latencies, 50)), 1) if latencies is not None else None,
+                added_ms_p95=round(float(np.percentile(latencies, 95)), 1) if latencies is not None else None,
+                added_ms_max=round(float(latencies.max()), 1) if latencies is not None else None
+            )
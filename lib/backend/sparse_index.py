@@ -0,0 +1,151 @@
+"""
+BM25 sparse index for AI Tutor system
+Keyword retrieval over stored chunks, with postings kept in compact typed arrays
+"""
+
+import math
+import os
+import pickle
+import re
+from array import array
+from typing import Dict, List, Optional, Tuple
+import logging
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+TOKEN_PATTERN = re.compile(r"\w+")
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase word tokens; short tokens such as "ph" or "ma" are kept on purpose"""
+    return TOKEN_PATTERN.findall(text.lower())
+
+
+class BM25Index:
+    """
+    Incremental BM25 index. Each term has a pair of parallel arrays holding the
+    rows containing it and the term frequency in each row; rows only ever grow,
+    so postings stay sorted and appending a document never rewrites them.
+    """
+
+    def __init__(self, index_path: Optional[str] = None, k1: float = 1.5, b: float = 0.75, save_every: int = 10_000):
+        self.index_path = index_path
+        self.k1 = k1
+        self.b = b
+        self.save_every = save_every
+        self._terms: Dict[str, int] = {}
+        self._posting_rows: List[array] = []
+        self._posting_freqs: List[array] = []
+        self._lengths = array("I")
+        self._total_length = 0
+        self._saved_count = 0
+        # Rows deleted from the store, never returned by a search; not saved, the store marks them on open
+        self._deleted = np.empty(0, dtype=np.int64)
+        if index_path and os.path.exists(index_path):
+            try:
+                self._load()
+            except Exception as e:
+                logger.warning(f"Could not load BM25 index from {index_path}, rebuilding: {e}")
+                self.reset()
+
+    @property
+    def count(self) -> int:
+        return len(self._lengths)
+
+    def reset(self):
+        """Drop every posting"""
+        self._terms = {}
+        self._posting_rows = []
+        self._posting_freqs = []
+        self._lengths = array("I")
+        self._total_length = 0
+        self._saved_count = 0
+
+    def add(self, row: int, text: str):
+        """Index the next row; rows must be added in order"""
+        if row != self.count:
+            raise ValueError(f"BM25 rows must be added in order, expected {self.count} but got {row}")
+        frequencies: Dict[str, int] = {}
+        tokens = tokenize(text)
+        for token in tokens:
+            frequencies[token] = frequencies.get(token, 0) + 1
+        for token, frequency in frequencies.items():
+            term_id = self._terms.get(token)
+            if term_id is None:
+                term_id = self._terms[token] = len(self._posting_rows)
+                self._posting_rows.append(array("q"))
+                self._posting_freqs.append(array("I"))
+            self._posting_rows[term_id].append(row)
+            self._posting_freqs[term_id].append(frequency)
+        self._lengths.append(len(tokens))
+        self._total_length += len(tokens)
+        if self.count - self._saved_count >= self.save_every:
+            self.save()
+
+    def mark_deleted(self, rows):
+        """Exclude rows from every later search"""
+        self._deleted = np.union1d(self._deleted, np.asarray(rows, dtype=np.int64))
+
+    def search(self, query: str, k: int, candidates: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """Return (rows, scores) of the k best rows for the query, best first"""
+        total = self.count
+        if total == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        lengths = np.frombuffer(self._lengths, dtype=np.uint32)
+        average_length = self._total_length / total
+        scores = np.zeros(total, dtype=np.float32)
+        for token in set(tokenize(query)):
+            term_id = self._terms.get(token)
+            if term_id is None:
+                continue
+            rows = np.frombuffer(self._posting_rows[term_id], dtype=np.int64)
+            freqs = np.frombuffer(self._posting_freqs[term_id], dtype=np.uint32).astype(np.float32)
+            idf = math.log(1 + (total - rows.size + 0.5) / (rows.size + 0.5))
+            norm = self.k1 * (1 - self.b + self.b * lengths[rows] / average_length)
+            scores[rows] += idf * freqs * (self.k1 + 1) / (freqs + norm)
+        if candidates is not None:
+            mask = np.zeros(total, dtype=bool)
+            mask[candidates[candidates < total]] = True
+            scores[~mask] = 0.0
+        if self._deleted.size:
+            scores[self._deleted[self._deleted < total]] = 0.0
+        matched = np.flatnonzero(scores)
+        if matched.size == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        k = min(k, matched.size)
+        best = matched[np.argpartition(-scores[matched], k - 1)[:k]]
+        best = best[np.argsort(-scores[best])]
+        return best, scores[best]
+
+    def save(self):
+        """Write the index to disk atomically if it changed"""
+        if not self.index_path or self.count == self._saved_count:
+            return
+        state = {
+            "k1": self.k1,
+            "b": self.b,
+            "terms": self._terms,
+            "rows": self._posting_rows,
+            "freqs": self._posting_freqs,
+            "lengths": self._lengths,
+            "total_length": self._total_length
+        }
+        # Per-process temp file, since every worker sharing the index directory may save
+        temp_path = f"{self.index_path}.{os.getpid()}.tmp"
+        with open(temp_path, "wb") as handle:
+            pickle.dump(state, handle, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temp_path, self.index_path)
+        self._saved_count = self.count
+
+    def _load(self):
+        with open(self.index_path, "rb") as handle:
+            state = pickle.load(handle)
+        self._terms = state["terms"]
+        self._posting_rows = state["rows"]
+        self._posting_freqs = state["freqs"]
+        self._lengths = state["lengths"]
+        self._total_length = state["total_length"]
+        self._saved_count = self.count
+        logger.info(f"Loaded BM25 index with {self.count} documents from {self.index_path}")
@@ -0,0 +1,80 @@
+"""
+Pre-serialized responses for AI Tutor endpoints whose content never changes while the server runs
+Bodies are encoded once with a strong ETag, so repeat requests cost a header comparison
+"""
+
+import hashlib
+import json
+import os
+from typing import Any, Dict, Optional
+import logging
+
+from fastapi import Request
+from fastapi.responses import JSONResponse, Response
+
+logger = logging.getLogger(__name__)
+
+# orjson is optional; it serializes several times faster than the json module
+try:
+    import orjson
+    from fastapi.responses import ORJSONResponse
+except ImportError:
+    orjson = None
+
+USE_ORJSON = orjson is not None and os.getenv("EDUCHAT_ORJSON", "1") != "0"
+# Response class for every endpoint of the API
+JSON_RESPONSE_CLASS = ORJSONResponse if USE_ORJSON else JSONResponse
+STATIC_CACHE_CONTROL = f"public, max-age={int(os.getenv('EDUCHAT_STATIC_MAX_AGE', '300'))}"
+
+
+def json_bytes(content: Any) -> bytes:
+    """Serialize content the way the API's response class would"""
+    if USE_ORJSON:
+        return orjson.dumps(content)
+    return json.dumps(content, ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":")).encode("utf-8")
+
+
+def json_object_bytes(content: Dict[str, Any], serialized: Dict[str, bytes]) -> bytes:
+    """
+    A JSON object from content plus fields whose values are already serialized,
+    so a large constant value is not encoded again on every request
+    """
+    members = [json_bytes(key) + b":" + json_bytes(value) for key, value in content.items()]
+    members += [json_bytes(key) + b":" + value for key, value in serialized.items()]
+    return b"{" + b",".join(members) + b"}"
+
+
+class PrecomputedResponse:
+    """
+    A JSON body serialized once, with a strong ETag derived from its bytes.
+    `respond` answers 304 Not Modified when the client already has this version.
+    """
+
+    def __init__(self, content: Any, cache_control: str = STATIC_CACHE_CONTROL):
+        self.body = json_bytes(content)
+        self.etag = f'"{hashlib.sha256(self.body).hexdigest()[:32]}"'
+        self.headers = {"ETag": self.etag, "Cache-Control": cache_control}
+
+    def matches(self, if_none_match: Optional[str]) -> bool:
+        """Whether an If-None-Match header names this version"""
+        if not if_none_match:
+            return False
+        for tag in if_none_match.split(","):
+            tag = tag.strip()
+            # If-None-Match uses weak comparison, so a W/ prefix is ignored
+            if tag.startswith("W/"):
+                tag = tag[2:]
+            if tag == "*" or tag == self.etag:
+                return True
+        return False
+
+    def respond(self, request: Request) -> Response:
+        """The body, or an empty 304 if the request already names this ETag"""
+        if self.matches(request.headers.get("if-none-match")):
+            return Response(status_code=304, headers=self.headers)
+        return Response(content=self.body, media_type="application/json", headers=self.headers)
+
+
+def precompute_all(contents: Dict[str, Any], cache_control: str = STATIC_CACHE_CONTROL) -> Dict[str, PrecomputedResponse]:
+    """Precompute a response per key"""
+    return {key: PrecomputedResponse(content, cache_control) for key, content in contents.items()}
@@ -0,0 +1,78 @@
+"""
+Streaming text splitter for AI Tutor system
+Splits documents into word-limited chunks one page, slide or paragraph at a time
+"""
+
+import re
+from typing import Generator, Iterable, List, Tuple
+import logging
+
+logger = logging.getLogger(__name__)
+
+SENTENCE_BOUNDARY = re.compile(r"(?<=[.!?])\s+|\n{2,}")
+EMPTY_LINES = re.compile(r"\n{3,}")
+
+
+def clean_text(text: str) -> str:
+    """Strip each line and collapse runs of empty lines, as PreProcessor does"""
+    text = "\n".join(line.strip() for line in text.splitlines())
+    return EMPTY_LINES.sub("\n\n", text).strip()
+
+
+def split_sentences(text: str) -> List[str]:
+    return [sentence.strip() for sentence in SENTENCE_BOUNDARY.split(text) if sentence.strip()]
+
+
+class StreamingSplitter:
+    """
+    Word splitter that respects sentence boundaries, like PreProcessor with
+    split_by="word", but consumes text as a stream of (unit number, text) pairs.
+    Only the chunk being built is held in memory, and each chunk reports the
+    first and last unit it drew text from.
+    """
+
+    def __init__(self, split_length: int = 200, split_overlap: int = 20):
+        self.split_length = split_length
+        self.split_overlap = split_overlap
+
+    def split(self, units: Iterable[Tuple[int, str]]) -> Generator[Tuple[str, int, int], None, None]:
+        """Yield (content, first unit, last unit) for each chunk"""
+        current: List[Tuple[str, int, int]] = []
+        word_count = 0
+        for unit, text in units:
+            for sentence in self._sentences(text):
+                words = len(sentence.split())
+                if current and word_count + words > self.split_length:
+                    yield self._join(current)
+                    current = self._overlap(current)
+                    word_count = sum(count for _, count, _ in current)
+                current.append((sentence, words, unit))
+                word_count += words
+        if current:
+            yield self._join(current)
+
+    def _sentences(self, text: str) -> Generator[str, None, None]:
+        for sentence in split_sentences(clean_text(text)):
+            words = sentence.split()
+            if len(words) <= self.split_length:
+                yield sentence
+                continue
+            # Extracted PDF text often has no punctuation for pages; cap such runs at split_length words
+            for start in range(0, len(words), self.split_length):
+                yield " ".join(words[start:start + self.split_length])
+
+    def _overlap(self, current: List[Tuple[str, int, int]]) -> List[Tuple[str, int, int]]:
+        """Trailing sentences carried into the next chunk, never including its first sentence"""
+        overlap = []
+        count = 0
+        for sentence in reversed(current[1:]):
+            if count >= self.split_overlap or sentence[1] >= self.split_length:
+                break
+            overlap.append(sentence)
+            count += sentence[1]
+        overlap.reverse()
+        return overlap
+
+    @staticmethod
+    def _join(current: List[Tuple[str, int, int]]) -> Tuple[str, int, int]:
+        return " ".join(sentence for sentence, _, _ in current), current[0][2], current[-1][2]
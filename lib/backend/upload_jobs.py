@@ -0,0 +1,221 @@
+"""
+Upload job queue for AI Tutor system
+Streams uploads to disk and runs parsing and embedding on background workers
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass, field
+from typing import Any, BinaryIO, Callable, Dict, Optional, Tuple
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class UploadTooLarge(Exception):
+    """Raised when an upload exceeds the configured size cap"""
+
+
+class UploadQueueFull(Exception):
+    """Raised when too many uploads are waiting to be processed"""
+
+
+def save_upload(
+    source: BinaryIO,
+    directory: str,
+    suffix: str,
+    max_bytes: int,
+    chunk_size: int = 1 << 20
+) -> Tuple[str, int, str]:
+    """
+    Copy an upload to a unique file in directory one chunk at a time, hashing as it
+    goes. Returns (path, size, sha256); the partial file is removed if the cap is hit.
+    """
+    os.makedirs(directory, exist_ok=True)
+    fd, path = tempfile.mkstemp(prefix="upload_", suffix=suffix, dir=directory)
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        with os.fdopen(fd, "wb") as handle:
+            while True:
+                chunk = source.read(chunk_size)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > max_bytes:
+                    raise UploadTooLarge(f"Upload exceeds the {max_bytes // (1 << 20)} MB limit")
+                digest.update(chunk)
+                handle.write(chunk)
+    except BaseException:
+        os.remove(path)
+        raise
+    return path, size, digest.hexdigest()
+
+
+@dataclass
+class UploadJob:
+    id: str
+    filename: str
+    subject: str
+    topic: Optional[str] = None
+    size: int = 0
+    status: str = "queued"
+    created_at: float = field(default_factory=time.time)
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    result: Optional[Dict[str, Any]] = None
+    error: Optional[str] = None
+
+
+class UploadJobQueue:
+    """
+    Runs upload processing on its own small worker pool, separate from the
+    inference executor, so a large document never takes a chat request's slot.
+    Finished jobs are kept for `retention` seconds so clients can poll them.
+    Job snapshots are also written under upload_dir/jobs, so with several API
+    worker processes a status request can land on any of them.
+    """
+
+    def __init__(self, upload_dir: str, max_bytes: int, workers: int = 1, max_pending: int = 32, retention: float = 3600.0):
+        self.upload_dir = upload_dir
+        self.max_bytes = max_bytes
+        self.workers = workers
+        self.max_pending = max_pending
+        self.retention = retention
+        self.jobs_dir = os.path.join(upload_dir, "jobs")
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="upload")
+        self._lock = threading.Lock()
+        self._jobs: Dict[str, UploadJob] = {}
+        # Saved upload of each job, deleted once the job has run
+        self._paths: Dict[str, str] = {}
+        self._pending = 0
+
+    def submit(self, job: UploadJob, path: str, fn: Callable[..., Dict[str, Any]], *args) -> UploadJob:
+        """Queue fn(path, *args) as the work for job, or raise UploadQueueFull"""
+        with self._lock:
+            self._prune()
+            if self._pending >= self.max_pending:
+                raise UploadQueueFull("Too many uploads are being processed, try again later")
+            self._pending += 1
+            self._jobs[job.id] = job
+            self._paths[job.id] = path
+        try:
+            self._persist(job)
+            self._executor.submit(self._run, job, fn, *args)
+        except Exception:
+            with self._lock:
+                self._pending -= 1
+                del self._jobs[job.id]
+                del self._paths[job.id]
+            self._remove(self._job_path(job.id))
+            raise
+        return job
+
+    def save(self, source: BinaryIO, suffix: str) -> Tuple[str, int, str]:
+        """Stream an upload into the upload directory under the size cap"""
+        return save_upload(source, self.upload_dir, suffix, self.max_bytes)
+
+    def new_job(self, filename: str, subject: str, topic: Optional[str] = None, size: int = 0) -> UploadJob:
+        return UploadJob(id=uuid.uuid4().hex, filename=filename, subject=subject, topic=topic, size=size)
+
+    def _run(self, job: UploadJob, fn: Callable[..., Dict[str, Any]], *args):
+        job.status = "running"
+        job.started_at = time.time()
+        self._persist(job)
+        path = self._paths[job.id]
+        try:
+            job.result = fn(path, *args)
+            job.status = "done"
+        except Exception as e:
+            logger.error(f"Upload job {job.id} ({job.filename}) failed: {e}")
+            job.error = str(e)
+            job.status = "failed"
+        finally:
+            self._remove(path)
+            job.finished_at = time.time()
+            self._persist(job)
+            with self._lock:
+                self._pending -= 1
+                del self._paths[job.id]
+
+    def _job_path(self, job_id: str) -> str:
+        return os.path.join(self.jobs_dir, f"{job_id}.json")
+    
+    def _persist(self, job: UploadJob):
+        """Write a job snapshot atomically for other worker processes to read"""
+        try:
+            os.makedirs(self.jobs_dir, exist_ok=True)
+            path = self._job_path(job.id)
+            temp_path = f"{path}.{os.getpid()}.tmp"
+            with open(temp_path, "w", encoding="utf-8") as handle:
+                json.dump(asdict(job), handle, default=str)
+            os.replace(temp_path, path)
+        except OSError as e:
+            logger.error(f"Could not save status of upload job {job.id}: {e}")
+
+    @staticmethod
+    def _remove(path: str):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    def _prune(self):
+        cutoff = time.time() - self.retention
+        expired = [job_id for job_id, job in self._jobs.items() if job.finished_at and job.finished_at < cutoff]
+        for job_id in expired:
+            del self._jobs[job_id]
+        # Snapshots are last written when a job finishes, so an old file belongs to an expired job
+        if os.path.isdir(self.jobs_dir):
+            for entry in os.scandir(self.jobs_dir):
+                if entry.name.endswith(".json") and entry.stat().st_mtime < cutoff:
+                    self._remove(entry.path)
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Return a snapshot of a job, or None if it is unknown or expired"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job:
+                return asdict(job)
+        # Submitted through another worker process
+        if not job_id.isalnum():
+            return None
+        try:
+            with open(self._job_path(job_id), encoding="utf-8") as handle:
+                snapshot = json.load(handle)
+        except (OSError, ValueError):
+            return None
+        if snapshot.get("finished_at") and snapshot["finished_at"] < time.time() - self.retention:
+            return None
+        return snapshot
+
+    def stats(self) -> Dict[str, Any]:
+        """Return queue statistics for monitoring"""
+        with self._lock:
+            counts: Dict[str, int] = {}
+            for job in self._jobs.values():
+                counts[job.status] = counts.get(job.status, 0) + 1
+            return {"workers": self.workers, "pending": self._pending, "max_pending": self.max_pending, "jobs": counts}
+
+    def shutdown(self, wait: bool = False):
+        """Stop the workers and remove upload files of jobs that never started"""
+        self._executor.shutdown(wait=wait, cancel_futures=True)
+        with self._lock:
+            for job_id, path in list(self._paths.items()):
+                if self._jobs[job_id].status == "queued":
+                    self._remove(path)
+
+
+# Global instance
+upload_jobs = UploadJobQueue(
+    upload_dir=os.getenv("EDUCHAT_UPLOAD_DIR", os.path.join(tempfile.gettempdir(), "educhat_uploads")),
+    max_bytes=int(os.getenv("EDUCHAT_UPLOAD_MAX_MB", "256")) * (1 << 20),
+    workers=int(os.getenv("EDUCHAT_UPLOAD_WORKERS", "1")),
+    max_pending=int(os.getenv("EDUCHAT_UPLOAD_QUEUE_SIZE", "32"))
+)
@@ -0,0 +1,238 @@
+"""
+Vector index backends for AI Tutor system
+Exact matrix search for small corpora and HNSW approximate search for large ones
+"""
+
+import os
+from typing import Optional, Tuple
+import logging
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+try:
+    import hnswlib
+except ImportError:
+    hnswlib = None
+
+
+class ExactVectorIndex:
+    """Brute-force inner product search over the store's embedding matrix"""
+
+    name = "exact"
+
+    def __init__(self):
+        self.count = 0
+        # Rows deleted from the store, never returned by a search
+        self.deleted = np.empty(0, dtype=np.int64)
+
+    def add(self, matrix: np.ndarray):
+        """Rows are read straight from the matrix, so adding only tracks the count"""
+        self.count = matrix.shape[0]
+
+    def mark_deleted(self, rows):
+        """Exclude rows from every later search"""
+        self.deleted = np.union1d(self.deleted, np.asarray(rows, dtype=np.int64))
+
+    def search(
+        self,
+        matrix: np.ndarray,
+        queries: np.ndarray,
+        k: int,
+        candidates: Optional[np.ndarray] = None
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """Return (rows, scores) of the top k rows for each query, best first"""
+        if candidates is not None:
+            return candidate_search(matrix, queries, k, candidates)
+        return exact_search(matrix, queries, k, self.deleted)
+
+    def save(self):
+        pass
+
+
+class HnswVectorIndex:
+    """
+    HNSW graph over the embedding rows, persisted next to the document index.
+    Corpora smaller than exact_threshold are still searched exactly, which is
+    both faster and lossless at that size. Deleted rows are marked deleted in
+    the graph, so searches skip them without a candidate list.
+    """
+
+    name = "hnsw"
+
+    def __init__(
+        self,
+        dim: int,
+        index_path: Optional[str] = None,
+        m: int = 16,
+        ef_construction: int = 200,
+        ef_search: int = 64,
+        exact_threshold: int = 20_000,
+        save_every: int = 10_000,
+        filter_oversample: int = 4
+    ):
+        if hnswlib is None:
+            raise ImportError("hnswlib is required for the HNSW vector index")
+        self.dim = dim
+        self.index_path = index_path
+        self.m = m
+        self.ef_construction = ef_construction
+        self.ef_search = ef_search
+        self.exact_threshold = exact_threshold
+        self.save_every = save_every
+        self.filter_oversample = filter_oversample
+        self.count = 0
+        self._saved_count = 0
+        # Rows deleted from the store; rows the graph does not hold yet are marked when they are added
+        self.deleted = np.empty(0, dtype=np.int64)
+        self._index = hnswlib.Index(space="ip", dim=dim)
+        if index_path and os.path.exists(index_path):
+            try:
+                self._index.load_index(index_path, max_elements=0)
+                self.count = self._saved_count = self._index.get_current_count()
+                logger.info(f"Loaded HNSW index with {self.count} vectors from {index_path}")
+            except Exception as e:
+                logger.warning(f"Could not load HNSW index from {index_path}, rebuilding: {e}")
+                self._index = hnswlib.Index(space="ip", dim=dim)
+                self.count = self._saved_count = 0
+        if self.count == 0:
+            self._index.init_index(max_elements=1024, M=m, ef_construction=ef_construction, allow_replace_deleted=False)
+        self._index.set_ef(ef_search)
+
+    def add(self, matrix: np.ndarray):
+        """Insert the matrix rows the graph has not seen yet"""
+        rows = matrix.shape[0]
+        if rows < self.count:
+            # The graph is ahead of the store (for example after a crash repair), so rebuild it
+            logger.warning("HNSW index is ahead of the document store, rebuilding")
+            self._index = hnswlib.Index(space="ip", dim=self.dim)
+            self._index.init_index(max_elements=max(1024, rows), M=self.m, ef_construction=self.ef_construction)
+            self._index.set_ef(self.ef_search)
+            self.count = self._saved_count = 0
+        if rows == self.count:
+            return
+        capacity = self._index.get_max_elements()
+        if rows > capacity:
+            self._index.resize_index(max(rows, capacity * 2))
+        self._index.add_items(np.asarray(matrix[self.count:rows]), np.arange(self.count, rows))
+        self._mark_graph(self.deleted[(self.deleted >= self.count) & (self.deleted < rows)])
+        self.count = rows
+        if self.count - self._saved_count >= self.save_every:
+            self.save()
+
+    def search(
+        self,
+        matrix: np.ndarray,
+        queries: np.ndarray,
+        k: int,
+        candidates: Optional[np.ndarray] = None
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """Return (rows, scores) of the top k rows for each query, best first"""
+        if candidates is not None:
+            # Selective filters are cheapest to score exactly over the candidate rows
+            if candidates.size < self.exact_threshold or candidates.size * self.filter_oversample < self.count:
+                return candidate_search(matrix, queries, k, candidates)
+            return self._filtered_graph_search(matrix, queries, k, candidates)
+        if self.count < self.exact_threshold:
+            return exact_search(matrix, queries, k, self.deleted)
+        return self._graph_search(queries, k)
+    
+    def mark_deleted(self, rows):
+        """Exclude rows from every later search"""
+        rows = np.asarray(rows, dtype=np.int64)
+        self.deleted = np.union1d(self.deleted, rows)
+        self._mark_graph(rows[rows < self.count])
+    
+    def _mark_graph(self, rows: np.ndarray):
+        for row in rows:
+            try:
+                self._index.mark_deleted(int(row))
+            except RuntimeError:
+                # Already marked in the graph loaded from disk
+                pass
+    
+    def _graph_search(self, queries: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        k = min(k, self.count - self.deleted.size)
+        if k <= 0:
+            empty = np.empty((np.atleast_2d(queries).shape[0], 0))
+            return empty.astype(np.int64), empty
+        self._index.set_ef(max(self.ef_search, k))
+        labels, distances = self._index.knn_query(queries, k=k)
+        # hnswlib reports inner product distance as 1 - score
+        return labels.astype(np.int64), 1.0 - distances
+    
+    def _filtered_graph_search(
+        self,
+        matrix: np.ndarray,
+        queries: np.ndarray,
+        k: int,
+        candidates: np.ndarray
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """Oversample the graph and keep candidate rows; fall back to exact search if too few survive"""
+        labels, scores = self._graph_search(queries, k * self.filter_oversample)
+        keep = np.isin(labels, candidates)
+        if (keep.sum(axis=1) < min(k, candidates.size)).any():
+            return candidate_search(matrix, queries, k, candidates)
+        rows = np.stack([row[mask][:k] for row, mask in zip(labels, keep)])
+        row_scores = np.stack([score[mask][:k] for score, mask in zip(scores, keep)])
+        return rows, row_scores
+
+    def save(self):
+        """Write the graph to disk atomically if it changed"""
+        if not self.index_path or self.count == self._saved_count:
+            return
+        # Per-process temp file, since every worker sharing the index directory may save
+        temp_path = f"{self.index_path}.{os.getpid()}.tmp"
+        self._index.save_index(temp_path)
+        os.replace(temp_path, self.index_path)
+        self._saved_count = self.count
+
+
+def exact_search(
+    matrix: np.ndarray,
+    queries: np.ndarray,
+    k: int,
+    deleted: Optional[np.ndarray] = None
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Top k inner product search by matrix product, skipping deleted rows"""
+    queries = np.atleast_2d(np.asarray(queries, dtype=np.float32))
+    deleted = deleted[deleted < matrix.shape[0]] if deleted is not None else np.empty(0, dtype=np.int64)
+    k = min(k, matrix.shape[0] - deleted.size)
+    if k <= 0:
+        empty = np.empty((queries.shape[0], 0))
+        return empty.astype(np.int64), empty
+    scores = queries @ matrix.T
+    # Deleted rows score below every live row, and k never reaches them
+    scores[:, deleted] = -np.inf
+    rows = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    top_scores = np.take_along_axis(scores, rows, axis=1)
+    order = np.argsort(-top_scores, axis=1)
+    return np.take_along_axis(rows, order, axis=1), np.take_along_axis(top_scores, order, axis=1)
+
+
+def candidate_search(
+    matrix: np.ndarray,
+    queries: np.ndarray,
+    k: int,
+    candidates: np.ndarray
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Exact search restricted to the given rows"""
+    if candidates.size == 0:
+        empty = np.empty((np.atleast_2d(queries).shape[0], 0))
+        return empty.astype(np.int64), empty
+    rows, scores = exact_search(matrix[candidates], queries, k)
+    return candidates[rows], scores
+
+
+def create_vector_index(backend: str, dim: int, index_dir: Optional[str] = None, **params):
+    """Create a vector index; "auto" uses HNSW when hnswlib is installed"""
+    backend = (backend or "auto").lower()
+    if backend == "auto":
+        backend = "hnsw" if hnswlib is not None else "exact"
+    if backend == "hnsw":
+        index_path = os.path.join(index_dir, "hnsw.bin") if index_dir else None
+        return HnswVectorIndex(dim, index_path=index_path, **params)
+    if backend != "exact":
+        logger.warning(f"Unknown vector index backend {backend}, using exact search")
+    return ExactVectorIndex()
@@ -103,31 +103,59 @@ class _AITutorChatScreenState extends State<AITutorChatScreen> {
     _messageController.clear();
     _scrollToBottom();
 
-    try {
-      // Send message to AI tutor via Haystack
-      final response = await AIService.chatWithTutor(
-        question: message,
+    // Placeholder that is filled in as tokens arrive
+    final aiMessageId = DateTime.now().millisecondsSinceEpoch.toString();
+    final answer = StringBuffer();
+    List<String>? relatedDocuments;
+    bool hasAiMessage = false;
+
+    void updateAiMessage() {
+      final aiMessage = AITutorMessage(
+        id: aiMessageId,
+        content: answer.toString(),
+        isUser: false,
+        timestamp: DateTime.now(),
         subject: widget.tutor['specialization'],
         tutorId: widget.tutor['id'],
+        relatedDocuments: relatedDocuments,
       );
 
-      if (response['success'] == true) {
-        // Add AI response
-        final aiMessage = AITutorMessage(
-          id: DateTime.now().millisecondsSinceEpoch.toString(),
-          content: _extractAnswerFromResponse(response),
-          isUser: false,
-          timestamp: DateTime.now(),
-          subject: widget.tutor['specialization'],
-          tutorId: widget.tutor['id'],
-          relatedDocuments: _extractDocumentsFromResponse(response),
-        );
-
-        setState(() {
+      setState(() {
+        if (hasAiMessage) {
+          _messages[_messages.length - 1] = aiMessage;
+        } else {
           _messages.add(aiMessage);
-        });
-      } else {
-        _showErrorMessage('Failed to get response from AI tutor');
+          hasAiMessage = true;
+        }
+      });
+      _scrollToBottom();
+    }
+
+    try {
+      // Stream the answer from the AI tutor via Haystack
+      await for (final event in AIService.chatWithTutorStream(
+        question: message,
+        subject: widget.tutor['specialization'],
+        tutorId: widget.tutor['id'],
+      )) {
+        switch (event['type']) {
+          case 'documents':
+            relatedDocuments = _extractDocumentsFromResponse(event);
+            break;
+          case 'token':
+            answer.write(event['text'] ?? '');
+            updateAiMessage();
+            break;
+          case 'done':
+            if (answer.isEmpty) {
+              answer.write(_extractAnswerFromResponse(event));
+            }
+            updateAiMessage();
+            break;
+          case 'error':
+            _showErrorMessage('Failed to get response from AI tutor');
+            break;
+        }
       }
     } catch (e) {
       _showErrorMessage('Error: ${e.toString()}');
@@ -34,6 +34,8 @@ class _ChatDetailScreenState extends State<ChatDetailScreen> {
   PointsService? _pointsService;
   // CallService? _callService; // Temporarily disabled due to flutter_webrtc issues
   bool _isLoadingAiResponse = false;
+  // Server-side AI Tutor conversation, so each turn only sends the new message
+  String? _aiConversationId;
   final String _currentUserId = 'u_current'; // Replace with actual user ID
   bool _showAttachmentOptions = false;
   bool _showEmojiPicker = false;
@@ -133,19 +135,26 @@ class _ChatDetailScreenState extends State<ChatDetailScreen> {
       });
 
       try {
-        // Convert ChatMessage objects to simple maps for the API
-        final messageList = _messages.map((msg) => {
-          'text': msg.text,
-          'isUser': msg.isUser,
-          'timestamp': msg.timestamp.toIso8601String(),
-          'senderName': msg.senderName,
-        }).toList();
+        // The first request seeds the server's conversation with the history so far
+        final messageList = _aiConversationId == null
+            ? _messages.map((msg) => {
+                'text': msg.text,
+                'isUser': msg.isUser,
+                'timestamp': msg.timestamp.toIso8601String(),
+                'senderName': msg.senderName,
+              }).toList()
+            : null;
         
-        final aiResponse = await AIService.getAiResponse(messageList, userMessage);
+        final aiResult = await AIService.getAiResponse(
+          userMessage,
+          conversationId: _aiConversationId,
+          messages: messageList,
+        );
+        _aiConversationId = aiResult['conversation_id'] as String?;
         
         final aiMessage = ChatMessage(
           id: const Uuid().v4(),
-          text: aiResponse,
+          text: aiResult['response'] as String,
           isUser: false,
           timestamp: DateTime.now(),
           senderName: 'AI Tutor',
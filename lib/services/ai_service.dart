@@ -34,6 +34,56 @@ class AIService {
     }
   }
 
+  // Chat with AI tutor, streaming document references and answer tokens
+  static Stream<Map<String, dynamic>> chatWithTutorStream({
+    required String question,
+    String? subject,
+    String? tutorId,
+  }) async* {
+    final client = http.Client();
+    try {
+      final request = http.Request('POST', Uri.parse('$baseUrl/chat'));
+      request.bodyFields = {
+        'question': question,
+        if (subject != null) 'subject': subject,
+        if (tutorId != null) 'tutor_id': tutorId,
+        'stream': 'true',
+      };
+
+      final response = await client.send(request);
+      if (response.statusCode != 200) {
+        throw Exception('Failed to chat with tutor: ${response.statusCode}');
+      }
+
+      // Servers that do not stream answer with a single JSON object; replay it as events
+      final contentType = response.headers['content-type'] ?? '';
+      if (!contentType.startsWith('application/x-ndjson')) {
+        final data = json.decode(await response.stream.bytesToString()) as Map<String, dynamic>;
+        final answer = data['answer'];
+        if (data['documents'] != null) {
+          yield {'type': 'documents', 'documents': data['documents']};
+        }
+        yield {
+          'type': 'done',
+          'answer': answer is List ? answer : [if (answer != null) answer],
+        };
+        return;
+      }
+
+      // The backend sends one JSON event per line
+      await for (final line in response.stream
+          .transform(utf8.decoder)
+          .transform(const LineSplitter())) {
+        if (line.trim().isEmpty) continue;
+        yield json.decode(line) as Map<String, dynamic>;
+      }
+    } catch (e) {
+      throw Exception('Error connecting to AI service: $e');
+    } finally {
+      client.close();
+    }
+  }
+
   // Upload educational document
   static Future<Map<String, dynamic>> uploadDocument({
     required File file,
@@ -58,7 +108,8 @@ class AIService {
       final response = await request.send();
       final responseData = await response.stream.bytesToString();
 
-      if (response.statusCode == 200) {
+      // The server queues processing and answers 202 with a job id
+      if (response.statusCode == 200 || response.statusCode == 202) {
         return json.decode(responseData);
       } else {
         throw Exception('Failed to upload document: ${response.statusCode}');
@@ -68,6 +119,23 @@ class AIService {
     }
   }
 
+  // Poll the processing status of an uploaded document
+  static Future<Map<String, dynamic>> getUploadStatus(String jobId) async {
+    try {
+      final response = await http.get(
+        Uri.parse('$baseUrl/upload-document/$jobId'),
+      );
+
+      if (response.statusCode == 200) {
+        return json.decode(response.body);
+      } else {
+        throw Exception('Failed to get upload status: ${response.statusCode}');
+      }
+    } catch (e) {
+      throw Exception('Error getting upload status: $e');
+    }
+  }
+
   // Get available subjects
   static Future<List<Map<String, dynamic>>> getAvailableSubjects() async {
     try {
@@ -116,8 +184,14 @@ class AIService {
     }
   }
 
-  // Get AI response for chat
-  static Future<String> getAiResponse(List<dynamic> messages, String userMessage) async {
+  // Get AI response for chat. The server keeps the conversation: pass the
+  // conversation_id it returned and only the new message; the full history is
+  // only needed to seed the first request of a conversation.
+  static Future<Map<String, dynamic>> getAiResponse(
+    String userMessage, {
+    String? conversationId,
+    List<dynamic>? messages,
+  }) async {
     try {
       final response = await http.post(
         Uri.parse('$baseUrl/chat-json'),
@@ -125,14 +199,18 @@ class AIService {
           'Content-Type': 'application/json',
         },
         body: json.encode({
-          'messages': messages,
           'user_message': userMessage,
+          if (conversationId != null) 'conversation_id': conversationId,
+          if (conversationId == null && messages != null) 'messages': messages,
         }),
       );
 
       if (response.statusCode == 200) {
         final data = json.decode(response.body);
-        return data['response'] ?? 'Sorry, I could not generate a response.';
+        return {
+          'response': data['response'] ?? 'Sorry, I could not generate a response.',
+          'conversation_id': data['conversation_id'] ?? conversationId,
+        };
       } else {
         throw Exception('Failed to get AI response: ${response.statusCode}');
       }